@@ -0,0 +1,347 @@
+"""
+本地镜像源模拟器
+
+在本机启动 HTTP 服务，模拟 MIRRORS 中的一个镜像源：
+通过 git http-backend 提供 smart-HTTP 拉取，通过 git archive 提供仓库压缩包，
+通过 /repos/<owner>/<repo> 与 /repos/<owner>/<repo>/compare/<base>...<head> 模拟 GitHub API 的仓库查询与提交比较，
+通过 /raw/<owner>/<repo>/<ref>/<path> 模拟 raw.githubusercontent.com，
+并可设置响应延迟、带宽上限、失败率以及是否支持 Range 请求。
+"""
+import os
+import re
+import time
+import random
+import shutil
+import json
+import hashlib
+from urllib.parse import unquote
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ARCHIVE_RE = re.compile(r'/(?P<owner>[^/]+)/(?P<repo>[^/]+)/archive/refs/heads/(?P<branch>.+)\.(?P<format>zip|tar\.gz)$')
+API_REPO_RE = re.compile(r'/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)$')
+API_COMPARE_RE = re.compile(r'/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/compare/(?P<base>[^/.]+)\.\.\.(?P<head>.+)$')
+API_TREE_RE = re.compile(r'/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/git/trees/(?P<sha>[0-9a-f]+)$')
+RAW_RE = re.compile(r'/raw/(?P<owner>[^/]+)/(?P<repo>[^/]+)/(?P<ref>[^/]+)/(?P<path>.+)$')
+# git diff --raw 的状态到 compare API 文件状态的映射
+DIFF_STATUS = {'A': 'added', 'D': 'removed', 'M': 'modified', 'T': 'changed', 'R': 'renamed', 'C': 'copied'}
+WRITE_CHUNK = 16 * 1024
+
+
+class MirrorSimulator:
+    """模拟一个镜像源的本地 HTTP 服务"""
+
+    def __init__(self, root, latency=0.0, bandwidth=None, failure_rate=0.0, ranges=True, seed=None):
+        """
+        初始化模拟器
+
+        Args:
+            root (str): 裸仓库目录，仓库位于 <root>/<owner>/<repo>.git
+            latency (float): 每个请求返回响应头前的延迟（秒）
+            bandwidth (float): 响应体带宽上限（字节/秒），None 表示不限速
+            failure_rate (float): 请求返回 503 的概率
+            ranges (bool): 压缩包下载是否支持 Range 请求
+            seed (int): 失败率使用的随机数种子
+        """
+        self.root = root
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.ranges = ranges
+        self.random = random.Random(seed)
+        self.archives = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    @property
+    def url(self):
+        """模拟器的基础URL，对应 MIRRORS 中的值"""
+        return f'http://127.0.0.1:{self.port}'
+
+    def start(self):
+        """在后台线程中启动服务，停止后再次调用时在原端口上重新启动"""
+        if self.server is None:
+            self.server = ThreadingHTTPServer(('127.0.0.1', self.port), self._handler())
+            self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        """停止服务，模拟镜像源离线"""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def should_fail(self):
+        """按失败率决定本次请求是否失败"""
+        with self.lock:
+            self.requests += 1
+            return self.random.random() < self.failure_rate
+
+    def archive(self, owner, repo, branch, archive_format):
+        """生成并缓存仓库压缩包"""
+        key = (owner, repo, branch, archive_format)
+        with self.lock:
+            if key in self.archives:
+                return self.archives[key]
+        result = subprocess.run(['git', '-C', os.path.join(self.root, owner, repo + '.git'), 'archive',
+                                 '--format', archive_format, '--prefix', f'{repo}-{branch}/', branch],
+                                capture_output=True, check=False)
+        data = result.stdout if result.returncode == 0 else None
+        with self.lock:
+            self.archives[key] = data
+        return data
+
+    def _handler(self):
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def handle(self):
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端读取到需要的部分后提前断开, 如测速与 Range 探测
+                    pass
+
+            def do_GET(self):
+                self.handle_request()
+
+            def do_POST(self):
+                self.handle_request()
+
+            def handle_request(self):
+                if simulator.server is None:
+                    # 已停止: 关闭停止前建立的长连接, 不返回任何响应
+                    self.close_connection = True
+                    return
+                body = self.read_body() if self.command == 'POST' else b''
+                time.sleep(simulator.latency)
+                if simulator.should_fail():
+                    self.send_body(503, b'simulated failure', {'Content-Type': 'text/plain'})
+                    return
+                path = self.path.split('?')[0]
+                if match := ARCHIVE_RE.match(path):
+                    self.send_archive(match)
+                elif match := API_REPO_RE.match(path):
+                    self.send_repo(match)
+                elif match := API_COMPARE_RE.match(path):
+                    self.send_compare(match)
+                elif match := API_TREE_RE.match(path):
+                    self.send_tree(match)
+                elif match := RAW_RE.match(path):
+                    self.send_raw(match)
+                else:
+                    self.run_backend(body)
+
+            def read_body(self):
+                if self.headers.get('Transfer-Encoding', '').lower() != 'chunked':
+                    return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                body = b''
+                while (size := int(self.rfile.readline().split(b';')[0], 16)) != 0:
+                    body += self.rfile.read(size)
+                    self.rfile.readline()
+                while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                    pass
+                return body
+
+            def send_archive(self, match):
+                data = simulator.archive(match['owner'], match['repo'], match['branch'], match['format'])
+                if data is None:
+                    self.send_body(404, b'not found', {'Content-Type': 'text/plain'})
+                    return
+                headers = {'Content-Type': 'application/octet-stream',
+                           'ETag': '"' + hashlib.sha1(data).hexdigest() + '"'}
+                if not simulator.ranges:
+                    self.send_body(200, data, headers)
+                    return
+                headers['Accept-Ranges'] = 'bytes'
+                range_match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+                if range_match and self.headers.get('If-Range', headers['ETag']) == headers['ETag']:
+                    start = int(range_match[1])
+                    end = min(int(range_match[2]) if range_match[2] else len(data) - 1, len(data) - 1)
+                    headers['Content-Range'] = f'bytes {start}-{end}/{len(data)}'
+                    self.send_body(206, data[start:end + 1], headers)
+                else:
+                    self.send_body(200, data, headers)
+
+            def send_repo(self, match):
+                slug = f"{match['owner']}/{match['repo']}"
+                if not os.path.isdir(os.path.join(simulator.root, slug + '.git')):
+                    self.send_body(404, b'{"message": "Not Found"}', {'Content-Type': 'application/json'})
+                    return
+                data = json.dumps({'full_name': slug, 'id': int(hashlib.sha1(slug.encode()).hexdigest()[:8], 16)})
+                self.send_body(200, data.encode(), {'Content-Type': 'application/json'})
+
+            def send_compare(self, match):
+                git = ['git', '-C', os.path.join(simulator.root, match['owner'], match['repo'] + '.git')]
+
+                def run(*args):
+                    return subprocess.run(git + list(args), capture_output=True, text=True, check=False)
+
+                base = run('rev-parse', '--verify', match['base'] + '^{commit}').stdout.strip()
+                head = run('rev-parse', '--verify', unquote(match['head']) + '^{commit}').stdout.strip()
+                if not base or not head:
+                    self.send_body(404, b'{"message": "Not Found"}', {'Content-Type': 'application/json'})
+                    return
+                if base == head:
+                    status = 'identical'
+                elif run('merge-base', '--is-ancestor', base, head).returncode == 0:
+                    status = 'ahead'
+                elif run('merge-base', '--is-ancestor', head, base).returncode == 0:
+                    status = 'behind'
+                else:
+                    status = 'diverged'
+                commits = [{'sha': sha, 'commit': {'committer': {'date': date}}} for sha, date in
+                           (line.split() for line in run('log', '--reverse', '--format=%H %cI', f'{base}..{head}')
+                            .stdout.splitlines())]
+                merge_base = run('merge-base', base, head).stdout.strip()
+                fields = run('diff', '--raw', '-z', '-M', '--no-abbrev', merge_base, head).stdout.split('\0')
+                files = []
+                while len(fields) > 1:
+                    _, _, old_sha, new_sha, letter = fields.pop(0).split()
+                    change = {'filename': fields.pop(0), 'status': DIFF_STATUS.get(letter[0], 'modified'),
+                              'sha': old_sha if letter[0] == 'D' else new_sha}
+                    if letter[0] in 'RC':
+                        change['previous_filename'], change['filename'] = change['filename'], fields.pop(0)
+                    files.append(change)
+                data = json.dumps({'status': status, 'total_commits': len(commits), 'commits': commits, 'files': files})
+                self.send_body(200, data.encode(), {'Content-Type': 'application/json'})
+
+            def send_tree(self, match):
+                result = subprocess.run(['git', '-C', os.path.join(simulator.root, match['owner'], match['repo'] + '.git'),
+                                         'ls-tree', '-z', match['sha']], capture_output=True, text=True, check=False)
+                if result.returncode != 0:
+                    self.send_body(404, b'{"message": "Not Found"}', {'Content-Type': 'application/json'})
+                    return
+                tree = []
+                for line in filter(None, result.stdout.split('\0')):
+                    info, _, name = line.partition('\t')
+                    mode, kind, sha = info.split()
+                    tree.append({'path': name, 'mode': mode, 'type': kind, 'sha': sha})
+                data = json.dumps({'sha': match['sha'], 'tree': tree, 'truncated': False})
+                self.send_body(200, data.encode(), {'Content-Type': 'application/json'})
+
+            def send_raw(self, match):
+                result = subprocess.run(['git', '-C', os.path.join(simulator.root, match['owner'], match['repo'] + '.git'),
+                                         'cat-file', 'blob', f"{match['ref']}:{unquote(match['path'])}"],
+                                        capture_output=True, check=False)
+                if result.returncode != 0:
+                    self.send_body(404, b'404: Not Found', {'Content-Type': 'text/plain'})
+                    return
+                self.send_body(200, result.stdout, {'Content-Type': 'text/plain'})
+
+            def run_backend(self, body):
+                path, _, query = self.path.partition('?')
+                env = dict(os.environ, GIT_PROJECT_ROOT=simulator.root, GIT_HTTP_EXPORT_ALL='1', PATH_INFO=path,
+                           QUERY_STRING=query, REQUEST_METHOD=self.command, REMOTE_ADDR='127.0.0.1',
+                           CONTENT_TYPE=self.headers.get('Content-Type', ''), CONTENT_LENGTH=str(len(body)),
+                           GIT_PROTOCOL=self.headers.get('Git-Protocol', ''))
+                if encoding := self.headers.get('Content-Encoding'):
+                    env['HTTP_CONTENT_ENCODING'] = encoding
+                output = subprocess.run(['git', 'http-backend'], input=body, env=env, capture_output=True).stdout
+                head, _, data = output.partition(b'\r\n\r\n')
+                status = 200
+                headers = {}
+                for line in head.decode('latin-1').split('\r\n'):
+                    key, _, value = line.partition(':')
+                    if key.lower() == 'status':
+                        status = int(value.split()[0])
+                    elif key:
+                        headers[key] = value.strip()
+                self.send_body(status, data, headers)
+
+            def send_body(self, status, data, headers):
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                start = time.monotonic()
+                for offset in range(0, len(data), WRITE_CHUNK):
+                    chunk = data[offset:offset + WRITE_CHUNK]
+                    self.wfile.write(chunk)
+                    with simulator.lock:
+                        simulator.bytes_sent += len(chunk)
+                    if simulator.bandwidth:
+                        # 按已发送的字节数限速
+                        delay = (offset + len(chunk)) / simulator.bandwidth - (time.monotonic() - start)
+                        if delay > 0:
+                            time.sleep(delay)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def create_fixture(root, repos, size=2 * 1024 * 1024, seed=0):
+    """
+    创建模拟器使用的裸仓库
+
+    每个仓库包含一个 main 分支，内容为不可压缩的随机文件。
+
+    Args:
+        root (str): 裸仓库目录
+        repos (list): owner/repo 列表
+        size (int): 每个仓库的随机内容大小（字节）
+        seed (int): 随机数种子
+    """
+    rng = random.Random(seed)
+    for slug in repos:
+        bare = os.path.join(root, slug + '.git')
+        if os.path.exists(bare):
+            continue
+        work = bare + '.work'
+        os.makedirs(work)
+        git = ['git', '-C', work, '-c', 'user.name=bench', '-c', 'user.email=bench@localhost']
+        subprocess.run(git + ['init', '--quiet', '--initial-branch', 'main'], check=True)
+        remaining = size
+        index = 0
+        while remaining > 0:
+            chunk = min(remaining, 512 * 1024)
+            with open(os.path.join(work, f'data-{index}.bin'), 'wb') as f:
+                f.write(rng.randbytes(chunk))
+            remaining -= chunk
+            index += 1
+        with open(os.path.join(work, 'README.md'), 'w') as f:
+            f.write(f'# {slug}\n')
+        subprocess.run(git + ['add', '.'], check=True)
+        subprocess.run(git + ['commit', '--quiet', '-m', 'init'], check=True)
+        subprocess.run(['git', 'clone', '--quiet', '--bare', work, bare], check=True)
+        shutil.rmtree(work)
+
+
+def update_fixture(root, slug, files, seed=0):
+    """
+    在裸仓库的 main 分支上提交一次修改
+
+    Args:
+        root (str): 裸仓库目录
+        slug (str): owner/repo
+        files (dict): 文件路径到新内容大小（字节）的映射，None 表示删除该文件
+        seed (int): 随机数种子
+    """
+    rng = random.Random(seed)
+    bare = os.path.join(root, slug + '.git')
+    work = bare + '.work'
+    subprocess.run(['git', 'clone', '--quiet', bare, work], check=True)
+    git = ['git', '-C', work, '-c', 'user.name=bench', '-c', 'user.email=bench@localhost']
+    for path, size in files.items():
+        if size is None:
+            subprocess.run(git + ['rm', '--quiet', path], check=True)
+            continue
+        os.makedirs(os.path.dirname(os.path.join(work, path)) or work, exist_ok=True)
+        with open(os.path.join(work, path), 'wb') as f:
+            f.write(rng.randbytes(size))
+        subprocess.run(git + ['add', path], check=True)
+    subprocess.run(git + ['commit', '--quiet', '-m', 'update'], check=True)
+    subprocess.run(git + ['push', '--quiet', 'origin', 'main'], check=True)
+    shutil.rmtree(work)
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+镜像源端到端基准
+
+在本机启动若干模拟镜像源（见 bench/mirror_sim.py）替换 MIRRORS，
+端到端执行 select_mirror、handle_clone 与 handle_download_zip（包括 --update 增量更新），
+以及经过 fgit serve 拉取后停止所有镜像源、再次拉取只使用缓存的离线场景，
+输出每个场景的耗时、传输字节数与最终使用的镜像源。
+全程不访问外部网络，配置、健康记录与性能记录都写入临时目录。
+
+用法: python bench/mirrors.py [--repeat N] [--size MB] [--json 文件] [--baseline 文件 [--tolerance 比例]]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+import tempfile
+import threading
+import statistics
+from http.server import ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from mirror_sim import MirrorSimulator, create_fixture, update_fixture
+
+BENCH_REPO = 'fgit-bench/sample'
+# 增量更新场景中, 旧压缩包之后的一次提交修改的文件与大小（字节）
+UPDATE_FILES = {'README.md': 2048, 'docs/changed.bin': 16 * 1024}
+
+# 模拟镜像源的参数：延迟（秒）、带宽（字节/秒）、失败率与是否支持 Range 请求
+PROFILES = {
+    'fast': {},
+    'slow': {'latency': 0.2, 'bandwidth': 1024 * 1024},
+    'flaky': {'failure_rate': 0.5},
+    'norange': {'ranges': False},
+    'down': {'failure_rate': 1.0},
+}
+
+# 场景：名称、类型与预先写入缓存的镜像源顺序（None 表示没有缓存，需要测速）
+SCENARIOS = [
+    ('select-cold', 'select', None),
+    ('select-warm', 'select', list(PROFILES)),
+    ('clone', 'clone', ['fast']),
+    ('clone-failover', 'clone', ['down', 'fast']),
+    ('download-segmented', 'download', ['fast']),
+    ('download-norange', 'download', ['norange']),
+    ('download-failover', 'download', ['down', 'fast']),
+    ('download-incremental', 'update', ['fast']),
+    ('serve-offline', 'serve', ['fast']),
+]
+
+BASE_CONFIG = """[downloader]
+chunk_size = 65536
+min_file_size = 100
+segments = 4
+segment_size = 524288
+"""
+
+
+def prepare(home, order):
+    """
+    重置配置、健康记录与仓库镜像源偏好，并按需写入镜像源缓存
+
+    Args:
+        home (str): 临时主目录
+        order (list): 缓存的镜像源顺序，None 表示不写入缓存
+    """
+    from utils import affinity
+    from utils.config import ConfigHandler
+
+    for name in ('.fgit.health.json', '.fgit.api.json', '.fgit.affinity.json'):
+        if os.path.exists(os.path.join(home, name)):
+            os.remove(os.path.join(home, name))
+    # 进程内缓存的偏好记录会让故障转移场景直接跳过失败的镜像源
+    affinity._index = None
+    with open(os.path.join(home, '.fgit.conf'), 'w') as f:
+        f.write(BASE_CONFIG)
+    if order is not None:
+        ConfigHandler().save_mirrors(order)
+
+
+def run_scenario(fgit, kind, work_dir, simulators):
+    """
+    执行一个场景
+
+    Args:
+        fgit (module): fgit 模块
+        kind (str): 场景类型
+        work_dir (str): 工作目录
+        simulators (dict): 镜像源名称到模拟器的映射，离线场景会暂时停止所有模拟器
+
+    Returns:
+        tuple: (耗时（秒）, 操作记录, 选出的镜像源列表)
+    """
+    from utils import telemetry
+    from utils.config import ConfigHandler
+    from utils.health import HealthStore
+    from utils.proxy import ProxyHandler
+
+    config = ConfigHandler()
+    proxy = ProxyHandler(None, config)
+    env = proxy.setup_proxy_env()
+    url = f'https://github.com/{BENCH_REPO}'
+    selected = None
+    os.chdir(work_dir)
+    start = time.monotonic()
+    with telemetry.operation(kind, repo=url) as op:
+        if kind == 'select':
+            selected = fgit.select_mirror(config, False, HealthStore())
+        elif kind == 'clone':
+            args, unknown_args = fgit.parser.parse_known_args(['clone', url, '--quiet'])
+            fgit.handle_clone(args, unknown_args, config, env, False, proxy)
+        elif kind == 'serve':
+            serve_offline(config, url, work_dir, simulators)
+        else:
+            args, unknown_args = fgit.parser.parse_known_args((['--update'] if kind == 'update' else []) +
+                                                              ['download', url])
+            fgit.handle_download_zip(args, unknown_args, config, env, False)
+    return time.monotonic() - start, op.data, selected
+
+
+def serve_offline(config, url, work_dir, simulators):
+    """
+    经过 fgit serve 克隆一次，停止所有镜像源后再次克隆，第二次只能使用 fgit serve 的缓存
+
+    Args:
+        config (ConfigHandler): 配置处理器实例
+        url (str): 仓库URL
+        work_dir (str): 工作目录
+        simulators (dict): 镜像源名称到模拟器的映射
+
+    Raises:
+        RuntimeError: 任一次克隆失败
+    """
+    from utils.server import MirrorProxy, ProxyRequestHandler
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ProxyRequestHandler)
+    server.daemon_threads = True
+    server.proxy = MirrorProxy(config, os.path.join(work_dir, 'serve'), 1024 ** 3)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    address = f'http://127.0.0.1:{server.server_address[1]}/'
+    clone = ['git', '-c', f'url.{address}.insteadOf=https://github.com/', 'clone', '--quiet', url]
+    try:
+        if subprocess.run(clone + ['online']).returncode != 0:
+            raise RuntimeError('经过 fgit serve 克隆失败')
+        for sim in simulators.values():
+            sim.stop()
+        try:
+            if subprocess.run(clone + ['offline']).returncode != 0:
+                raise RuntimeError('镜像源离线时经过 fgit serve 克隆失败')
+        finally:
+            for sim in simulators.values():
+                sim.start()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def compare(results, baseline_path, tolerance):
+    """
+    与基线结果比较耗时
+
+    Args:
+        results (dict): 本次结果
+        baseline_path (str): 基线结果文件（--json 的输出）
+        tolerance (float): 允许的相对增幅
+
+    Returns:
+        list: 超出允许增幅的场景名称
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = []
+    for name, result in results.items():
+        if name in baseline and result['seconds'] > baseline[name]['seconds'] * (1 + tolerance):
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='fgit 镜像源端到端基准')
+    parser.add_argument('--repeat', type=int, default=3, help='每个场景的执行次数')
+    parser.add_argument('--size', type=float, default=4, help='测试仓库的大小（MB）')
+    parser.add_argument('--scenario', action='append', help='只执行指定场景，可重复指定')
+    parser.add_argument('--json', type=str, help='将结果写入 JSON 文件')
+    parser.add_argument('--baseline', type=str, help='与该 JSON 文件中的结果比较，耗时超出允许增幅时以非零状态退出')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='与基线比较时允许的相对增幅')
+    parser.add_argument('--verbose', action='store_true', help='显示 fgit 的日志输出')
+    options = parser.parse_args()
+
+    cwd = os.getcwd()
+    root = tempfile.mkdtemp(prefix='fgit-bench-')
+    home = os.path.join(root, 'home')
+    repos = os.path.join(root, 'repos')
+    os.makedirs(home)
+    # 配置与记录文件的路径在导入或创建时根据 HOME 计算, 必须在导入 fgit 之前设置
+    os.environ['HOME'] = os.environ['USERPROFILE'] = home
+    os.environ['NO_PROXY'] = os.environ['no_proxy'] = '127.0.0.1,localhost'
+    os.environ['GIT_TERMINAL_PROMPT'] = '0'
+    sys.argv = ['fgit.py', 'bench']
+
+    from loguru import logger
+    import utils.mirrors
+    import utils.github
+    import fgit
+
+    logger.remove()
+    logger.add(sys.stderr, level='DEBUG' if options.verbose else 'ERROR', format='{time:HH:mm:ss} | {level} | {message}')
+
+    simulators = {}
+    try:
+        create_fixture(repos, [utils.mirrors.PROBE_REPO, BENCH_REPO], size=int(options.size * 1024 * 1024))
+        # 增量更新场景的旧压缩包, 与模拟器生成的压缩包格式相同
+        old_archive = os.path.join(root, 'old.zip')
+        subprocess.run(['git', '-C', os.path.join(repos, BENCH_REPO + '.git'), 'archive', '--format', 'zip',
+                        '--prefix', BENCH_REPO.split('/')[1] + '-main/', '-o', old_archive, 'main'], check=True)
+        update_fixture(repos, BENCH_REPO, UPDATE_FILES)
+        for seed, (name, profile) in enumerate(PROFILES.items()):
+            simulators[name] = MirrorSimulator(repos, seed=seed, **profile).start()
+        utils.mirrors.MIRRORS.clear()
+        utils.mirrors.MIRRORS.update({name: sim.url for name, sim in simulators.items()})
+        utils.mirrors.RAWCONTENT_MIRRORS.clear()
+        utils.mirrors.RAWCONTENT_MIRRORS.update({name: sim.url + '/raw' for name, sim in simulators.items()})
+        utils.github.API_URL = simulators['fast'].url
+
+        results = {}
+        print(f"{'场景':<22}{'耗时中位数(s)':>14}{'最小(s)':>10}{'传输(KB)':>12}  镜像源")
+        for name, kind, order in SCENARIOS:
+            if options.scenario and name not in options.scenario:
+                continue
+            timings = []
+            for index in range(options.repeat):
+                prepare(home, order)
+                work_dir = os.path.join(root, 'work', f'{name}-{index}')
+                os.makedirs(work_dir)
+                if kind == 'update':
+                    shutil.copy(old_archive, os.path.join(work_dir, BENCH_REPO.split('/')[1] + '-main.zip'))
+                sent = sum(sim.bytes_sent for sim in simulators.values())
+                seconds, record, selected = run_scenario(fgit, kind, work_dir, simulators)
+                timings.append(seconds)
+                transferred = sum(sim.bytes_sent for sim in simulators.values()) - sent
+                mirror = selected[0] if selected else record.get('mirror')
+                shutil.rmtree(work_dir)
+            results[name] = {'seconds': round(statistics.median(timings), 4), 'min': round(min(timings), 4),
+                             'bytes': transferred, 'mirror': mirror}
+            print(f"{name:<22}{statistics.median(timings):>14.3f}{min(timings):>10.3f}"
+                  f"{transferred / 1024:>12.1f}  {mirror or '-'}")
+    finally:
+        os.chdir(cwd)
+        for sim in simulators.values():
+            sim.stop()
+        shutil.rmtree(root, ignore_errors=True)
+
+    if options.json:
+        with open(options.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if options.baseline:
+        if regressions := compare(results, options.baseline, options.tolerance):
+            print(f"耗时超出基线 {options.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+fgit 启动耗时基准
+
+分别计时 `git <命令>` 与 `python fgit.py <命令>`，输出 fgit 额外带来的启动开销，
+用于确认透传命令保持在快速路径上。
+
+用法: python bench/startup.py [--runs N] [--max-overhead 毫秒] [命令参数...]
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+FGIT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fgit.py')
+
+
+def measure(cmd, runs):
+    """
+    多次执行命令并计时
+
+    Args:
+        cmd (list): 命令
+        runs (int): 执行次数
+
+    Returns:
+        list: 每次耗时（毫秒）
+    """
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='fgit 启动耗时基准')
+    parser.add_argument('--runs', type=int, default=20, help='每个命令的执行次数')
+    parser.add_argument('--max-overhead', type=float, help='中位数开销超过该值（毫秒）时以非零状态退出')
+    # 命令之后的参数（包括 --short 等选项）原样透传
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='透传给 git 的命令，默认为 status --short')
+    args = parser.parse_args()
+    args.command = args.command or ['status', '--short']
+
+    git = measure(['git'] + args.command, args.runs)
+    fgit = measure([sys.executable, FGIT] + args.command, args.runs)
+    # 不带命令时的完整导入开销, 作为对照
+    full = measure([sys.executable, FGIT, '--help'], args.runs)
+
+    print(f"{'命令':<24}{'中位数(ms)':>12}{'最小(ms)':>12}")
+    for name, timings in [(f"git {' '.join(args.command)}", git),
+                          (f"fgit {' '.join(args.command)}", fgit),
+                          ('fgit --help', full)]:
+        print(f"{name:<24}{statistics.median(timings):>12.1f}{min(timings):>12.1f}")
+
+    overhead = statistics.median(fgit) - statistics.median(git)
+    print(f"透传开销: {overhead:.1f}ms")
+    if args.max_overhead is not None and overhead > args.max_overhead:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
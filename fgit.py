@@ -1,36 +1,81 @@
 #!/usr/bin/env python3
+import os
 import sys
+
+# 定义常量
+GIT_COMMANDS_NEED_MIRROR = {'clone', 'pull', 'push', 'fetch'}
+FGIT_COMMANDS = {'download', 'batch', 'release', 'raw', 'refresh-mirrors', 'serve', 'stats'}
+
+
+def passthrough_git(git_args):
+    """
+    直接执行不需要镜像的 git 命令
+
+    不导入日志、网络等模块，也不检查代理连通性，配置了代理时只设置环境变量。
+    非 Windows 系统上以 git 进程替换当前进程。
+
+    Args:
+        git_args (list): git 命令参数
+    """
+    from utils.config import ConfigHandler
+    proxy_url = (ConfigHandler().get_proxy() or {}).get('url')
+    if proxy_url:
+        os.environ['HTTP_PROXY'] = proxy_url
+        os.environ['HTTPS_PROXY'] = proxy_url
+    if os.name == 'nt':
+        # Windows 上的 exec 不会替换进程, 控制台会提前返回
+        import subprocess
+        sys.exit(subprocess.call(['git'] + git_args))
+    os.execvp('git', ['git'] + git_args)
+
+
+if __name__ == '__main__' and len(sys.argv) > 1 and not sys.argv[1].startswith('-') \
+        and sys.argv[1] not in GIT_COMMANDS_NEED_MIRROR | FGIT_COMMANDS:
+    passthrough_git(sys.argv[1:])
+
 import subprocess
 import argparse
-import os
-import json
-from threading import Thread
+import time
+import hashlib
+import shutil
+from datetime import datetime
+from urllib.parse import quote
+from fnmatch import fnmatch
+from threading import Thread, BoundedSemaphore
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from loguru import logger
-from urllib.request import urlopen, Request
-from urllib.error import HTTPError
 from colorama import Fore, Style, init
 from utils.config import ConfigHandler
-from utils.mirrors import select_mirror, convert_url
-from utils.downloader import download_file
+from utils.mirrors import MIRRORS, RAWCONTENT_MIRRORS, select_mirror, refresh_mirrors, convert_url, convert_raw_url, get_mirror_capabilities, race_mirrors, GIT_ADVERTISEMENT_PREFIX, ZIP_PREFIX, TAR_GZ_PREFIX, BACKGROUND_FLAG
 from utils.proxy import ProxyHandler
+from utils import http, telemetry, stall, affinity, scheduler
+from utils.health import HealthStore, raw_key
+from utils.cache import RepoCache, get_dir_size
+from utils.github import GitHubAPI, repo_slug
 
 init(autoreset=True)
 
-# 定义常量
-GIT_COMMANDS_NEED_MIRROR = {'clone', 'pull', 'push', 'fetch'}
-HEADERS = {
-    'User-Agent': 'Mozilla/5.0',
-    'Content-Type': 'application/json',
-    'Accept': 'application/json'
-}
-
-parser = argparse.ArgumentParser(description='Git加速工具，支持镜像源和代理')
+# 不允许缩写, 以免 git 命令的选项（如 --jo）被当作 fgit 的选项
+parser = argparse.ArgumentParser(description='Git加速工具，支持镜像源和代理', allow_abbrev=False)
 parser.add_argument('command', type=str, help='git命令, 或是fgit命令')
 parser.add_argument('--use-proxy', type=str, help='设置HTTP代理（格式: http://[user:pass@]host:port）')
 parser.add_argument('--branch', type=str, help='分支名(仅在download命令时有效)', default='main')
+parser.add_argument('--format', type=str, choices=['zip', 'tar.gz'], default='zip', help='压缩包格式(仅在download命令时有效)')
+parser.add_argument('--extract', action='store_true', help='下载的同时解压到当前目录(仅在download命令时有效)')
+parser.add_argument('--update', action='store_true', help='只下载变更的文件以更新已下载的压缩包(仅在download命令时有效)')
+parser.add_argument('--jobs', type=int, help='并发数(仅在download/batch/release命令与clone子模块、LFS时有效, 其他命令透传给git)')
+parser.add_argument('--pattern', type=str, help='只下载文件名匹配该通配符的文件(仅在release命令时有效)')
+parser.add_argument('--fast', action='store_true', help='快速克隆，在镜像源支持时自动添加 --filter/--depth')
+parser.add_argument('--race', action='store_true', help='同时向多个镜像源发起请求，使用最快响应的镜像源')
 parser.add_argument('--verbose', action='store_true', help='显示详细输出')
 
 args, unknown_args = parser.parse_known_args()
+# --jobs 只由以下命令使用, 其他命令（如 fetch、pull）原样透传给 git
+JOBS_COMMANDS = ('download', 'batch', 'release', 'clone')
+if args.jobs is not None and args.command not in JOBS_COMMANDS:
+    unknown_args = ['--jobs', str(args.jobs)] + unknown_args
+    args.jobs = None
 
 # 配置日志
 logger.remove()
@@ -49,6 +94,10 @@ def print_missing_arg():
 def main():
     """主函数"""
     config = ConfigHandler()
+    http.configure(config)
+    telemetry.configure(config)
+    stall.configure(config)
+    scheduler.configure(config, background=BACKGROUND_FLAG in unknown_args)
     proxy = ProxyHandler(args.use_proxy, config, args.verbose)
     env = proxy.setup_proxy_env()
 
@@ -64,24 +113,62 @@ def main():
         print_missing_arg()
         return
 
-    # 处理 download 命令
-    if args.command == 'download':
-        handle_download_zip(args, unknown_args, config, env, args.verbose)
+    # 显示性能统计
+    if args.command == 'stats':
+        handle_stats(args, unknown_args, config)
         return
-    
-    # 处理不需要镜像的 Git 命令
-    if args.command not in GIT_COMMANDS_NEED_MIRROR:
-        subprocess.run(['git'] + sys.argv[1:], env=env)
+
+    # 启动本地缓存代理
+    if args.command == 'serve':
+        from utils.server import serve
+        serve(config, unknown_args[0] if unknown_args else None, args.verbose)
         return
 
-    # 处理需要镜像的 Git 命令
-    try:
-        if args.command == 'clone':
-            handle_clone(args, unknown_args, config, env, args.verbose, proxy)
-        else:
-            handle_other_commands(args, unknown_args, config, env, args.verbose, proxy)
-    finally:
-        proxy.restore_proxy_settings()
+    with telemetry.operation(args.command, repo=unknown_args[0] if unknown_args else None) as op:
+        # 重新测试镜像源 (缓存过期时由后台进程调用)
+        if args.command == 'refresh-mirrors':
+            background = BACKGROUND_FLAG in unknown_args
+            if background:
+                # 后台刷新让位于本机正在进行的传输, 避免争用带宽并影响测速结果
+                scheduler.wait_idle()
+            refresh_mirrors(config, args.verbose, HealthStore(), force=not background, wait=not background)
+            return
+
+        # 处理 download 命令
+        if args.command == 'download':
+            handle_download_zip(args, unknown_args, config, env, args.verbose)
+            return
+
+        # 处理 batch 命令
+        if args.command == 'batch':
+            handle_batch(args, unknown_args, config, env, args.verbose)
+            return
+
+        # 处理 release 命令
+        if args.command == 'release':
+            handle_release(args, unknown_args, config, args.verbose)
+            return
+
+        # 处理 raw 命令
+        if args.command == 'raw':
+            handle_raw(args, unknown_args, config, args.verbose)
+            return
+
+        # 处理不需要镜像的 Git 命令
+        if args.command not in GIT_COMMANDS_NEED_MIRROR:
+            with telemetry.phase('git'):
+                result = subprocess.run(['git'] + sys.argv[1:], env=env)
+            op.set(exit_code=result.returncode)
+            return
+
+        # 处理需要镜像的 Git 命令
+        try:
+            if args.command == 'clone':
+                handle_clone(args, unknown_args, config, env, args.verbose, proxy)
+            else:
+                handle_other_commands(args, unknown_args, config, env, args.verbose, proxy)
+        finally:
+            proxy.restore_proxy_settings()
 
 
 def handle_download_zip(args, unknown_args, config, env, verbose):
@@ -90,40 +177,498 @@ def handle_download_zip(args, unknown_args, config, env, verbose):
         print_missing_arg()
         return
     
+    from utils.downloader import download_file
+    from utils.archive import archive_info, prune_tree
+
     downloader_config = config.get_downloader_config()
     if not downloader_config:
         logger.warning(Fore.YELLOW + "🧐 下载配置不存在, 使用默认配置" + Style.RESET_ALL)
     
     chunk_size = downloader_config.get('chunk_size', 1024)
     min_file_size = downloader_config.get('min_file_size', 100)
+    segments = downloader_config.get('segments', 4)
+    segment_size = downloader_config.get('segment_size', 4 * 1024 * 1024)
     
     original_url = unknown_args[0]
     original_url = normalize_repo_url(original_url)
 
     repo_name = original_url.split('/')[-1].split('.git')[0]
-    zip_filename = f"{repo_name}-{args.branch}.zip"
+    zip_filename = f"{repo_name}-{args.branch}.{args.format}"
     zip_filepath = os.path.join(os.getcwd(), zip_filename)
     
+    health = HealthStore()
+    previous = None
     if os.path.exists(zip_filepath):
-        logger.warning(Fore.YELLOW + f"😪 压缩包 {zip_filename} 已存在" + Style.RESET_ALL)
-        return
+        if not args.update:
+            logger.warning(Fore.YELLOW + f"😪 压缩包 {zip_filename} 已存在" + Style.RESET_ALL)
+            return
+        if (previous := archive_info(zip_filepath, args.format)) is None:
+            logger.warning(Fore.YELLOW + f"🧐 压缩包 {zip_filename} 中没有提交记录, 无法增量更新" + Style.RESET_ALL)
+        elif update_archive(config, original_url, args.branch, zip_filepath, args.format, previous,
+                            os.getcwd() if args.extract else None, health,
+                            args.jobs or int(config.get_batch_config().get('jobs', 4))):
+            return
+        logger.info(Fore.CYAN + "📦 改为下载完整压缩包" + Style.RESET_ALL)
+
+    if os.path.exists(zip_filepath + '.part'):
+        logger.info(Fore.CYAN + f"⏯️ 检测到未完成的下载 {zip_filename}.part, 将尝试断点续传" + Style.RESET_ALL)
     
-    repo_status = get_repo(original_url)
-    if repo_status is None:
-        logger.warning(Fore.YELLOW + "🧐 无法获取到仓库信息, 尝试下载" + Style.RESET_ALL)
-    elif repo_status is False and not input_with_timeout(Fore.YELLOW + "🧐 仓库可能不存在，5秒内按任意键忽略..." + Style.RESET_ALL, 5):
+    proceed, mirror_list = check_repo(config, verbose, health, original_url, '下载')
+    if not proceed:
         return
-        
-    mirror_list = select_mirror(config, verbose)
+
+    archive_path = f'/archive/refs/heads/{args.branch}.{args.format}'
+    index = affinity.get_index()
+    mirror_list = index.order(original_url, mirror_list)
+    mirror_list = race_mirror_list(args, config, mirror_list, ZIP_PREFIX if args.format == 'zip' else TAR_GZ_PREFIX,
+                                   lambda m: convert_url(original_url, m) + archive_path)
     for mirror in mirror_list:
-        new_url = convert_url(original_url, mirror) + f'/archive/refs/heads/{args.branch}.zip'
+        new_url = convert_url(original_url, mirror) + archive_path
         logger.info(Fore.GREEN + f"🔄 尝试镜像源 {mirror} [{mirror_list.index(mirror) + 1}/{len(mirror_list)}]: {new_url}" + Style.RESET_ALL)
-        if download_file(new_url, zip_filepath, chunk_size=chunk_size, MIN_FILE_SIZE=min_file_size):
+        start = time.monotonic()
+        if download_file(new_url, zip_filepath, chunk_size=chunk_size, MIN_FILE_SIZE=min_file_size,
+                         segments=segments, segment_size=segment_size, archive_format=args.format,
+                         extract_to=os.getcwd() if args.extract else None):
+            health.record(mirror, True, os.path.getsize(zip_filepath), time.monotonic() - start)
+            index.record(original_url, mirror, True, os.path.getsize(zip_filepath), time.monotonic() - start)
+            if previous is not None and args.extract and (current := archive_info(zip_filepath, args.format)):
+                # 解压时只会覆盖文件, 删除上游已删除的文件（不在原压缩包中的文件保留）
+                prune_tree(os.path.join(os.getcwd(), current['prefix']), previous['files'] - current['files'])
             return
+        health.record(mirror, False, error='download')
+        index.record(original_url, mirror, False)
             
     logger.error(Fore.RED + "❌ 所有镜像源尝试失败" + Style.RESET_ALL)
 
 
+def update_archive(config, original_url, branch, file_path, archive_format, previous, extract_to, health, jobs):
+    """
+    增量更新已下载的仓库压缩包
+
+    通过 compare API 获取压缩包记录的提交与分支最新提交之间变更的文件，
+    只从 raw 镜像源下载这些文件并校验 blob 哈希，再按目录树 API 返回的文件模式重新生成压缩包
+    （指定解压目录时同时更新解压出的文件）。分支历史被改写、变更文件过多、无法获取文件模式、
+    子模块变更或任一文件下载失败时不做修改，由调用方改为下载完整压缩包。
+
+    Args:
+        config (ConfigHandler): 配置处理器实例
+        original_url (str): 仓库URL
+        branch (str): 分支名
+        file_path (str): 已下载的压缩包路径
+        archive_format (str): 压缩包格式，zip 或 tar.gz
+        previous (dict): 压缩包信息，见 archive_info
+        extract_to (str): 解压目录，None 表示不解压
+        health (HealthStore): 健康记录
+        jobs (int): 并发下载数
+
+    Returns:
+        bool: 压缩包是否已是最新
+    """
+    from utils.archive import GIT_SUBMODULE, ArchiveError, patch_archive, patch_tree, verify_archive
+
+    max_files = int(config.get_downloader_config().get('incremental_max_files', 200))
+    api = GitHubAPI.from_config(config)
+    compare = api.get_compare(original_url, previous['commit'], branch)
+    if compare is None:
+        logger.warning(Fore.YELLOW + "🧐 无法获取变更列表" + Style.RESET_ALL)
+        return False
+    if compare['status'] not in ('identical', 'ahead'):
+        logger.info(Fore.CYAN + f"🔀 分支 {branch} 的历史已改写 ({compare['status']})" + Style.RESET_ALL)
+        return False
+    if compare['truncated'] or len(compare['files']) > max_files:
+        logger.info(Fore.CYAN + f"📚 变更文件过多 ({len(compare['files'])}{'+' if compare['truncated'] else ''})" + Style.RESET_ALL)
+        return False
+
+    changed = [change for change in compare['files'] if change['status'] != 'removed']
+    files = {change['path']: os.path.join(file_path + '.update', str(i)) for i, change in enumerate(changed)}
+    removed = {change['path'] for change in compare['files'] if change['status'] == 'removed'} | \
+              {change['previous'] for change in changed if change['status'] == 'renamed' and change['previous']}
+    removed -= set(files)
+    # 新增文件与权限、类型变化的文件都需要新提交中的文件模式
+    modes = api.get_modes(original_url, compare['head'], files) if files else {}
+    if modes is None:
+        logger.warning(Fore.YELLOW + "🧐 无法获取变更文件的权限" + Style.RESET_ALL)
+        return False
+    if GIT_SUBMODULE in modes.values():
+        logger.info(Fore.CYAN + "📦 子模块有变更, 无法增量更新" + Style.RESET_ALL)
+        return False
+    if compare['status'] == 'ahead':
+        logger.info(Fore.GREEN + f"🧩 {previous['commit'][:12]}...{compare['head'][:12]}: "
+                    f"{len(files)} 个文件变更, {len(removed)} 个文件删除" + Style.RESET_ALL)
+
+    os.makedirs(file_path + '.update', exist_ok=True)
+    mirror_list = health.order_raw(list(RAWCONTENT_MIRRORS))
+    slug = repo_slug(original_url)
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(lambda change: fetch_blob(slug, compare['head'], change, files[change['path']],
+                                                                  mirror_list, health), changed))
+        if not all(results):
+            return False
+        fetched = sum(os.path.getsize(path) for path in files.values())
+        mtime = datetime.fromisoformat(compare['date'].replace('Z', '+00:00')).timestamp() \
+            if compare['date'] else time.time()
+        root = os.path.join(extract_to, previous['prefix']) if extract_to else None
+        with telemetry.phase('patch'):
+            if compare['status'] == 'ahead':
+                patch_archive(file_path, archive_format, compare['head'], files, removed, modes, mtime)
+                if root and os.path.isdir(root):
+                    patch_tree(root, files, removed, modes)
+            if root and not os.path.isdir(root):
+                # 解压目录不存在时从更新后的压缩包完整解压
+                with open(file_path, 'rb') as f:
+                    verify_archive(f, archive_format, extract_to)
+    except ArchiveError as e:
+        logger.error(Fore.RED + f"❌ 无法更新压缩包: {e}" + Style.RESET_ALL)
+        return False
+    finally:
+        shutil.rmtree(file_path + '.update', ignore_errors=True)
+
+    if compare['status'] == 'identical':
+        logger.info(Fore.GREEN + f"✅ {os.path.basename(file_path)} 已是最新 ({previous['commit'][:12]})" + Style.RESET_ALL)
+    else:
+        logger.info(Fore.GREEN + f"✅ 已更新到 {compare['head'][:12]}: 下载 {fetched / 1024:.1f}KB, "
+                    f"压缩包 {os.path.getsize(file_path) / 1024:.1f}KB" + Style.RESET_ALL)
+    return True
+
+
+def fetch_blob(slug, commit, change, file_path, mirror_list, health):
+    """
+    依次使用 raw 镜像源下载提交中的单个文件，并校验其 blob 哈希
+
+    Args:
+        slug (str): owner/repo
+        commit (str): 提交 SHA，按提交下载避免镜像源缓存旧的分支内容
+        change (dict): compare API 返回的文件变更
+        file_path (str): 保存文件路径
+        mirror_list (list): RAWCONTENT_MIRRORS 中的镜像源列表
+        health (HealthStore): 健康记录
+
+    Returns:
+        bool: 是否成功
+    """
+    url_path = f"{slug}/{commit}/{quote(change['path'])}"
+    for mirror in mirror_list:
+        url = convert_raw_url(url_path, mirror)
+        start = time.monotonic()
+        lease = scheduler.acquire(url)
+        try:
+            with http.get_client().get(url, stream=True) as response:
+                if response.status_code != 200:
+                    raise IOError(f"HTTP {response.status_code}")
+                with open(file_path, 'wb') as f:
+                    for data in response.iter_content(chunk_size=64 * 1024):
+                        f.write(data)
+                        lease.throttle(len(data))
+        except Exception as e:
+            logger.debug(f"镜像源 {mirror} 下载 {change['path']} 失败: {e}")
+            health.record(raw_key(mirror), False, error='download')
+            continue
+        finally:
+            lease.release()
+        if git_blob_sha(file_path) != change['sha']:
+            logger.debug(f"镜像源 {mirror} 返回的 {change['path']} 与 {change['sha'][:12]} 不一致")
+            health.record(raw_key(mirror), False, error='download')
+            continue
+        health.record(raw_key(mirror), True, os.path.getsize(file_path), time.monotonic() - start)
+        return True
+    logger.error(Fore.RED + f"❌ 文件 {change['path']} 下载失败" + Style.RESET_ALL)
+    return False
+
+
+def handle_batch(args, unknown_args, config, env, verbose):
+    """处理批量克隆/拉取命令"""
+    if unknown_args is None or len(unknown_args) < 1:
+        print_missing_arg()
+        return
+
+    batch_config = config.get_batch_config()
+    jobs = args.jobs or int(batch_config.get('jobs', 4))
+    per_mirror = int(batch_config.get('per_mirror', 2))
+
+    entries = parse_manifest(unknown_args[0])
+    if not entries:
+        logger.warning(Fore.YELLOW + f"😪 清单 {unknown_args[0]} 中没有仓库" + Style.RESET_ALL)
+        return
+
+    # 所有仓库共用一次镜像源选择, 同时批量检查仓库是否存在
+    health = HealthStore()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        mirror_future = executor.submit(select_mirror, config, verbose, health)
+        repo_status = GitHubAPI.from_config(config).get_repos([entry['url'] for entry in entries])
+        mirror_list = mirror_future.result()
+    limits = {mirror: BoundedSemaphore(per_mirror) for mirror in mirror_list}
+    logger.info(Fore.CYAN + f"📦 批量处理 {len(entries)} 个仓库, 并发数 {jobs}" + Style.RESET_ALL)
+
+    def run(entry):
+        command = 'batch-fetch' if os.path.exists(os.path.join(entry['path'], '.git')) else 'batch-clone'
+        with telemetry.operation(command, repo=entry['url']):
+            return run_entry(entry)
+
+    def run_entry(entry):
+        start = time.monotonic()
+        if repo_status[entry['url']] is False:
+            logger.error(Fore.RED + f"❌ {entry['url']} 仓库可能不存在或未公开, 已跳过" + Style.RESET_ALL)
+            return entry, None, 0, 0
+        objects_path = os.path.join(entry['path'], '.git', 'objects')
+        # 每个仓库按各自的亲和记录排序, 结果同时写入亲和记录供之后的命令使用
+        entry_mirrors = affinity.get_index().order(entry['url'], mirror_list)
+        if os.path.exists(os.path.join(entry['path'], '.git')):
+            # 已存在的仓库执行 fetch
+            before = get_dir_size(objects_path)
+            mirror = run_with_mirrors(['fetch', 'origin'], entry_mirrors, env, health, cwd=entry['path'],
+                                      limits=limits, capture=True, repo_url=entry['url'])
+            size = get_dir_size(objects_path) - before
+        else:
+            clone_args = [entry['path']] + (['--branch', entry['branch']] if entry['branch'] else [])
+            mirror, size = clone_cached(config, entry['url'], clone_args, entry['path'], 'origin', entry_mirrors, env,
+                                        health, limits=limits, capture=True,
+                                        mirror_args=clone_profile_args(args, config, entry['url'], clone_args))
+        elapsed = time.monotonic() - start
+        if mirror is None:
+            logger.error(Fore.RED + f"❌ {entry['url']} 所有镜像源尝试失败" + Style.RESET_ALL)
+        else:
+            logger.info(Fore.GREEN + f"✅ {entry['url']} ({mirror}, {elapsed:.1f}s)" + Style.RESET_ALL)
+        return entry, mirror, size, elapsed
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(run, entries))
+
+    from prettytable import PrettyTable
+    table = PrettyTable()
+    table.field_names = ['仓库', '镜像源', '耗时', '大小', '结果']
+    for entry, mirror, size, elapsed in results:
+        status = Fore.GREEN + "成功" + Style.RESET_ALL if mirror else Fore.RED + "失败" + Style.RESET_ALL
+        table.add_row([entry['url'], mirror or '-', f"{elapsed:.1f}s", f"{size / 1024 / 1024:.1f}MB", status])
+    print(table)
+    failed = sum(1 for _, mirror, _, _ in results if mirror is None)
+    telemetry.current().set(exit_code=1 if failed else 0)
+    logger.info(Fore.CYAN + f"📦 完成 {len(results) - failed}/{len(results)} 个仓库, "
+                f"共 {sum(r[2] for r in results) / 1024 / 1024:.1f}MB, 耗时 {time.monotonic() - start:.1f}s" + Style.RESET_ALL)
+
+
+def handle_stats(args, unknown_args, config):
+    """处理性能统计命令，可指定只统计最近几天的记录"""
+    try:
+        days = float(unknown_args[0]) if unknown_args else None
+    except ValueError:
+        print_missing_arg()
+        return
+    records = telemetry.load(time.time() - days * 86400 if days else None)
+    if not records:
+        logger.warning(Fore.YELLOW + "😪 没有性能记录" + Style.RESET_ALL)
+        return
+    summary = telemetry.summarize(records)
+
+    from prettytable import PrettyTable
+    table = PrettyTable()
+    table.field_names = ['阶段', '次数', 'p50', 'p95']
+    for name, values in sorted(summary['phases'].items(), key=lambda item: -sum(item[1])):
+        table.add_row([name, len(values), f"{telemetry.percentile(values, 50):.2f}s",
+                       f"{telemetry.percentile(values, 95):.2f}s"])
+    print(table)
+
+    table = PrettyTable()
+    table.field_names = ['镜像源', '成功', '失败', '耗时 p50', '耗时 p95', '吞吐 p50', '吞吐 p95', '传输量']
+    for mirror, entry in sorted(summary['mirrors'].items(), key=lambda item: -item[1]['bytes']):
+        throughput = entry['throughput']
+        table.add_row([mirror, entry['success'], entry['failure'],
+                       f"{telemetry.percentile(entry['seconds'], 50):.2f}s",
+                       f"{telemetry.percentile(entry['seconds'], 95):.2f}s",
+                       f"{telemetry.percentile(throughput, 50) / 1024:.1f}KB/s" if throughput else '-',
+                       f"{telemetry.percentile(throughput, 95) / 1024:.1f}KB/s" if throughput else '-',
+                       f"{entry['bytes'] / 1024 / 1024:.1f}MB"])
+    print(table)
+
+    results = ', '.join(f"{command} {result} {count}" for (command, result), count in sorted(summary['commands'].items()))
+    logger.info(Fore.CYAN + f"📊 共 {len(records)} 条记录: {results}" + Style.RESET_ALL)
+
+
+def handle_release(args, unknown_args, config, verbose):
+    """处理下载 release 文件命令"""
+    if unknown_args is None or len(unknown_args) < 1:
+        print_missing_arg()
+        return
+    from utils.downloader import download_file
+
+    downloader_config = config.get_downloader_config()
+    batch_config = config.get_batch_config()
+    jobs = args.jobs or int(batch_config.get('jobs', 4))
+    per_mirror = int(batch_config.get('per_mirror', 2))
+
+    original_url = normalize_repo_url(unknown_args[0])
+    tag = unknown_args[1] if len(unknown_args) > 1 else None
+
+    # 获取 release 信息的同时选择镜像源
+    health = HealthStore()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        mirror_future = executor.submit(select_mirror, config, verbose, health)
+        release = GitHubAPI.from_config(config).get_release(original_url, tag)
+        mirror_list = mirror_future.result()
+    if release is None:
+        logger.error(Fore.RED + f"❌ 获取 release 信息失败, 该仓库或标签 {tag or 'latest'} 可能不存在" + Style.RESET_ALL)
+        return
+
+    assets = [asset for asset in release['assets'] if fnmatch(asset['name'], args.pattern or '*')]
+    if not assets:
+        logger.warning(Fore.YELLOW + f"😪 release {release['tag']} 中没有匹配的文件" + Style.RESET_ALL)
+        return
+    limits = {mirror: BoundedSemaphore(per_mirror) for mirror in mirror_list}
+    logger.info(Fore.CYAN + f"📦 release {release['tag']}: 下载 {len(assets)} 个文件, 并发数 {jobs}" + Style.RESET_ALL)
+
+    def run(asset):
+        file_path = os.path.join(os.getcwd(), asset['name'])
+        if os.path.exists(file_path) and os.path.getsize(file_path) == asset['size'] and \
+                (not asset['digest'] or file_sha256(file_path) == asset['digest']):
+            logger.warning(Fore.YELLOW + f"😪 文件 {asset['name']} 已存在" + Style.RESET_ALL)
+            return asset, '本地', 0
+        start = time.monotonic()
+        for mirror in mirror_list:
+            with limits[mirror]:
+                mirror_start = time.monotonic()
+                success = download_file(convert_url(asset['url'], mirror), file_path,
+                                        chunk_size=downloader_config.get('chunk_size', 1024), MIN_FILE_SIZE=0,
+                                        segments=downloader_config.get('segments', 4),
+                                        segment_size=downloader_config.get('segment_size', 4 * 1024 * 1024),
+                                        archive_format=None, expected_size=asset['size'],
+                                        expected_digest=asset['digest'])
+            if success:
+                health.record(mirror, True, asset['size'], time.monotonic() - mirror_start)
+                return asset, mirror, time.monotonic() - start
+            health.record(mirror, False, error='download')
+        logger.error(Fore.RED + f"❌ {asset['name']} 所有镜像源尝试失败" + Style.RESET_ALL)
+        return asset, None, time.monotonic() - start
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(run, assets))
+
+    from prettytable import PrettyTable
+    table = PrettyTable()
+    table.field_names = ['文件', '镜像源', '耗时', '大小', '结果']
+    for asset, mirror, elapsed in results:
+        status = Fore.GREEN + "成功" + Style.RESET_ALL if mirror else Fore.RED + "失败" + Style.RESET_ALL
+        table.add_row([asset['name'], mirror or '-', f"{elapsed:.1f}s", f"{asset['size'] / 1024 / 1024:.1f}MB", status])
+    print(table)
+    failed = sum(1 for _, mirror, _ in results if mirror is None)
+    telemetry.current().set(exit_code=1 if failed else 0)
+    logger.info(Fore.CYAN + f"📦 完成 {len(results) - failed}/{len(results)} 个文件, "
+                f"耗时 {time.monotonic() - start:.1f}s" + Style.RESET_ALL)
+
+
+def handle_raw(args, unknown_args, config, verbose):
+    """处理下载仓库中单个文件命令"""
+    if unknown_args is None or len(unknown_args) < 1:
+        print_missing_arg()
+        return
+    from utils.downloader import download_file
+
+    raw_path = parse_raw_path(unknown_args[0])
+    if raw_path is None:
+        logger.error(Fore.RED + f"❌ 无法识别的文件地址: {unknown_args[0]}" + Style.RESET_ALL)
+        return
+    owner, repo, ref, path = raw_path.split('/', 3)
+    file_path = os.path.join(os.getcwd(), path.split('/')[-1])
+    if os.path.exists(file_path):
+        logger.warning(Fore.YELLOW + f"😪 文件 {os.path.basename(file_path)} 已存在" + Style.RESET_ALL)
+        return
+
+    downloader_config = config.get_downloader_config()
+    health = HealthStore()
+    # 文件大小与 blob 哈希用于排除返回错误页面的镜像源
+    info = GitHubAPI.from_config(config).get_content(f'{owner}/{repo}', path, ref)
+    if info is None:
+        logger.warning(Fore.YELLOW + "🧐 无法获取到文件信息, 将不校验文件内容" + Style.RESET_ALL)
+
+    mirror_list = health.order_raw(list(RAWCONTENT_MIRRORS))
+    for mirror in mirror_list:
+        url = convert_raw_url(raw_path, mirror)
+        logger.info(Fore.GREEN + f"🔄 尝试镜像源 {mirror} [{mirror_list.index(mirror) + 1}/{len(mirror_list)}]: {url}" + Style.RESET_ALL)
+        start = time.monotonic()
+        if download_file(url, file_path, chunk_size=downloader_config.get('chunk_size', 1024), MIN_FILE_SIZE=0,
+                         segments=downloader_config.get('segments', 4),
+                         segment_size=downloader_config.get('segment_size', 4 * 1024 * 1024),
+                         archive_format=None, expected_size=info['size'] if info else None):
+            if info is None or git_blob_sha(file_path) == info['sha']:
+                health.record(raw_key(mirror), True, os.path.getsize(file_path), time.monotonic() - start)
+                return
+            logger.error(Fore.RED + f"❌ 文件内容与仓库中的 {info['sha'][:12]} 不一致" + Style.RESET_ALL)
+            os.remove(file_path)
+        health.record(raw_key(mirror), False, error='download')
+
+    logger.error(Fore.RED + "❌ 所有镜像源尝试失败" + Style.RESET_ALL)
+
+
+def parse_raw_path(url):
+    """
+    将文件地址转换为 raw.githubusercontent.com 上的路径
+
+    支持 raw.githubusercontent.com 地址、github.com 上的 blob/raw 地址，
+    以及 owner/repo/ref/文件路径 形式的简写。
+
+    Args:
+        url (str): 文件地址
+
+    Returns:
+        str or None: owner/repo/ref/文件路径，无法识别时返回None
+    """
+    path = url.split('://', 1)[1] if '://' in url else 'raw.githubusercontent.com/' + url
+    host, _, path = path.partition('/')
+    parts = path.split('?')[0].split('/')
+    if host == 'github.com' and len(parts) >= 5 and parts[2] in ('blob', 'raw'):
+        parts = parts[:2] + parts[3:]
+    elif host != 'raw.githubusercontent.com':
+        return None
+    if len(parts) < 4 or not all(parts):
+        return None
+    return '/'.join(parts)
+
+
+def file_sha256(file_path):
+    """计算文件的 SHA-256 摘要"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while data := f.read(1024 * 1024):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def git_blob_sha(file_path):
+    """计算文件作为 git blob 对象的 SHA-1"""
+    digest = hashlib.sha1(f"blob {os.path.getsize(file_path)}\0".encode())
+    with open(file_path, 'rb') as f:
+        while data := f.read(1024 * 1024):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def parse_manifest(manifest_path):
+    """
+    解析批量操作清单
+
+    每行格式为 `<仓库URL> [分支] [目标目录]`，分支可写作 `-` 表示使用默认分支，
+    空行和 # 开头的行会被忽略。
+
+    Args:
+        manifest_path (str): 清单文件路径
+
+    Returns:
+        list: [{'url': ..., 'branch': ..., 'path': ...}, ...]
+    """
+    entries = []
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            fields = line.split('#', 1)[0].split()
+            if not fields:
+                continue
+            url = normalize_repo_url(fields[0])
+            branch = fields[1] if len(fields) > 1 and fields[1] != '-' else None
+            target = fields[2] if len(fields) > 2 else url.split('/')[-1]
+            entries.append({'url': url, 'branch': branch, 'path': os.path.join(os.getcwd(), target)})
+    return entries
+
+
 def handle_clone(args, unknown_args, config, env, verbose, proxy):
     """处理克隆命令"""
     if unknown_args is None or len(unknown_args) < 1:
@@ -156,34 +701,42 @@ def handle_clone(args, unknown_args, config, env, verbose, proxy):
         logger.warning(Fore.YELLOW + f"😪 仓库 {repo_name} 已存在" + Style.RESET_ALL)
         return
     
-    repo_status = get_repo(original_url)
-    if repo_status is None:
-        logger.warning(Fore.YELLOW + "🧐 无法获取到仓库信息, 尝试克隆" + Style.RESET_ALL)
-    elif repo_status is False and not input_with_timeout(Fore.YELLOW + "🧐 仓库可能不存在，5秒内按任意键忽略..." + Style.RESET_ALL, 5):
+    # 代理模式下只有代理失败时才需要镜像源
+    health = HealthStore()
+    proceed, mirror_list = check_repo(config, verbose, health, original_url, '克隆', select=not proxy.proxy_url)
+    if not proceed:
         return
-    
+
     # 如果设置了代理，则优先使用代理模式
     if proxy.proxy_url:
         cmd = ['git', 'clone', original_url] + unknown_args[1:]
-        result = subprocess.run(cmd, env=env, check=False)
+        start = time.monotonic()
+        with telemetry.phase('git'):
+            result = subprocess.run(cmd, env=env, check=False)
+        telemetry.attempt('proxy', result.returncode == 0, seconds=time.monotonic() - start,
+                          error=f'git-exit-{result.returncode}')
         if result.returncode == 0:
             return
         else:
             logger.error(Fore.RED + "❌ 在代理模式下克隆失败, 尝试使用镜像模式..." + Style.RESET_ALL)
             
     # 使用镜像源尝试克隆
-    mirror_list = select_mirror(config, verbose)
-    for mirror in mirror_list:
-        new_url = convert_url(original_url, mirror)
-        logger.info(Fore.GREEN + f"🔄 尝试镜像源 {mirror} [{mirror_list.index(mirror) + 1}/{len(mirror_list)}]: {new_url}" + Style.RESET_ALL)
-        cmd = ['git', 'clone', new_url] + unknown_args[1:]
-        result = subprocess.run(cmd, env=env, check=False)
-        if result.returncode == 0:
-            # 克隆成功后，将远程仓库地址还原为原始地址
-            subprocess.run(['git', '-C', repo_path, 'remote', 'set-url', remote_name, original_url], check=True)
-            return
-            
-    logger.error(Fore.RED + "❌ 所有镜像源尝试失败" + Style.RESET_ALL)
+    mirror_list = mirror_list or select_mirror(config, verbose, health)
+    mirror_list = affinity.get_index().order(original_url, mirror_list)
+    mirror_list = race_mirror_list(args, config, mirror_list, GIT_ADVERTISEMENT_PREFIX,
+                                   lambda m: convert_url(original_url, m) + '.git/info/refs?service=git-upload-pack')
+    # 子模块与 LFS 对象在克隆完成后分别通过镜像源获取, 不由 git clone 直接连接 GitHub
+    pathspecs, update_args, clone_args = split_submodule_args(unknown_args[1:])
+    lfs = shutil.which('git-lfs') is not None
+    clone_env = dict(env, GIT_LFS_SKIP_SMUDGE='1') if lfs else env
+    mirror_args = clone_profile_args(args, config, original_url, clone_args)
+    mirror, _ = clone_cached(config, original_url, clone_args, repo_path, remote_name, mirror_list, clone_env, health,
+                             mirror_args=mirror_args)
+    if mirror is None:
+        logger.error(Fore.RED + "❌ 所有镜像源尝试失败" + Style.RESET_ALL)
+        return
+    jobs = args.jobs or int(config.get_clone_config().get('jobs', 4))
+    fetch_dependencies(repo_path, pathspecs, update_args, lfs, mirror_list, env, health, jobs)
 
 
 def handle_other_commands(args, unknown_args, config, env, verbose, proxy):
@@ -193,7 +746,11 @@ def handle_other_commands(args, unknown_args, config, env, verbose, proxy):
         return
         
     git_args = [args.command] + unknown_args
-    result = subprocess.run(['git'] + git_args, env=env, check=False)
+    start = time.monotonic()
+    with telemetry.phase('git'):
+        result = subprocess.run(['git'] + git_args, env=env, check=False)
+    telemetry.attempt('proxy' if proxy.proxy_url else 'direct', result.returncode == 0,
+                      seconds=time.monotonic() - start, error=f'git-exit-{result.returncode}')
     
     # 如果命令执行成功，直接返回
     if result.returncode == 0:
@@ -203,17 +760,342 @@ def handle_other_commands(args, unknown_args, config, env, verbose, proxy):
         logger.error(Fore.RED + "❌ 在代理模式下运行失败, 尝试使用镜像模式..." + Style.RESET_ALL)
         
     # 使用镜像源尝试执行命令
-    mirror_list = select_mirror(config, verbose)
+    health = HealthStore()
+    mirror_list = select_mirror(config, verbose, health)
+    remote_url = get_remote_url()
+    if remote_url and remote_url.startswith('https://github.com/'):
+        mirror_list = affinity.get_index().order(remote_url, mirror_list)
+        mirror_list = race_mirror_list(args, config, mirror_list, GIT_ADVERTISEMENT_PREFIX,
+                                       lambda m: convert_url(remote_url, m) + '.git/info/refs?service=git-upload-pack')
+    else:
+        remote_url = None
+    if run_with_mirrors(git_args, mirror_list, env, health, repo_url=remote_url) is None:
+        logger.error(Fore.RED + "❌ 所有镜像源尝试失败" + Style.RESET_ALL)
+
+
+def clone_profile_args(args, config, original_url, clone_args):
+    """
+    根据快速克隆配置生成每个镜像源的附加参数
+
+    只对声明支持 filter/shallow 能力的镜像源添加 --filter/--depth，
+    其余镜像源使用完整克隆。用户已指定相应参数时不再添加。
+
+    Args:
+        args (argparse.Namespace): 命令行参数
+        config (ConfigHandler): 配置处理器实例
+        original_url (str): 标准化后的仓库URL
+        clone_args (list): 用户传入的 git clone 参数
+
+    Returns:
+        callable or None: 镜像源名称到参数列表的函数，未启用快速克隆时返回None
+    """
+    clone_config = config.get_clone_config()
+    if not args.fast and clone_config.get('profile', 'full') != 'fast':
+        return None
+    filter_spec = '' if any(a.startswith('--filter') for a in clone_args) else clone_config.get('filter', 'blob:none')
+    depth = '' if any(a.startswith('--depth') for a in clone_args) else clone_config.get('depth', '')
+
+    def mirror_args(mirror):
+        caps = get_mirror_capabilities(config, mirror, original_url)
+        extra = []
+        if filter_spec and 'filter' in caps:
+            extra.append(f'--filter={filter_spec}')
+        if depth and 'shallow' in caps:
+            extra += ['--depth', depth]
+        if (filter_spec or depth) and not extra:
+            logger.info(Fore.YELLOW + f"🐢 镜像源 {mirror} 不支持部分克隆, 使用完整克隆" + Style.RESET_ALL)
+        return extra
+
+    return mirror_args
+
+
+def clone_cached(config, original_url, clone_args, repo_path, remote_name, mirror_list, env, health,
+                 limits=None, capture=False, mirror_args=None):
+    """
+    克隆仓库，启用 [cache] 时先增量更新本地裸仓库缓存，再通过 --reference --dissociate 复用其中的对象
+
+    参数与返回值同 clone_with_mirrors。
+    """
+    cache = RepoCache.from_config(config)
+    if cache is None:
+        return clone_with_mirrors(original_url, clone_args, repo_path, remote_name, mirror_list, env, health,
+                                  limits, capture, mirror_args)
+
+    try:
+        with cache.lock(original_url) as cache_path:
+            if cache.update(original_url, mirror_list, env, health):
+                clone_args = ['--reference', cache_path, '--dissociate'] + clone_args
+            return clone_with_mirrors(original_url, clone_args, repo_path, remote_name, mirror_list, env, health,
+                                      limits, capture, mirror_args)
+    finally:
+        cache.evict()
+
+
+def clone_with_mirrors(original_url, clone_args, repo_path, remote_name, mirror_list, env, health,
+                       limits=None, capture=False, mirror_args=None):
+    """
+    依次使用镜像源克隆仓库
+
+    Args:
+        original_url (str): 标准化后的仓库URL
+        clone_args (list): 传给 git clone 的其余参数
+        repo_path (str): 克隆的目标目录
+        remote_name (str): 远程仓库名称
+        mirror_list (list): 镜像源列表
+        env (dict): 环境变量
+        health (HealthStore): 健康记录
+        limits (dict): 镜像源名称到信号量的映射，用于限制每个镜像源的并发连接数
+        capture (bool): 是否捕获 git 输出（并发执行时避免输出交错）
+        mirror_args (callable): 根据镜像源名称返回附加 git clone 参数的函数
+
+    Returns:
+        tuple: (成功使用的镜像源, 仓库对象大小)，全部失败时镜像源为None
+    """
+    repo_index = affinity.get_index()
+    for index, mirror in enumerate(mirror_list):
+        new_url = convert_url(original_url, mirror)
+        logger.info(Fore.GREEN + f"🔄 尝试镜像源 {mirror} [{index + 1}/{len(mirror_list)}]: {new_url}" + Style.RESET_ALL)
+        cmd = ['git', 'clone', new_url] + (mirror_args(mirror) if mirror_args else []) + clone_args
+        # 最后一个镜像源不做停滞判定, 慢速传输也好过失败
+        policy = stall.policy('clone') if index < len(mirror_list) - 1 else None
+        with (limits or {}).get(mirror, nullcontext()), scheduler.transfer(new_url), telemetry.phase('git'):
+            start = time.monotonic()
+            result = stall.run(cmd, 'clone', policy, env=env, capture=capture)
+        if result.stalled:
+            logger.warning(Fore.YELLOW + f"🐢 镜像源 {mirror} 传输停滞 ({result.stalled}), 切换到下一个镜像源" + Style.RESET_ALL)
+            health.record(mirror, False, seconds=time.monotonic() - start, error='stall')
+            repo_index.record(original_url, mirror, False)
+            # 被终止的 git clone 可能来不及删除未完成的目录
+            if os.path.exists(repo_path):
+                shutil.rmtree(repo_path, ignore_errors=True)
+            continue
+        if result.returncode == 0:
+            size = get_dir_size(os.path.join(repo_path, '.git', 'objects'))
+            health.record(mirror, True, size, time.monotonic() - start)
+            repo_index.record(original_url, mirror, True, size, time.monotonic() - start)
+            # 克隆成功后，将远程仓库地址还原为原始地址
+            subprocess.run(['git', '-C', repo_path, 'remote', 'set-url', remote_name, original_url], check=True)
+            return mirror, size
+        health.record(mirror, False, error=f'git-exit-{result.returncode}')
+        repo_index.record(original_url, mirror, False)
+        if capture:
+            logger.debug(result.stderr.strip())
+    return None, 0
+
+
+def run_with_mirrors(git_args, mirror_list, env, health, cwd=None, limits=None, capture=False, repo_url=None):
+    """
+    依次使用镜像源执行 pull、push、fetch 等命令
+
+    Args:
+        git_args (list): git 命令及参数
+        mirror_list (list): 镜像源列表
+        env (dict): 环境变量
+        health (HealthStore): 健康记录
+        cwd (str): 仓库目录，默认为当前目录
+        limits (dict): 镜像源名称到信号量的映射，用于限制每个镜像源的并发连接数
+        capture (bool): 是否捕获 git 输出（并发执行时避免输出交错）
+        repo_url (str): GitHub 仓库URL，提供时将结果写入亲和记录
+
+    Returns:
+        str or None: 成功使用的镜像源，全部失败时返回None
+    """
+    for index, mirror in enumerate(mirror_list):
+        # 停滞时仓库中已有的对象不受影响, 直接在原仓库中改用下一个镜像源
+        policy = stall.policy(git_args[0]) if index < len(mirror_list) - 1 else None
+        with (limits or {}).get(mirror, nullcontext()), scheduler.transfer(MIRRORS[mirror]), telemetry.phase('git'):
+            start = time.monotonic()
+            result = stall.run(['git'] + mirror_config_args(mirror) + git_args, git_args[0], policy, env=env, cwd=cwd,
+                               capture=capture)
+        health.record(mirror, result.returncode == 0 and not result.stalled, seconds=time.monotonic() - start,
+                      error='stall' if result.stalled else f'git-exit-{result.returncode}')
+        if repo_url:
+            affinity.get_index().record(repo_url, mirror, result.returncode == 0 and not result.stalled)
+        if result.stalled:
+            logger.warning(Fore.YELLOW + f"🐢 镜像源 {mirror} 传输停滞 ({result.stalled}), 切换到下一个镜像源" + Style.RESET_ALL)
+            continue
+        if result.returncode == 0:
+            return mirror
+        if capture:
+            logger.debug(result.stderr.strip())
+    return None
+
+
+def split_submodule_args(clone_args):
+    """
+    从 git clone 参数中分离子模块相关参数
+
+    Args:
+        clone_args (list): 用户传入的 git clone 参数
+
+    Returns:
+        tuple: (子模块路径规格列表，未指定 --recurse-submodules 时为None,
+                git submodule update 的附加参数, 其余 git clone 参数)
+    """
+    pathspecs = None
+    update_args = []
+    rest = []
+    for arg in clone_args:
+        if arg in ('--recursive', '--recurse-submodules'):
+            pathspecs = pathspecs or []
+        elif arg.startswith(('--recursive=', '--recurse-submodules=')):
+            pathspecs = (pathspecs or []) + [arg.split('=', 1)[1]]
+        elif arg == '--shallow-submodules':
+            update_args += ['--depth', '1']
+        elif arg == '--remote-submodules':
+            update_args.append('--remote')
+        else:
+            rest.append(arg)
+    return pathspecs, update_args, rest
+
+
+def fetch_dependencies(repo_path, pathspecs, update_args, lfs, mirror_list, env, health, jobs):
+    """
+    克隆完成后并发获取子模块与 LFS 对象，每个子模块与每个仓库的 LFS 对象独立地依次尝试镜像源
+
+    Args:
+        repo_path (str): 仓库目录
+        pathspecs (list): 子模块路径规格，None 表示不获取子模块
+        update_args (list): git submodule update 的附加参数
+        lfs (bool): 是否获取 LFS 对象
+        mirror_list (list): 镜像源列表
+        env (dict): 环境变量
+        health (HealthStore): 健康记录
+        jobs (int): 并发数
+
+    Returns:
+        bool: 是否全部成功
+    """
+    succeeded = True
+    repo_paths = [repo_path]
+    if pathspecs is not None:
+        subprocess.run(['git', '-C', repo_path, 'submodule', 'init', '--quiet', '--'] + pathspecs, check=False)
+        submodules = list_submodules(repo_path, pathspecs)
+        if submodules:
+            logger.info(Fore.CYAN + f"📦 获取 {len(submodules)} 个子模块, 并发数 {jobs}" + Style.RESET_ALL)
+            update_env = dict(env, GIT_LFS_SKIP_SMUDGE='1') if lfs else env
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(lambda item: update_submodule(repo_path, item[0], item[1], update_args,
+                                                                          mirror_list, update_env, health),
+                                            submodules))
+            succeeded = all(results)
+            status = subprocess.run(['git', '-C', repo_path, 'submodule', 'status', '--recursive'],
+                                    capture_output=True, text=True, check=False)
+            repo_paths += [os.path.join(repo_path, line[1:].split()[1]) for line in status.stdout.splitlines()
+                           if line and not line.startswith('-')]
+
+    if lfs:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(lambda path: pull_lfs(path, mirror_list, env, jobs), repo_paths))
+        succeeded = succeeded and all(results)
+    return succeeded
+
+
+def list_submodules(repo_path, pathspecs):
+    """
+    列出已初始化的子模块
+
+    Args:
+        repo_path (str): 仓库目录
+        pathspecs (list): 子模块路径规格，为空时列出全部
+
+    Returns:
+        list: [(子模块名称, 路径), ...]
+    """
+    result = subprocess.run(['git', '-C', repo_path, 'config', '--file', '.gitmodules', '--get-regexp',
+                             r'^submodule\..*\.path$'], capture_output=True, text=True, check=False)
+    submodules = []
+    for line in result.stdout.splitlines():
+        key, _, path = line.partition(' ')
+        name = key[len('submodule.'):-len('.path')]
+        if pathspecs and not any(fnmatch(path, spec) or path.startswith(spec.rstrip('/') + '/') or path == spec
+                                 for spec in pathspecs):
+            continue
+        submodules.append((name, path))
+    return submodules
+
+
+def update_submodule(repo_path, name, path, update_args, mirror_list, env, health):
+    """
+    依次使用镜像源克隆单个子模块，嵌套的子模块使用同一个镜像源
+
+    只有 GitHub 上的子模块通过镜像源获取，其余子模块直接连接。
+
+    Args:
+        repo_path (str): 上级仓库目录
+        name (str): 子模块名称
+        path (str): 子模块路径
+        update_args (list): git submodule update 的附加参数
+        mirror_list (list): 镜像源列表
+        env (dict): 环境变量
+        health (HealthStore): 健康记录
+
+    Returns:
+        bool: 是否成功
+    """
+    url = subprocess.run(['git', '-C', repo_path, 'config', f'submodule.{name}.url'],
+                         capture_output=True, text=True, check=False).stdout.strip()
+    mirrors = affinity.get_index().order(url, mirror_list) if url.startswith('https://github.com/') else [None]
+    for index, mirror in enumerate(mirrors):
+        cmd = ['git', '-C', repo_path] + (mirror_config_args(mirror) if mirror else []) + \
+              ['submodule', 'update', '--recursive'] + update_args + ['--', path]
+        policy = stall.policy('submodule') if index < len(mirrors) - 1 else None
+        with scheduler.transfer(MIRRORS[mirror] if mirror else url), telemetry.phase('git'):
+            start = time.monotonic()
+            result = stall.run(cmd, 'submodule', policy, env=env, capture=True)
+        success = result.returncode == 0 and not result.stalled
+        error = 'stall' if result.stalled else f'git-exit-{result.returncode}'
+        if mirror:
+            health.record(mirror, success, seconds=time.monotonic() - start, error=error)
+            affinity.get_index().record(url, mirror, success)
+        else:
+            telemetry.attempt('direct', success, seconds=time.monotonic() - start, error=error)
+        if success:
+            logger.info(Fore.GREEN + f"✅ 子模块 {path} ({mirror or url})" + Style.RESET_ALL)
+            return True
+        logger.debug(result.stderr.strip())
+        if mirror and index < len(mirrors) - 1:
+            logger.warning(Fore.YELLOW + f"🐢 子模块 {path} 通过 {mirror} 获取失败, 切换到下一个镜像源" + Style.RESET_ALL)
+        # 清理未完成的克隆, 以便下一个镜像源重新克隆
+        if not os.path.exists(os.path.join(repo_path, path, '.git')):
+            shutil.rmtree(os.path.join(repo_path, '.git', 'modules', name), ignore_errors=True)
+    logger.error(Fore.RED + f"❌ 子模块 {path} 获取失败" + Style.RESET_ALL)
+    return False
+
+
+def pull_lfs(repo_path, mirror_list, env, jobs):
+    """
+    依次使用镜像源拉取仓库的 LFS 对象
+
+    只有 git-lfs 的批量 API 请求经 url.insteadOf 重定向到镜像源，API 返回的对象下载地址指向
+    GitHub 的 LFS 存储，不经过镜像源。因此 LFS 下载不计入镜像源的健康记录，也不占用镜像源的传输名额。
+
+    Args:
+        repo_path (str): 仓库目录
+        mirror_list (list): 镜像源列表
+        env (dict): 环境变量
+        jobs (int): 并发下载数
+
+    Returns:
+        bool: 是否成功，没有 LFS 文件时返回True
+    """
+    files = subprocess.run(['git', '-C', repo_path, 'lfs', 'ls-files', '--name-only'],
+                           capture_output=True, text=True, check=False).stdout.split()
+    if not files:
+        return True
+    logger.info(Fore.CYAN + f"📦 {os.path.basename(repo_path)}: 拉取 {len(files)} 个 LFS 文件 "
+                f"(文件内容直接从 GitHub LFS 存储下载, 不经过镜像源)" + Style.RESET_ALL)
     for mirror in mirror_list:
-        modify_git_config(mirror)
-        try:
-            result = subprocess.run(['git'] + git_args, env=env, check=False)
-            if result.returncode == 0:
-                return
-        finally:
-            restore_git_config()
-            
-    logger.error(Fore.RED + "❌ 所有镜像源尝试失败" + Style.RESET_ALL)
+        with telemetry.phase('lfs'):
+            result = subprocess.run(['git', '-C', repo_path, '-c', f'lfs.concurrenttransfers={jobs}'] +
+                                    mirror_config_args(mirror) + ['lfs', 'pull'],
+                                    env=env, capture_output=True, text=True, check=False)
+        if result.returncode == 0:
+            return True
+        logger.debug(result.stderr.strip())
+        logger.warning(Fore.YELLOW + f"🐢 {os.path.basename(repo_path)}: 通过 {mirror} 拉取 LFS 文件失败" + Style.RESET_ALL)
+    logger.error(Fore.RED + f"❌ {os.path.basename(repo_path)}: LFS 文件拉取失败" + Style.RESET_ALL)
+    return False
 
 
 def normalize_repo_url(url):
@@ -226,60 +1108,79 @@ def normalize_repo_url(url):
     return url.split('.git')[0]
 
 
-def get_repo(repo_url):
+def check_repo(config, verbose, health, original_url, action, select=True):
     """
-    获取仓库信息
-    
+    检查仓库是否存在，同时在后台选择镜像源
+
     Args:
-        repo_url (str): 仓库URL
-        
+        config (ConfigHandler): 配置处理器实例
+        verbose (bool): 是否显示详细信息
+        health (HealthStore): 健康记录
+        original_url (str): 标准化后的仓库URL
+        action (str): 提示信息中的操作名称
+        select (bool): 是否同时选择镜像源
+
     Returns:
-        bool or None: True表示仓库存在，False表示仓库不存在，None表示获取信息失败
+        tuple: (是否继续, 镜像源列表)，不选择镜像源时列表为None
     """
-    clean_url = repo_url.split('.git')[0] if repo_url.endswith('.git') else repo_url
-    
-    # 处理 URL 形式的仓库名
-    if '://' in clean_url and '/' in clean_url:
-        clean_url = clean_url.split('/')[-2] + '/' + clean_url.split('/')[-1]
-        
-    logger.debug(Fore.CYAN + f"🔍 正在获取仓库: {clean_url}" + Style.RESET_ALL)
-    api_url = f"https://api.github.com/repos/{clean_url}"
-    req = Request(api_url, headers=HEADERS)
-    
-    try:
-        with urlopen(req) as response:
-            if response.status == 200:
-                result = json.loads(response.read().decode())
-                logger.info(Fore.GREEN + f"✅ 获取到仓库信息: {result['full_name']}({result['id']})" + Style.RESET_ALL)
-                return True
-            elif response.status == 404:
-                logger.warning(Fore.RED + "❌ 获取仓库信息失败，该仓库可能不存在或未公开" + Style.RESET_ALL)
-                return False
-            else:
-                logger.debug(Fore.RED + f"❌ 获取仓库信息失败: {response.status} {response.reason}" + Style.RESET_ALL)
-                return None
-                
-    except HTTPError as e:
-        if e.code == 404:
-            logger.warning(Fore.RED + "❌ 获取仓库信息失败，该仓库可能不存在或未公开" + Style.RESET_ALL)
-            return False
-        else:
-            logger.debug(Fore.RED + f"❌ 获取仓库信息失败: {e}" + Style.RESET_ALL)
-            return None
-            
-    except Exception as e:
-        logger.debug(Fore.RED + f"❌ 获取仓库信息失败: {e}" + Style.RESET_ALL)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        mirror_future = executor.submit(select_mirror, config, verbose, health) if select else None
+        repo_status = GitHubAPI.from_config(config).get_repo(original_url)
+        mirror_list = mirror_future.result() if mirror_future else None
+
+    if repo_status is None:
+        logger.warning(Fore.YELLOW + f"🧐 无法获取到仓库信息, 尝试{action}" + Style.RESET_ALL)
+    elif repo_status is False and not input_with_timeout(Fore.YELLOW + "🧐 仓库可能不存在，5秒内按任意键忽略..." + Style.RESET_ALL, 5):
+        return False, mirror_list
+    return True, mirror_list
+
+
+def race_mirror_list(args, config, mirror_list, expect, build_url):
+    """
+    在启用竞速模式时对镜像源进行竞速排序
+
+    Args:
+        args (argparse.Namespace): 命令行参数
+        config (ConfigHandler): 配置处理器实例
+        mirror_list (list): 镜像源列表
+        expect (bytes): 响应内容必须以此开头
+        build_url (callable): 根据镜像源名称生成请求URL的函数
+
+    Returns:
+        list: 镜像源列表
+    """
+    race_config = config.get_race_config()
+    if not args.race and race_config.get('enabled', 'false').lower() != 'true':
+        return mirror_list
+    return race_mirrors(mirror_list, build_url,
+                        count=int(race_config.get('count', 3)),
+                        probe_bytes=int(race_config.get('probe_bytes', 16384)),
+                        min_speed=float(race_config.get('min_speed', 0)),
+                        timeout=float(race_config.get('timeout', 5)),
+                        expect=expect)
+
+
+def get_remote_url(remote='origin'):
+    """获取当前仓库远程地址的标准化形式，失败时返回None"""
+    result = subprocess.run(['git', 'remote', 'get-url', remote], capture_output=True, text=True, check=False)
+    if result.returncode != 0 or not result.stdout.strip():
         return None
+    return normalize_repo_url(result.stdout.strip())
 
 
-def modify_git_config(mirror):
-    """修改本地Git配置以使用镜像源"""
-    subprocess.run(['git', 'config', '--local', 'url.https://github.com/.insteadOf', f'https://{mirror}'])
+def mirror_config_args(mirror):
+    """
+    生成仅对本次 git 调用生效的镜像源重定向参数，不修改仓库配置
 
+    Args:
+        mirror (str): 镜像源名称
 
-def restore_git_config():
-    """恢复本地Git配置"""
-    subprocess.run(['git', 'config', '--local', '--unset', 'url.https://github.com/.insteadOf'])
+    Returns:
+        list: 如 ['-c', 'url.<镜像源>/.insteadOf=https://github.com/']，github 本身返回空列表
+    """
+    if mirror == 'github':
+        return []
+    return ['-c', f'url.{MIRRORS[mirror]}/.insteadOf=https://github.com/']
 
 
 def input_with_timeout(prompt, timeout):
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import threading
+from loguru import logger
+from utils.lock import FileLock
+from utils.github import repo_slug
+
+# 仓库记录的有效期（秒），过期后不再影响镜像源顺序
+AFFINITY_TTL = 7 * 24 * 3600
+# 仓库在某个镜像源上失败后，该镜像源排在最后的时长（秒）
+FAILURE_TTL = 24 * 3600
+# 最多保留的仓库数，超出后淘汰最久未更新的记录
+MAX_ENTRIES = 5000
+
+_index = None
+_index_lock = threading.Lock()
+
+
+class AffinityIndex:
+    """
+    仓库与镜像源的亲和记录
+
+    按 owner/repo 记录最近成功的镜像源、各镜像源的速度与失败时间，
+    使同一仓库（以及同一 owner 下的其他仓库）优先使用曾经成功的镜像源。
+    """
+
+    def __init__(self, path=None):
+        """
+        初始化亲和记录
+
+        Args:
+            path (str): 记录文件路径，默认为 ~/.fgit.affinity.json
+        """
+        self.path = path or os.path.expanduser('~/.fgit.affinity.json')
+        self.lock = threading.RLock()
+        self.repos = self._load()
+        self.dirty = set()
+
+    def _load(self):
+        """读取记录文件"""
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return {}
+
+    def record(self, repo_url, mirror, success, size=0, seconds=0):
+        """
+        记录仓库在镜像源上的一次操作结果
+
+        Args:
+            repo_url (str): 仓库URL或 owner/repo
+            mirror (str): 镜像源名称
+            success (bool): 是否成功
+            size (int): 传输的字节数，未知时为0
+            seconds (float): 耗时（秒）
+        """
+        slug = _key(repo_url)
+        now = time.time()
+        with self.lock:
+            entry = self.repos.setdefault(slug, {'last': None, 'mirrors': {}})
+            stats = entry['mirrors'].setdefault(mirror, {})
+            if success:
+                entry['last'] = mirror
+                stats.pop('failed', None)
+                stats['succeeded'] = now
+                if size and seconds > 0:
+                    stats['speed'] = size / seconds
+            else:
+                stats['failed'] = now
+            entry['updated'] = now
+            self.dirty.add(slug)
+            self.save()
+
+    def order(self, repo_url, mirrors):
+        """
+        按仓库的亲和记录对镜像源排序
+
+        最近成功的镜像源排在最前，其次是其他成功过的镜像源（按速度），然后是没有记录的镜像源（保持原有顺序），
+        最近在该仓库上失败的镜像源排在最后。没有该仓库的记录时参考同一 owner 下最近成功的镜像源。
+
+        Args:
+            repo_url (str): 仓库URL或 owner/repo
+            mirrors (list): 镜像源列表
+
+        Returns:
+            list: 排序后的镜像源列表
+        """
+        slug = _key(repo_url)
+        now = time.time()
+        with self.lock:
+            entry = self.repos.get(slug)
+            if not entry or now - entry.get('updated', 0) >= AFFINITY_TTL:
+                entry = self._owner_entry(slug.split('/')[0], now)
+            if not entry:
+                return list(mirrors)
+            stats = entry['mirrors']
+
+        def rank(item):
+            index, mirror = item
+            info = stats.get(mirror, {})
+            if now - info.get('failed', 0) < FAILURE_TTL:
+                return (3, info['failed'], index)
+            if mirror == entry['last']:
+                return (0, 0, index)
+            if 'succeeded' in info:
+                return (1, -info.get('speed', 0), index)
+            return (2, 0, index)
+
+        ordered = [mirror for _, mirror in sorted(enumerate(mirrors), key=rank)]
+        if ordered != list(mirrors):
+            logger.debug(f"🧭 {slug} 的镜像源亲和顺序: {ordered}")
+        return ordered
+
+    def _owner_entry(self, owner, now):
+        """同一 owner 下最近更新且未过期的仓库记录，只保留其最近成功的镜像源"""
+        candidates = [entry for slug, entry in self.repos.items()
+                      if slug.split('/')[0] == owner and entry.get('last')
+                      and now - entry.get('updated', 0) < AFFINITY_TTL]
+        if not candidates:
+            return None
+        entry = max(candidates, key=lambda e: e['updated'])
+        return {'last': entry['last'], 'mirrors': {entry['last']: entry['mirrors'][entry['last']]}}
+
+    def save(self):
+        """在文件锁内合并磁盘上的记录后写入，只覆盖本进程修改过的仓库"""
+        with self.lock:
+            if not self.dirty:
+                return
+            try:
+                with FileLock(self.path + '.lock'):
+                    repos = self._load()
+                    for slug in self.dirty:
+                        repos[slug] = self.repos[slug]
+                    if len(repos) > MAX_ENTRIES:
+                        for slug in sorted(repos, key=lambda s: repos[s].get('updated', 0))[:len(repos) - MAX_ENTRIES]:
+                            del repos[slug]
+                    tmp_path = self.path + '.tmp'
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        json.dump(repos, f)
+                    os.replace(tmp_path, self.path)
+                self.repos = repos
+                self.dirty.clear()
+            except OSError as e:
+                logger.debug(f"无法写入镜像源亲和记录: {e}")
+
+
+def get_index():
+    """
+    获取进程内共享的亲和记录
+
+    Returns:
+        AffinityIndex: 亲和记录
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = AffinityIndex()
+        return _index
+
+
+def _key(repo_url):
+    """仓库URL标准化为小写的 owner/repo"""
+    return repo_slug(repo_url.rstrip('/')).lower()
@@ -0,0 +1,633 @@
+import os
+import re
+import copy
+import gzip
+import zlib
+import queue
+import stat
+import shutil
+import struct
+import hashlib
+import tarfile
+import time
+import zipfile
+import threading
+
+# zip 各类记录的签名
+LOCAL_HEADER = b'PK\x03\x04'
+CENTRAL_HEADER = b'PK\x01\x02'
+DATA_DESCRIPTOR = b'PK\x07\x08'
+ZIP64_END = b'PK\x06\x06'
+ZIP64_LOCATOR = b'PK\x06\x07'
+END_OF_CENTRAL = b'PK\x05\x06'
+
+READ_SIZE = 64 * 1024
+# git archive 写入 zip 注释与 tar pax 全局头的提交 SHA
+COMMIT_RE = re.compile(r'[0-9a-f]{40}')
+# git 文件模式
+GIT_REGULAR = '100644'
+GIT_EXECUTABLE = '100755'
+GIT_SYMLINK = '120000'
+GIT_SUBMODULE = '160000'
+
+
+class ArchiveError(Exception):
+    """压缩包损坏或格式不受支持"""
+
+
+class HashingReader:
+    """顺序读取数据并同时计算 SHA-256，支持将多读的数据退回"""
+
+    def __init__(self, raw):
+        """
+        Args:
+            raw: 提供 read(n) 方法的文件对象
+        """
+        self.raw = raw
+        self.hash = hashlib.sha256()
+        self.pending = b''
+
+    def read(self, n=-1):
+        """读取最多 n 个字节，返回空字节串表示结束"""
+        if self.pending:
+            data, self.pending = (self.pending, b'') if n < 0 else (self.pending[:n], self.pending[n:])
+            return data
+        data = self.raw.read(n)
+        self.hash.update(data)
+        return data
+
+    def read_exact(self, n):
+        """读取恰好 n 个字节，数据不足时抛出 ArchiveError"""
+        data = b''
+        while len(data) < n:
+            chunk = self.read(n - len(data))
+            if not chunk:
+                raise ArchiveError("压缩包不完整")
+            data += chunk
+        return data
+
+    def unread(self, data):
+        """退回多读的数据"""
+        self.pending = data + self.pending
+
+    def drain(self):
+        """读取剩余的全部数据"""
+        while self.read(READ_SIZE):
+            pass
+
+
+class QueueReader:
+    """由下载线程写入、校验线程读取的阻塞式数据流"""
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=64)
+        self.buffer = b''
+        self.eof = False
+
+    def feed(self, data):
+        """写入一块数据"""
+        self.queue.put(data)
+
+    def close(self):
+        """写入结束标记"""
+        self.queue.put(None)
+
+    def read(self, n=-1):
+        """读取最多 n 个已到达的字节，没有数据时阻塞，返回空字节串表示结束"""
+        while not self.buffer and not self.eof:
+            item = self.queue.get()
+            if item is None:
+                self.eof = True
+            else:
+                self.buffer = item
+        if n < 0:
+            n = len(self.buffer)
+        data, self.buffer = self.buffer[:n], self.buffer[n:]
+        return data
+
+    def discard(self):
+        """丢弃剩余数据直到结束标记，避免写入方阻塞"""
+        while not self.eof:
+            self.buffer = b''
+            self.read()
+
+
+class StreamVerifier:
+    """在后台线程中边下载边校验（并解压）压缩包"""
+
+    def __init__(self, archive_format='zip', extract_to=None):
+        """
+        Args:
+            archive_format (str): 压缩包格式，zip 或 tar.gz
+            extract_to (str): 解压目录，None 表示只校验
+        """
+        self.reader = QueueReader()
+        self.digest = None
+        self.error = None
+        self.thread = threading.Thread(target=self._run, args=(archive_format, extract_to), daemon=True)
+        self.thread.start()
+
+    def _run(self, archive_format, extract_to):
+        try:
+            self.digest = verify_archive(self.reader, archive_format, extract_to)
+        except Exception as e:
+            self.error = e
+            self.reader.discard()
+
+    def feed(self, data):
+        """写入下载到的数据"""
+        self.reader.feed(data)
+
+    def abort(self):
+        """结束输入并等待后台线程退出，忽略校验结果"""
+        self.reader.close()
+        self.thread.join()
+
+    def finish(self):
+        """
+        结束输入并等待校验完成
+
+        Returns:
+            str: SHA-256 摘要
+
+        Raises:
+            ArchiveError: 压缩包无效
+        """
+        self.abort()
+        if self.error is not None:
+            raise self.error if isinstance(self.error, ArchiveError) else ArchiveError(str(self.error))
+        return self.digest
+
+
+def verify_archive(fileobj, archive_format='zip', extract_to=None):
+    """
+    顺序读取一遍压缩包，校验每个文件的 CRC 与目录结构，可同时解压
+
+    Args:
+        fileobj: 提供 read(n) 方法的文件对象
+        archive_format (str): 压缩包格式，zip 或 tar.gz，None 表示不是压缩包，只计算摘要
+        extract_to (str): 解压目录，None 表示只校验
+
+    Returns:
+        str: 整个文件的 SHA-256 摘要
+
+    Raises:
+        ArchiveError: 压缩包无效
+    """
+    reader = HashingReader(fileobj)
+    if archive_format == 'zip':
+        _verify_zip(reader, extract_to)
+    elif archive_format == 'tar.gz':
+        _verify_tar_gz(reader, extract_to)
+    elif archive_format is not None:
+        raise ArchiveError(f"不支持的压缩包格式: {archive_format}")
+    reader.drain()
+    return reader.hash.hexdigest()
+
+
+def _verify_zip(reader, extract_to):
+    """按顺序解析 zip 的本地文件记录与中央目录"""
+    entries = {}
+    signature = reader.read_exact(4)
+    if signature not in (LOCAL_HEADER, END_OF_CENTRAL):
+        raise ArchiveError("文件开头不是 zip 记录")
+    while signature == LOCAL_HEADER:
+        name, crc = _read_local_entry(reader, extract_to)
+        entries[name] = crc
+        signature = reader.read_exact(4)
+
+    count = 0
+    while signature == CENTRAL_HEADER:
+        header = struct.unpack('<HHHHHHIIIHHHHHII', reader.read_exact(42))
+        crc, name_len, extra_len, comment_len = header[6], header[9], header[10], header[11]
+        name = reader.read_exact(name_len).decode('utf-8', 'replace')
+        reader.read_exact(extra_len + comment_len)
+        if entries.get(name) != crc:
+            raise ArchiveError(f"中央目录与文件记录不一致: {name}")
+        if extract_to is not None and header[0] >> 8 == 3 and not name.endswith('/'):
+            # 权限只记录在中央目录中, 文件数据已全部解压后再应用
+            _apply_unix_mode(extract_to, name, header[14] >> 16)
+        count += 1
+        signature = reader.read_exact(4)
+
+    if signature == ZIP64_END:
+        size = struct.unpack('<Q', reader.read_exact(8))[0]
+        reader.read_exact(size)
+        signature = reader.read_exact(4)
+    if signature == ZIP64_LOCATOR:
+        reader.read_exact(16)
+        signature = reader.read_exact(4)
+    if signature != END_OF_CENTRAL:
+        raise ArchiveError("缺少中央目录结束记录")
+    header = struct.unpack('<HHHHIIH', reader.read_exact(18))
+    total, comment_len = header[3], header[6]
+    if count != len(entries) or (total != 0xFFFF and total != count):
+        raise ArchiveError("中央目录记录数量不一致")
+    # 注释（git archive 写入提交 SHA）必须完整, 且之后没有多余的数据
+    reader.read_exact(comment_len)
+    if reader.read(1):
+        raise ArchiveError("中央目录结束记录之后有多余的数据")
+
+
+def _read_local_entry(reader, extract_to):
+    """
+    读取一个本地文件记录及其数据，校验 CRC
+
+    Returns:
+        tuple: (文件名, CRC)
+    """
+    flags, method, crc, compressed_size, size, name_len, extra_len = \
+        struct.unpack('<2xHH4xIIIHH', reader.read_exact(26))
+    name = reader.read_exact(name_len).decode('utf-8' if flags & 0x800 else 'cp437')
+    extra = reader.read_exact(extra_len)
+    if flags & 0x1:
+        raise ArchiveError(f"不支持加密的文件: {name}")
+
+    zip64 = False
+    pos = 0
+    while pos + 4 <= len(extra):
+        tag, length = struct.unpack('<HH', extra[pos:pos + 4])
+        if tag == 0x0001:
+            zip64 = True
+            values = extra[pos + 4:pos + 4 + length]
+            if size == 0xFFFFFFFF:
+                size, values = struct.unpack('<Q', values[:8])[0], values[8:]
+            if compressed_size == 0xFFFFFFFF:
+                compressed_size = struct.unpack('<Q', values[:8])[0]
+        pos += 4 + length
+
+    out = _open_output(extract_to, name)
+    try:
+        actual_crc = 0
+        if method == 0:
+            if flags & 0x8:
+                raise ArchiveError(f"无法流式读取未压缩且无大小信息的文件: {name}")
+            remaining = compressed_size
+            while remaining:
+                data = reader.read(min(remaining, READ_SIZE))
+                if not data:
+                    raise ArchiveError("压缩包不完整")
+                remaining -= len(data)
+                actual_crc = zlib.crc32(data, actual_crc)
+                if out:
+                    out.write(data)
+        elif method == 8:
+            decompressor = zlib.decompressobj(-15)
+            remaining = None if flags & 0x8 else compressed_size
+            while not decompressor.eof:
+                data = reader.read(READ_SIZE if remaining is None else min(remaining, READ_SIZE))
+                if not data:
+                    raise ArchiveError("压缩包不完整")
+                if remaining is not None:
+                    remaining -= len(data)
+                output = decompressor.decompress(data)
+                actual_crc = zlib.crc32(output, actual_crc)
+                if out:
+                    out.write(output)
+            reader.unread(decompressor.unused_data)
+        else:
+            raise ArchiveError(f"不支持的压缩方式 {method}: {name}")
+    finally:
+        if out:
+            out.close()
+
+    if flags & 0x8:
+        descriptor = reader.read_exact(4)
+        if descriptor == DATA_DESCRIPTOR:
+            descriptor = reader.read_exact(4)
+        crc = struct.unpack('<I', descriptor)[0]
+        reader.read_exact(16 if zip64 else 8)
+    if actual_crc != crc:
+        raise ArchiveError(f"CRC 校验失败: {name}")
+    return name, crc
+
+
+def _verify_tar_gz(reader, extract_to):
+    """流式读取 tar.gz，gzip 在结束时校验 CRC，tar 校验每个文件头"""
+    try:
+        gz = gzip.GzipFile(fileobj=reader, mode='rb')
+        with tarfile.open(fileobj=gz, mode='r|') as tar:
+            for member in tar:
+                if extract_to is None:
+                    if member.isfile():
+                        source = tar.extractfile(member)
+                        while source.read(READ_SIZE):
+                            pass
+                    continue
+                if hasattr(tarfile, 'data_filter'):
+                    tar.extract(member, extract_to, filter='data')
+                    continue
+                # 旧版本 Python 没有解压过滤器, 手动检查路径
+                _safe_path(extract_to, member.name)
+                if member.issym():
+                    _safe_path(extract_to, os.path.join(os.path.dirname(member.name), member.linkname))
+                elif member.islnk():
+                    _safe_path(extract_to, member.linkname)
+                tar.extract(member, extract_to)
+        # 读到 gzip 结尾才会校验 CRC 与长度
+        while gz.read(READ_SIZE):
+            pass
+    except (tarfile.TarError, EOFError, OSError, zlib.error) as e:
+        raise ArchiveError(str(e))
+
+
+def _apply_unix_mode(extract_to, name, mode):
+    """
+    为已解压的文件应用 zip 中记录的 Unix 权限，与 tar.gz 的解压及 patch_tree 的行为一致：
+    符号链接（内容为链接目标）重新创建为链接，可执行文件在可读的位上加上可执行权限，其余文件去掉可执行权限
+
+    Args:
+        extract_to (str): 解压目录
+        name (str): 文件名
+        mode (int): external_attr 高 16 位中的 Unix 文件类型与权限
+    """
+    path = _safe_path(extract_to, name)
+    if stat.S_ISLNK(mode):
+        with open(path, 'r', encoding='utf-8') as f:
+            target = f.read()
+        # 链接目标同样不能指向解压目录之外
+        _safe_path(extract_to, os.path.join(os.path.dirname(name), target))
+        try:
+            os.symlink(target, path + '.link')
+            os.replace(path + '.link', path)
+        except OSError:
+            # 不支持符号链接时（如未开启开发者模式的 Windows）保留内容为链接目标的普通文件
+            pass
+    elif stat.S_ISREG(mode):
+        current = os.stat(path).st_mode & 0o777
+        os.chmod(path, current | (current & 0o444) >> 2 if mode & 0o100 else current & ~0o111)
+
+
+def _open_output(extract_to, name):
+    """为解压创建目标文件，目录记录只创建目录，返回None"""
+    if extract_to is None:
+        return None
+    path = _safe_path(extract_to, name)
+    if name.endswith('/'):
+        os.makedirs(path, exist_ok=True)
+        return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return open(path, 'wb')
+
+
+def _safe_path(root, name):
+    """拼接解压路径，拒绝指向解压目录之外的文件名"""
+    root = os.path.abspath(root)
+    path = os.path.abspath(os.path.join(root, name))
+    if os.path.commonpath([root, path]) != root:
+        raise ArchiveError(f"不安全的文件路径: {name}")
+    return path
+
+
+def archive_info(path, archive_format='zip'):
+    """
+    读取 git archive 生成的压缩包的提交 SHA、顶层目录与文件列表
+
+    git archive（包括 GitHub 的仓库压缩包）会把提交 SHA 写入 zip 注释或 tar 的 pax 全局头。
+
+    Args:
+        path (str): 压缩包路径
+        archive_format (str): 压缩包格式，zip 或 tar.gz
+
+    Returns:
+        dict or None: {'commit': 提交 SHA, 'prefix': 顶层目录（含末尾的 /）, 'files': 去掉顶层目录的文件路径集合}，
+            无法读取或没有记录提交时返回None
+    """
+    try:
+        if archive_format == 'zip':
+            with zipfile.ZipFile(path) as archive:
+                commit = archive.comment.decode('ascii', 'replace')
+                names = [(info.filename, info.is_dir()) for info in archive.infolist()]
+        else:
+            with tarfile.open(path, 'r:gz') as archive:
+                names = [(member.name + ('/' if member.isdir() else ''), member.isdir()) for member in archive]
+                commit = archive.pax_headers.get('comment', '')
+    except (OSError, EOFError, zlib.error, zipfile.BadZipFile, tarfile.TarError):
+        return None
+    if not COMMIT_RE.fullmatch(commit) or not names:
+        return None
+    prefix = names[0][0].split('/')[0] + '/'
+    if not all(name.startswith(prefix) for name, _ in names):
+        return None
+    return {'commit': commit, 'prefix': prefix,
+            'files': {name[len(prefix):] for name, is_dir in names if not is_dir}}
+
+
+def patch_archive(path, archive_format, commit, files, removed, modes, mtime):
+    """
+    用变更的文件重新生成压缩包，未变更的文件从原压缩包复制
+
+    变更文件的类型与权限按 git 文件模式重新生成，与 git archive 的规则一致；
+    只剩空目录的目录记录会被删除，新文件所在的目录会补上目录记录。
+
+    Args:
+        path (str): 压缩包路径，成功后原地替换
+        archive_format (str): 压缩包格式，zip 或 tar.gz
+        commit (str): 新的提交 SHA，写入注释
+        files (dict): 去掉顶层目录的文件路径到新内容所在文件的映射
+        removed (set): 去掉顶层目录的已删除文件路径
+        modes (dict): 变更文件路径到 git 文件模式（100644、100755 或 120000）的映射
+        mtime (float): 新文件与新目录的修改时间
+
+    Raises:
+        ArchiveError: 原压缩包无效
+    """
+    info = archive_info(path, archive_format)
+    if info is None:
+        raise ArchiveError(f"无法读取压缩包 {path}")
+    prefix = info['prefix']
+    keep = (info['files'] - set(removed)) | set(files)
+    dirs = {prefix}
+    for name in keep:
+        parts = name.split('/')[:-1]
+        dirs.update(prefix + '/'.join(parts[:i + 1]) + '/' for i in range(len(parts)))
+
+    tmp_path = path + '.tmp'
+    try:
+        if archive_format == 'zip':
+            _patch_zip(path, tmp_path, prefix, commit, files, set(removed), modes, dirs, mtime)
+        else:
+            _patch_tar_gz(path, tmp_path, prefix, commit, files, set(removed), modes, dirs, mtime)
+        os.replace(tmp_path, path)
+    except (OSError, EOFError, zlib.error, zipfile.BadZipFile, tarfile.TarError) as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise ArchiveError(str(e))
+
+
+def _merge_entries(existing, prefix, files, removed, dirs):
+    """
+    按原压缩包的顺序合并原有记录与新文件，新文件与新目录插入到按名称排序的位置
+
+    Yields:
+        tuple: (完整名称, 原记录或None, 新内容所在文件或None)
+    """
+    seen = set()
+    added = sorted([(prefix + name, source) for name, source in files.items()] +
+                   [(name, None) for name in dirs])
+    for name, entry in existing:
+        while added and added[0][0] < name:
+            new_name, source = added.pop(0)
+            if new_name not in seen:
+                seen.add(new_name)
+                yield new_name, None, source
+        relative = name[len(prefix):]
+        if name.endswith('/') and name not in dirs or relative in removed:
+            continue
+        seen.add(name)
+        yield name, entry, files.get(relative)
+    for name, source in added:
+        if name not in seen:
+            yield name, None, source
+
+
+def _patch_zip(path, tmp_path, prefix, commit, files, removed, modes, dirs, mtime):
+    """重新生成 zip，未变更的文件解压后重新压缩"""
+    date_time = time.localtime(mtime)[:6]
+    with zipfile.ZipFile(path) as src, zipfile.ZipFile(tmp_path, 'w') as dst:
+        existing = [(info.filename, info) for info in src.infolist()]
+        # 新目录的属性沿用原压缩包的顶层目录
+        dir_info = next((info for name, info in existing if name == prefix), None)
+        for name, old, source in _merge_entries(existing, prefix, files, removed, dirs):
+            if old is not None:
+                # 写入时会修改记录的偏移等字段, 使用副本以免影响读取
+                info = copy.copy(old)
+            else:
+                info = zipfile.ZipInfo(name, date_time)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = 0
+                if name.endswith('/'):
+                    info.external_attr = dir_info.external_attr if dir_info else 0x10
+                    info.create_system = dir_info.create_system if dir_info else 0
+                    info.create_version = dir_info.create_version if dir_info else 0
+            if name.endswith('/'):
+                attr = info.external_attr
+                dst.writestr(info, b'')
+            else:
+                if source is not None:
+                    info.date_time = date_time
+                    info.file_size = os.path.getsize(source)
+                    _set_zip_mode(info, modes[name[len(prefix):]])
+                attr = info.external_attr
+                reader = src.open(old) if source is None else open(source, 'rb')
+                with reader, dst.open(info, 'w', force_zip64=info.file_size > 0x7FFFFFFF) as writer:
+                    shutil.copyfileobj(reader, writer, READ_SIZE)
+            # zipfile 会为没有属性的记录补上默认权限, 属性只写入中央目录, 写入后还原
+            info.external_attr = attr
+        dst.comment = commit.encode('ascii')
+
+
+def _set_zip_mode(info, mode):
+    """
+    按 git archive 的规则设置 zip 记录的权限：普通文件不记录权限，
+    可执行文件与符号链接以 Unix 权限记录
+
+    Args:
+        info (zipfile.ZipInfo): zip 记录
+        mode (str): git 文件模式
+    """
+    if mode == GIT_REGULAR:
+        info.create_system, info.create_version, info.external_attr = 0, 0, 0
+    else:
+        attr = 0o120777 if mode == GIT_SYMLINK else 0o100755
+        info.create_system, info.create_version, info.external_attr = 3, 23, attr << 16
+
+
+def _patch_tar_gz(path, tmp_path, prefix, commit, files, removed, modes, dirs, mtime):
+    """重新生成 tar.gz，提交 SHA 写入 pax 全局头"""
+    with tarfile.open(path, 'r:gz') as src, \
+            tarfile.open(tmp_path, 'w:gz', format=tarfile.PAX_FORMAT, pax_headers={'comment': commit}) as dst:
+        existing = [(member.name + ('/' if member.isdir() else ''), member) for member in src]
+        # 新文件与新目录的属主与权限沿用原压缩包中的普通文件与顶层目录,
+        # 可执行文件在普通文件可读的位上加上可执行权限, 与 git archive 按 umask 生成的权限一致
+        dir_template = next((member for name, member in existing if name == prefix), tarfile.TarInfo())
+        file_template = next((member for name, member in existing if member.isfile() and not member.mode & 0o111),
+                             tarfile.TarInfo())
+        file_mode = file_template.mode
+        exec_mode = file_mode | (file_mode & 0o444) >> 2
+        for name, old, source in _merge_entries(existing, prefix, files, removed, dirs):
+            if source is None and old is not None:
+                dst.addfile(old, src.extractfile(old) if old.isfile() else None)
+                continue
+            member = copy.copy(dir_template if name.endswith('/') else file_template)
+            member.name = name.rstrip('/')
+            member.mtime = int(mtime)
+            # 模板的 pax 头（路径、大小、时间等）会覆盖新的字段, 写入时按需重新生成
+            member.pax_headers = {}
+            if name.endswith('/'):
+                member.type = tarfile.DIRTYPE
+                dst.addfile(member)
+                continue
+            mode = modes[name[len(prefix):]]
+            if mode == GIT_SYMLINK:
+                # 符号链接的 blob 内容即链接目标
+                member.type, member.mode, member.size = tarfile.SYMTYPE, 0o777, 0
+                with open(source, 'r', encoding='utf-8') as reader:
+                    member.linkname = reader.read()
+                dst.addfile(member)
+                continue
+            member.type = tarfile.REGTYPE
+            member.mode = exec_mode if mode == GIT_EXECUTABLE else file_mode
+            member.size = os.path.getsize(source)
+            with open(source, 'rb') as reader:
+                dst.addfile(member, reader)
+
+
+def patch_tree(root, files, removed, modes):
+    """
+    将变更应用到已解压的目录
+
+    Args:
+        root (str): 解压出的顶层目录
+        files (dict): 相对路径到新内容所在文件的映射
+        removed (set): 已删除文件的相对路径
+        modes (dict): 变更文件相对路径到 git 文件模式的映射
+    """
+    prune_tree(root, set(removed) - set(files))
+    for name, source in files.items():
+        target = _safe_path(root, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        link = None
+        if modes[name] == GIT_SYMLINK:
+            # 符号链接的 blob 内容即链接目标, 与解压时一样不能指向解压目录之外
+            with open(source, 'r', encoding='utf-8') as reader:
+                link = reader.read()
+            _safe_path(root, os.path.join(os.path.dirname(name), link))
+        if os.path.islink(target) or link is not None and os.path.lexists(target):
+            os.remove(target)
+        if link is not None:
+            os.symlink(link, target)
+            continue
+        shutil.copyfile(source, target)
+        # 可执行权限随 git 文件模式增减, 其余权限位保留
+        mode = os.stat(target).st_mode & 0o777
+        if modes[name] == GIT_EXECUTABLE:
+            os.chmod(target, mode | (mode & 0o444) >> 2)
+        else:
+            os.chmod(target, mode & ~0o111)
+
+
+def prune_tree(root, removed):
+    """
+    删除已解压目录中上游已删除的文件，以及因此变空的目录
+
+    只删除 removed 中的文件，用户新建的文件与构建产物不受影响。
+
+    Args:
+        root (str): 解压出的顶层目录
+        removed (set): 已删除文件的相对路径
+    """
+    for name in removed:
+        target = _safe_path(root, name)
+        if os.path.lexists(target) and not os.path.isdir(target):
+            os.remove(target)
+            _remove_empty_dirs(root, os.path.dirname(target))
+
+
+def _remove_empty_dirs(root, path):
+    """向上删除空目录，直到 root 为止"""
+    root = os.path.abspath(root)
+    path = os.path.abspath(path)
+    while path != root and os.path.commonpath([root, path]) == root and not os.listdir(path):
+        os.rmdir(path)
+        path = os.path.dirname(path)
@@ -0,0 +1,150 @@
+import os
+import time
+import shutil
+import subprocess
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from loguru import logger
+from colorama import Fore, Style
+from utils.lock import FileLock
+from utils.mirrors import convert_url
+from utils import telemetry, stall, affinity, scheduler
+
+# 记录最近一次使用时间的文件，用于 LRU 淘汰
+LAST_USED_FILE = 'fgit-last-used'
+
+
+class RepoCache:
+    """本地裸仓库缓存，克隆时通过 --reference 复用已下载的对象"""
+
+    def __init__(self, root, max_size):
+        """
+        初始化仓库缓存
+
+        Args:
+            root (str): 缓存目录
+            max_size (int): 缓存总大小上限（字节）
+        """
+        self.root = root
+        self.max_size = max_size
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        根据 [cache] 配置创建仓库缓存
+
+        Args:
+            config (ConfigHandler): 配置处理器实例
+
+        Returns:
+            RepoCache or None: 未启用缓存时返回None
+        """
+        cache_config = config.get_cache_config()
+        if cache_config.get('enabled', 'false').lower() != 'true':
+            return None
+        root = os.path.expanduser(cache_config.get('dir', '~/.fgit/cache'))
+        return cls(root, int(cache_config.get('max_size', 10240)) * 1024 * 1024)
+
+    def path_for(self, url):
+        """
+        获取仓库对应的缓存路径
+
+        Args:
+            url (str): 标准化后的仓库URL
+
+        Returns:
+            str: 裸仓库路径，如 <root>/github.com/owner/repo.git
+        """
+        parsed = urlparse(url)
+        return os.path.join(self.root, parsed.netloc, *parsed.path.strip('/').split('/')) + '.git'
+
+    @contextmanager
+    def lock(self, url):
+        """
+        锁定仓库缓存，防止其他进程同时更新或淘汰
+
+        Args:
+            url (str): 标准化后的仓库URL
+
+        Yields:
+            str: 裸仓库路径
+        """
+        path = self.path_for(url)
+        with FileLock(path + '.lock'):
+            yield path
+
+    @telemetry.phase('cache')
+    def update(self, url, mirror_list, env, health):
+        """
+        从镜像源增量拉取到缓存，调用方需持有该仓库的锁
+
+        Args:
+            url (str): 标准化后的仓库URL
+            mirror_list (list): 镜像源列表
+            env (dict): 环境变量
+            health (HealthStore): 健康记录
+
+        Returns:
+            bool: 缓存是否可用
+        """
+        path = self.path_for(url)
+        if not os.path.exists(os.path.join(path, 'HEAD')):
+            os.makedirs(path, exist_ok=True)
+            subprocess.run(['git', 'init', '--quiet', '--bare', path], check=True)
+
+        for index, mirror in enumerate(mirror_list):
+            logger.info(Fore.GREEN + f"📚 更新本地缓存 {path} ({mirror})" + Style.RESET_ALL)
+            start = time.monotonic()
+            with scheduler.transfer(convert_url(url, mirror)):
+                result = stall.run(['git', '-C', path, 'fetch', '--quiet', '--prune', '--tags',
+                                    convert_url(url, mirror), '+refs/heads/*:refs/heads/*'], 'fetch',
+                                   stall.policy('fetch') if index < len(mirror_list) - 1 else None, env=env)
+            health.record(mirror, result.returncode == 0 and not result.stalled,
+                          error='stall' if result.stalled else f'git-exit-{result.returncode}')
+            affinity.get_index().record(url, mirror, result.returncode == 0 and not result.stalled)
+            if result.stalled:
+                logger.warning(Fore.YELLOW + f"🐢 镜像源 {mirror} 传输停滞 ({result.stalled}), 切换到下一个镜像源" + Style.RESET_ALL)
+                continue
+            if result.returncode == 0:
+                with open(os.path.join(path, LAST_USED_FILE), 'w') as f:
+                    f.write(str(time.time()))
+                logger.debug(f"缓存更新耗时 {time.monotonic() - start:.1f}s")
+                return True
+        return False
+
+    def evict(self):
+        """按最近使用时间淘汰缓存，直到总大小不超过上限，正在使用的仓库会被跳过"""
+        entries = []
+        for dirpath, dirnames, _ in os.walk(self.root):
+            for name in [d for d in dirnames if d.endswith('.git')]:
+                path = os.path.join(dirpath, name)
+                last_used_path = os.path.join(path, LAST_USED_FILE)
+                last_used = os.path.getmtime(last_used_path) if os.path.exists(last_used_path) else 0
+                entries.append((last_used, path, get_dir_size(path)))
+            dirnames[:] = [d for d in dirnames if not d.endswith('.git')]
+
+        total = sum(size for _, _, size in entries)
+        for _, path, size in sorted(entries):
+            if total <= self.max_size:
+                break
+            lock = FileLock(path + '.lock')
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                logger.debug(f"🧹 淘汰缓存: {path}")
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+            finally:
+                lock.release()
+
+
+def get_dir_size(path):
+    """计算目录下所有文件的总大小（字节）"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
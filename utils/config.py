@@ -1,33 +1,73 @@
 import os
 import configparser
+import threading
 import time
+from utils.lock import FileLock
+
+DOWNLOADER_DEFAULTS = {'chunk_size': '1024', 'min_file_size': '100', 'segments': '4',
+                       'segment_size': str(4 * 1024 * 1024), 'incremental_max_files': '200'}
+
 
 class ConfigHandler:
-    """配置处理器，用于读取和保存用户配置"""
+    """
+    配置处理器，用于读取和保存用户配置
+
+    读取不加锁：写入总是先写临时文件再替换，其他进程只会读到完整的旧文件或新文件。
+    写入时在文件锁内重新读取最新的配置再修改，多个进程同时写入也不会丢失彼此的修改。
+    """
     
     def __init__(self):
         """初始化配置处理器"""
         self.config_file = os.path.expanduser('~/.fgit.conf')
         self.config = configparser.ConfigParser()
+        # 批量克隆时多个线程共用同一个配置处理器
+        self.lock = threading.Lock()
         self.load_config()
 
     def load_config(self):
         """加载配置文件"""
+        config = configparser.ConfigParser()
         if os.path.exists(self.config_file):
-            self.config.read(self.config_file)
+            config.read(self.config_file)
+        self.config = config
 
-    def get_mirrors(self):
+    def get_mirrors(self, allow_stale=False):
         """
         获取镜像源列表
         
+        Args:
+            allow_stale (bool): 是否返回已过期的缓存
+
         Returns:
             list or None: 镜像源列表，如果缓存过期或不存在则返回None
         """
-        if (self.config.has_option('mirrors', 'sorted') and 
-            time.time() - self.config.getfloat('mirrors', 'timestamp') < 3600):
+        if (self.config.has_option('mirrors', 'sorted') and self.config.get('mirrors', 'sorted') and
+            (allow_stale or time.time() - self.config.getfloat('mirrors', 'timestamp') < 3600)):
             return self.config.get('mirrors', 'sorted').split(',')
         return None
 
+    def refresh_lock(self):
+        """
+        获取镜像源测速的刷新者锁，持有该锁的进程负责测速，其他进程等待或继续使用旧的排序
+
+        Returns:
+            FileLock: 未加锁的文件锁
+        """
+        return FileLock(self.config_file + '.refresh.lock')
+
+    def refresh_running(self):
+        """
+        判断是否有其他进程正在测速
+
+        Returns:
+            bool: 刷新者锁被占用时返回True
+        """
+        lock = self.refresh_lock()
+        if lock.acquire(blocking=False):
+            lock.release()
+            return False
+        return True
+
     def save_mirrors(self, mirrors):
         """
         保存镜像源列表到配置文件
@@ -35,11 +75,46 @@ class ConfigHandler:
         Args:
             mirrors (list): 镜像源列表
         """
-        if not self.config.has_section('mirrors'):
-            self.config.add_section('mirrors')
-        self.config.set('mirrors', 'sorted', ','.join(mirrors))
-        self.config.set('mirrors', 'timestamp', str(time.time()))
-        self._save()
+        def update(config):
+            if not config.has_section('mirrors'):
+                config.add_section('mirrors')
+            config.set('mirrors', 'sorted', ','.join(mirrors))
+            config.set('mirrors', 'timestamp', str(time.time()))
+            # 旧版本记录的后台刷新时间, 已由刷新者锁代替
+            config.remove_option('mirrors', 'refreshing')
+
+        self._update(update)
+
+    def get_capabilities(self, mirror):
+        """
+        获取缓存的镜像源能力
+
+        Args:
+            mirror (str): 镜像源名称
+
+        Returns:
+            set or None: 能力集合，如果缓存过期（1天）或不存在则返回None
+        """
+        if (self.config.has_option('capabilities', mirror) and
+            time.time() - self.config.getfloat('capabilities', f'{mirror}.timestamp', fallback=0) < 86400):
+            return set(filter(None, self.config.get('capabilities', mirror).split(',')))
+        return None
+
+    def save_capabilities(self, mirror, caps):
+        """
+        保存镜像源能力
+
+        Args:
+            mirror (str): 镜像源名称
+            caps (set): 能力集合
+        """
+        def update(config):
+            if not config.has_section('capabilities'):
+                config.add_section('capabilities')
+            config.set('capabilities', mirror, ','.join(sorted(caps)))
+            config.set('capabilities', f'{mirror}.timestamp', str(time.time()))
+
+        self._update(update)
 
     def get_proxy(self):
         """
@@ -59,30 +134,152 @@ class ConfigHandler:
         Args:
             proxy (dict): 代理配置字典
         """
-        if not self.config.has_section('proxy'):
-            self.config.add_section('proxy')
-        for k, v in proxy.items():
-            self.config.set('proxy', k, v)
-        self._save()
+        def update(config):
+            if not config.has_section('proxy'):
+                config.add_section('proxy')
+            for k, v in proxy.items():
+                config.set('proxy', k, v)
+
+        self._update(update)
+
+    def get_race_config(self):
+        """
+        获取镜像源竞速配置
+
+        Returns:
+            dict: 竞速配置字典，没有配置时为空字典
+        """
+        if self.config.has_section('race'):
+            return dict(self.config.items('race'))
+        return {}
+
+    def get_batch_config(self):
+        """
+        获取批量操作配置
+
+        Returns:
+            dict: 批量操作配置字典，没有配置时为空字典
+        """
+        if self.config.has_section('batch'):
+            return dict(self.config.items('batch'))
+        return {}
+
+    def get_cache_config(self):
+        """
+        获取本地仓库缓存配置
+
+        Returns:
+            dict: 缓存配置字典，没有配置时为空字典
+        """
+        if self.config.has_section('cache'):
+            return dict(self.config.items('cache'))
+        return {}
+
+    def get_github_config(self):
+        """
+        获取 GitHub API 配置
+
+        Returns:
+            dict: GitHub API 配置字典，没有配置时为空字典
+        """
+        if self.config.has_section('github'):
+            return dict(self.config.items('github'))
+        return {}
+
+    def get_clone_config(self):
+        """
+        获取克隆配置
+
+        Returns:
+            dict: 克隆配置字典，没有配置时为空字典
+        """
+        if self.config.has_section('clone'):
+            return dict(self.config.items('clone'))
+        return {}
+
+    def get_serve_config(self):
+        """
+        获取 fgit serve 配置
+
+        Returns:
+            dict: serve 配置字典，没有配置时为空字典
+        """
+        if self.config.has_section('serve'):
+            return dict(self.config.items('serve'))
+        return {}
+
+    def get_telemetry_config(self):
+        """
+        获取性能记录配置
+
+        Returns:
+            dict: 性能记录配置字典，没有配置时为空字典
+        """
+        if self.config.has_section('telemetry'):
+            return dict(self.config.items('telemetry'))
+        return {}
+
+    def get_http_config(self):
+        """
+        获取 HTTP 客户端配置
+
+        Returns:
+            dict: HTTP 配置字典，没有配置时为空字典
+        """
+        if self.config.has_section('http'):
+            return dict(self.config.items('http'))
+        return {}
+
+    def get_stall_config(self):
+        """
+        获取传输停滞判定配置
+
+        Returns:
+            dict: 停滞判定配置字典，没有配置时为空字典
+        """
+        if self.config.has_section('stall'):
+            return dict(self.config.items('stall'))
+        return {}
+
+    def get_scheduler_config(self):
+        """
+        获取传输调度配置
+
+        Returns:
+            dict: 传输调度配置字典，没有配置时为空字典
+        """
+        if self.config.has_section('scheduler'):
+            return dict(self.config.items('scheduler'))
+        return {}
 
     def get_downloader_config(self):
         """
         获取下载器配置
         
         Returns:
-            dict: 下载器配置字典
+            dict: 下载器配置字典，没有配置的项使用默认值
         """
+        downloader_config = dict(DOWNLOADER_DEFAULTS)
         if self.config.has_section('downloader'):
-            return dict(self.config.items('downloader'))
-        
-        # 如果没有配置节，创建默认配置
-        self.config.add_section('downloader')
-        self.config.set('downloader', 'chunk_size', '1024')
-        self.config.set('downloader', 'min_file_size', '100')
-        self._save()
-        return dict(self.config.items('downloader'))
-
-    def _save(self):
-        """保存配置到文件"""
-        with open(self.config_file, 'w') as f:
-            self.config.write(f)
\ No newline at end of file
+            downloader_config.update(self.config.items('downloader'))
+        return downloader_config
+
+    def _update(self, modify):
+        """
+        修改配置并写回文件
+
+        在文件锁内重新读取磁盘上的配置，应用修改后写入临时文件再替换，
+        避免覆盖其他进程的修改，也不会留下写了一半的文件。
+
+        Args:
+            modify (callable): 接收 ConfigParser 并就地修改的函数
+        """
+        with self.lock, FileLock(self.config_file + '.lock'):
+            self.load_config()
+            modify(self.config)
+            tmp_path = self.config_file + '.tmp'
+            with open(tmp_path, 'w') as f:
+                self.config.write(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.config_file)
@@ -1,51 +1,462 @@
 import os
-import zipfile
+import re
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
-import requests
 from loguru import logger
+from utils.http import get_client
+from utils import telemetry, scheduler
+from utils.archive import StreamVerifier, ArchiveError, verify_archive
 
+# 每写入多少字节记录一次断点
+JOURNAL_INTERVAL = 1024 * 1024
 
-def download_file(url: str, file_path: str, chunk_size: int = 1024, MIN_FILE_SIZE: int = 100) -> bool:
+
+class DownloadJournal:
+    """断点续传记录，以 json 形式保存在 .part 文件旁"""
+
+    def __init__(self, path):
+        """
+        初始化断点记录
+
+        Args:
+            path (str): 记录文件路径
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError):
+                self.data = {}
+
+    @property
+    def completed(self):
+        """已完成的字节区间列表"""
+        return [tuple(r) for r in self.data.get('completed', [])]
+
+    def matches(self, total_size, etag, last_modified):
+        """
+        判断记录是否对应同一个文件
+
+        不同镜像源的 URL 不同，因此只比较文件大小以及双方都提供的校验头。
+
+        Args:
+            total_size (int): 文件总大小
+            etag (str): ETag 响应头
+            last_modified (str): Last-Modified 响应头
+
+        Returns:
+            bool: 是否可以继续下载
+        """
+        if not self.data or self.data.get('total_size') != total_size:
+            return False
+        if etag and self.data.get('etag') and etag != self.data['etag']:
+            return False
+        if last_modified and self.data.get('last_modified') and last_modified != self.data['last_modified']:
+            return False
+        return True
+
+    def reset(self, url, total_size, etag, last_modified):
+        """开始新的下载记录"""
+        self.data = {
+            'url': url,
+            'total_size': total_size,
+            'etag': etag,
+            'last_modified': last_modified,
+            'completed': [],
+        }
+        self.save()
+
+    def mark(self, start, end):
+        """
+        记录已完成的字节区间并保存
+
+        Args:
+            start (int): 起始字节（含）
+            end (int): 结束字节（含）
+        """
+        with self.lock:
+            self.data['completed'] = merge_ranges(self.completed + [(start, end)])
+            self.save()
+
+    def pending(self):
+        """
+        计算尚未下载的字节区间
+
+        Returns:
+            list: [(start, end), ...] 闭区间列表
+        """
+        result = []
+        pos = 0
+        for start, end in self.completed:
+            if start > pos:
+                result.append((pos, start - 1))
+            pos = max(pos, end + 1)
+        if pos < self.data['total_size']:
+            result.append((pos, self.data['total_size'] - 1))
+        return result
+
+    def save(self):
+        """写入记录文件"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        """删除记录文件"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def download_file(url: str, file_path: str, chunk_size: int = 1024, MIN_FILE_SIZE: int = 100,
+                  segments: int = 1, segment_size: int = 4 * 1024 * 1024,
+                  archive_format: str = 'zip', extract_to: str = None,
+                  expected_size: int = None, expected_digest: str = None) -> bool:
     """
     下载文件
-    
+
+    数据先写入 <file_path>.part，并在 <file_path>.part.json 中记录已完成的区间，
+    中断后再次调用（包括换用其他镜像源）会通过 Range 请求继续下载。
+    服务器支持 Range 请求且文件足够大时，将文件切分为多个分段并发下载，
+    否则回退为单连接流式下载。第一个请求即为从续传位置开始的 Range 请求，其响应直接用作第一个分段；
+    服务器没有返回文件大小时无法分段与续传，流式读取到响应结束。
+    单连接下载时在数据到达的同时校验（并解压）压缩包，
+    分段或续传下载完成后再顺序读取一遍文件完成校验。
+    提供预期大小与 SHA-256 摘要时（如 release 文件），镜像源返回的文件必须与之一致。
+    下载期间持有传输调度的租约：分段数不超过镜像源剩余的连接名额，每块数据按分配的带宽限速。
+
     Args:
         url (str): 下载链接
         file_path (str): 保存文件路径
         chunk_size (int): 下载块大小
         MIN_FILE_SIZE (int): 最小文件大小（字节）
-        
+        segments (int): 最大分段数（并发连接数），1 表示不分段
+        segment_size (int): 每个分段的最小大小（字节）
+        archive_format (str): 压缩包格式，zip 或 tar.gz，None 表示不是压缩包，只校验大小与摘要
+        extract_to (str): 解压目录，None 表示不解压
+        expected_size (int): 预期的文件大小（字节）
+        expected_digest (str): 预期的 SHA-256 摘要（十六进制）
+
     Returns:
         bool: 下载是否成功
     """
+    part_path = file_path + '.part'
+    journal = DownloadJournal(part_path + '.json')
+    lease = scheduler.acquire(url)
     try:
-        response = requests.get(url, stream=True)
-        total_size = int(response.headers.get('content-length', 0))
-        
-        # 检查文件大小
-        if int(MIN_FILE_SIZE) > total_size:
+        # 第一个请求就使用 Range, 响应直接作为第一个分段或续传的数据, 不必为分段或续传丢弃整个响应;
+        # 分段下载时第一个请求只请求一个分段的长度, 续传时只请求第一个缺失的区间
+        head = int(segment_size) if int(segments) > 1 else None
+        pending = journal.pending() if journal.data and os.path.exists(part_path) else []
+        resume, resume_end = pending[0] if pending else (0, None)
+        if head is not None:
+            resume_end = min(resume_end, resume + head - 1) if resume_end is not None else resume + head - 1
+        response, offset, last, total_size, supports_range = _request(url, resume, resume_end, journal.data)
+        etag = response.headers.get('etag')
+        last_modified = response.headers.get('last-modified')
+        resumed = (supports_range and total_size is not None and offset == resume and os.path.exists(part_path)
+                   and journal.matches(total_size, etag, last_modified) and os.path.getsize(part_path) == total_size)
+        if not resumed and (offset != 0 or total_size is None and supports_range):
+            # 记录与当前文件不一致时从头下载; 大小未知时无法分段, 从头请求完整的内容
+            response.close()
+            response, offset, last, total_size, supports_range = _request(
+                url, 0, head and head - 1 if total_size is not None else None, {})
+            etag = response.headers.get('etag')
+            last_modified = response.headers.get('last-modified')
+            if offset != 0:
+                response.close()
+                raise IOError(f"镜像源返回的内容从第 {offset} 字节开始")
+
+        # 检查文件大小, 大小未知时下载完成后再检查
+        if total_size is not None and int(MIN_FILE_SIZE) > total_size:
             logger.debug(f"镜像源错误: 文件大小小于{MIN_FILE_SIZE}字节")
+            response.close()
             return False
-            
-        logger.info(f"下载文件: {file_path} ({total_size/1024:.1f}KB)")
-
-        # 下载文件
-        with open(file_path, 'wb') as f:
-            with tqdm(total=total_size, unit='B', unit_scale=True, desc="下载文件") as pbar:
-                for data in response.iter_content(chunk_size=int(chunk_size)):
-                    f.write(data)
-                    pbar.update(len(data))
-        
-        # 校验文件完整性
-        with zipfile.ZipFile(file_path, 'r') as zip_ref:
-            try:
-                zip_ref.testzip()  # 校验文件完整性
-            except zipfile.BadZipFile:
-                logger.error(f"下载失败: {file_path} 不是一个有效的zip文件")
-                os.remove(file_path)
+        if expected_size is not None and total_size is not None and total_size != expected_size:
+            logger.debug(f"镜像源错误: 文件大小 {total_size} 与预期的 {expected_size} 不一致")
+            response.close()
+            return False
+
+        if total_size is None:
+            logger.info(f"下载文件: {file_path} (大小未知)")
+            # 不知道文件大小时无法分段与续传, 流式读取到响应结束
+            journal.remove()
+            with open(part_path, 'wb'):
+                pass
+            with telemetry.phase('download'), tqdm(unit='B', unit_scale=True, desc=os.path.basename(file_path)) as pbar:
+                digest = _fetch_stream(response, part_path, None, int(chunk_size), pbar, None, lease.throttle,
+                                       archive_format, extract_to)
+            size = os.path.getsize(part_path)
+            if int(MIN_FILE_SIZE) > size or expected_size is not None and size != expected_size:
+                logger.debug(f"镜像源错误: 文件大小 {size} 不符合要求")
+                os.remove(part_path)
                 return False
-            
+        else:
+            logger.info(f"下载文件: {file_path} ({total_size/1024:.1f}KB)")
+            if resumed:
+                logger.info(f"继续未完成的下载: 已完成 {total_size - sum(e - s + 1 for s, e in pending)} 字节")
+            else:
+                # 预分配文件, 各分段按偏移写入
+                with open(part_path, 'wb') as f:
+                    f.truncate(total_size)
+                journal.reset(url, total_size, etag, last_modified)
+
+            ranges = []
+            for start, end in journal.pending():
+                if start == offset and last < end:
+                    # 第一个响应只包含该区间的开头
+                    ranges.append((start, last))
+                    start = last + 1
+                ranges += [(start + s, start + e)
+                           for s, e in split_ranges(end - start + 1, int(segments), int(segment_size))]
+
+            # 下载文件
+            digest = None
+            with telemetry.phase('download'), tqdm(total=total_size,
+                                                   initial=total_size - sum(e - s + 1 for s, e in ranges),
+                                                   unit='B', unit_scale=True, desc=os.path.basename(file_path)) as pbar:
+                if ranges == [(0, total_size - 1)] or not supports_range:
+                    # 无需分段或不支持分段, 直接使用当前响应, 边下载边校验
+                    digest = _fetch_stream(response, part_path, total_size - 1, int(chunk_size), pbar, journal,
+                                           lease.throttle, archive_format, extract_to)
+                elif ranges:
+                    workers = lease.expand(len(ranges))
+                    logger.debug(f"分段下载: {len(ranges)} 个分段, {workers} 个连接")
+                    headers = {'Accept-Encoding': 'identity'}
+                    if etag and not etag.startswith('W/'):
+                        headers['If-Range'] = etag
+                    elif last_modified:
+                        headers['If-Range'] = last_modified
+                    # 重定向后的最终地址, 避免每个分段重复跳转
+                    _download_segmented(response.url, part_path, ranges, int(chunk_size), pbar, journal, headers,
+                                        workers, lease.throttle, response)
+                else:
+                    response.close()
+
+        # 分段或续传下载的数据不是顺序到达的, 下载完成后顺序校验一遍
+        if digest is None:
+            with telemetry.phase('verify'), open(part_path, 'rb') as f:
+                digest = verify_archive(f, archive_format, extract_to)
+        if expected_digest and digest != expected_digest.lower():
+            raise ArchiveError(f"SHA-256 {digest} 与预期的 {expected_digest} 不一致")
+        logger.info(f"校验通过: SHA-256 {digest}")
+
+        os.replace(part_path, file_path)
+        journal.remove()
         return True
+    except ArchiveError as e:
+        if archive_format is None:
+            logger.error(f"下载失败: {file_path} 校验失败: {e}")
+        else:
+            logger.error(f"下载失败: {file_path} 不是一个有效的{archive_format}文件: {e}")
+        os.remove(part_path)
+        journal.remove()
+        return False
     except Exception as e:
         logger.error(f"下载失败: {str(e)}")
-        return False
\ No newline at end of file
+        return False
+    finally:
+        lease.release()
+
+
+def _request(url: str, start: int, end, record: dict):
+    """
+    发起 Range 请求
+
+    Args:
+        url (str): 下载链接
+        start (int): 起始字节（含）
+        end (int): 结束字节（含），None 表示到文件末尾
+        record (dict): 断点记录的内容，续传时用其中的校验头发送 If-Range
+
+    Returns:
+        tuple: (响应, 响应内容的起始字节, 响应内容的结束字节, 文件总大小（未知时为None）, 是否支持 Range 请求)，
+            服务器不支持 Range 请求时响应为完整文件
+
+    Raises:
+        IOError: 镜像源返回错误状态码，此时不应修改已下载的数据与断点记录
+    """
+    # 压缩传输时 Content-Length 与实际内容长度不一致, 无法分段与续传
+    headers = {'Accept-Encoding': 'identity', 'Range': f"bytes={start}-{'' if end is None else end}"}
+    etag = record.get('etag')
+    if start and etag and not etag.startswith('W/'):
+        headers['If-Range'] = etag
+    elif start and record.get('last_modified'):
+        headers['If-Range'] = record['last_modified']
+    response = get_client().get(url, headers=headers, stream=True)
+    if response.status_code == 416 and start:
+        # 续传位置超出了镜像源上的文件, 文件已变化, 从头请求
+        response.close()
+        return _request(url, 0, None if end is None else end - start, {})
+    if response.status_code not in (200, 206):
+        # 错误页面（404、5xx 等）不能当作文件内容
+        response.close()
+        raise IOError(f"HTTP {response.status_code}")
+    content_range = re.match(r'bytes (\d+)-(\d+)/(\d+|\*)', response.headers.get('content-range', ''))
+    if response.status_code == 206 and content_range:
+        total = int(content_range[3]) if content_range[3] != '*' else None
+        return response, int(content_range[1]), int(content_range[2]), total, True
+    # 对 Range 请求返回完整内容, 说明不支持 Range 请求（或 If-Range 校验不通过, 文件已变化）
+    length = response.headers.get('content-length')
+    total = int(length) if length is not None else None
+    return response, 0, total - 1 if total is not None else None, total, False
+
+
+def _fetch_stream(response, file_path: str, end, chunk_size: int, pbar, journal, throttle,
+                  archive_format: str, extract_to: str) -> str:
+    """
+    从头顺序下载整个文件，边下载边校验（并解压）
+
+    Args:
+        response (requests.Response): 内容从第 0 字节开始的响应
+        file_path (str): 保存文件路径
+        end (int): 结束字节（含），None 表示读取到响应结束
+        chunk_size (int): 下载块大小
+        pbar (tqdm): 进度条
+        journal (DownloadJournal): 断点记录，None 表示不记录
+        throttle (callable): 限速回调
+        archive_format (str): 压缩包格式
+        extract_to (str): 解压目录
+
+    Returns:
+        str: SHA-256 摘要
+    """
+    verifier = StreamVerifier(archive_format, extract_to)
+    try:
+        with response:
+            _fetch_range(response, file_path, 0, end, chunk_size, pbar.update, journal, throttle, verifier.feed)
+    except Exception:
+        # 下载中断时保留已下载的数据以便续传
+        verifier.abort()
+        raise
+    return verifier.finish()
+
+
+def merge_ranges(ranges: list) -> list:
+    """
+    合并相邻或重叠的字节区间
+
+    Args:
+        ranges (list): [(start, end), ...] 闭区间列表
+
+    Returns:
+        list: 合并并排序后的区间列表
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def split_ranges(total_size: int, segments: int, segment_size: int) -> list:
+    """
+    将文件切分为若干字节区间
+
+    Args:
+        total_size (int): 文件总大小（字节）
+        segments (int): 最大分段数
+        segment_size (int): 每个分段的最小大小（字节）
+
+    Returns:
+        list: [(start, end), ...] 闭区间列表，不满足分段条件时只返回一个区间
+    """
+    count = max(1, min(segments, total_size // max(segment_size, 1)))
+    step = -(-total_size // count)
+    return [(start, min(start + step, total_size) - 1) for start in range(0, total_size, step)]
+
+
+def _download_segmented(url: str, file_path: str, ranges: list, chunk_size: int, pbar, journal, headers: dict,
+                        workers: int, throttle, first=None):
+    """
+    并发下载所有分段到预分配的文件中
+
+    Args:
+        url (str): 下载链接
+        file_path (str): 保存文件路径
+        ranges (list): 字节区间列表
+        chunk_size (int): 下载块大小
+        pbar (tqdm): 进度条
+        journal (DownloadJournal): 断点记录
+        headers (dict): 附加请求头
+        workers (int): 并发连接数
+        throttle (callable): 限速回调，参数为字节数
+        first (requests.Response): 内容从第一个分段开始的响应，用于下载第一个分段
+
+    Raises:
+        IOError: 任一分段下载失败
+    """
+    lock = threading.Lock()
+
+    def on_data(size):
+        with lock:
+            pbar.update(size)
+
+    def fetch(start, end, response=None):
+        if response is None:
+            response = get_client().get(url, headers={**headers, 'Range': f'bytes={start}-{end}'}, stream=True)
+            if response.status_code != 206:
+                response.close()
+                raise IOError(f"分段 {start}-{end} 请求失败: HTTP {response.status_code}")
+        with response:
+            _fetch_range(response, file_path, start, end, chunk_size, on_data, journal, throttle)
+
+    with ThreadPoolExecutor(max_workers=min(len(ranges), workers)) as executor:
+        futures = [executor.submit(fetch, start, end, first if i == 0 else None)
+                   for i, (start, end) in enumerate(ranges)]
+        for future in futures:
+            future.result()
+
+
+def _fetch_range(response, file_path: str, start: int, end: int, chunk_size: int, on_data, journal,
+                 throttle=None, sink=None) -> None:
+    """
+    将响应内容写入文件对应位置，并定期记录断点
+
+    Args:
+        response (requests.Response): 内容从 start 开始的响应
+        file_path (str): 保存文件路径
+        start (int): 起始字节（含）
+        end (int): 结束字节（含），None 表示读取到响应结束
+        chunk_size (int): 下载块大小
+        on_data (callable): 每写入一块数据后的回调，参数为字节数
+        journal (DownloadJournal): 断点记录，None 表示不记录
+        throttle (callable): 每读取一块数据后的限速回调，参数为字节数，令牌不足时阻塞
+        sink (callable): 按顺序接收每块数据的回调
+
+    Raises:
+        IOError: 内容长度不符
+    """
+    pos = marked = start
+    with open(file_path, 'r+b') as f:
+        f.seek(start)
+        try:
+            for data in response.iter_content(chunk_size=chunk_size):
+                if end is not None:
+                    data = data[:end + 1 - pos]
+                f.write(data)
+                if sink is not None:
+                    sink(data)
+                pos += len(data)
+                on_data(len(data))
+                if throttle is not None:
+                    throttle(len(data))
+                if journal is not None and pos - marked >= JOURNAL_INTERVAL:
+                    f.flush()
+                    journal.mark(marked, pos - 1)
+                    marked = pos
+                if end is not None and pos > end:
+                    break
+        finally:
+            f.flush()
+            if journal is not None and pos > marked:
+                journal.mark(marked, pos - 1)
+    if end is not None and pos != end + 1:
+        raise IOError(f"分段 {start}-{end} 不完整: {pos - start} 字节")
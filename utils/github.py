@@ -0,0 +1,404 @@
+import os
+import json
+import time
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from colorama import Fore, Style
+from utils.http import get_client
+from utils import telemetry
+
+API_URL = 'https://api.github.com'
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0',
+    'Content-Type': 'application/json',
+    'Accept': 'application/json'
+}
+# 不存在的仓库缓存时间较短（秒）
+NEGATIVE_TTL = 300
+# 单次 GraphQL 查询的仓库数量
+GRAPHQL_BATCH = 50
+# compare API 最多返回的文件数，达到时变更列表不完整
+COMPARE_FILES_LIMIT = 300
+
+
+class GitHubAPI:
+    """GitHub API 客户端，带磁盘缓存与条件请求"""
+
+    def __init__(self, cache_path=None, ttl=3600, timeout=5, token=None):
+        """
+        初始化 GitHub API 客户端
+
+        Args:
+            cache_path (str): 响应缓存文件路径，默认为 ~/.fgit.api.json
+            ttl (int): 缓存有效期（秒），过期后使用 ETag 发起条件请求
+            timeout (float): 请求超时时间（秒）
+            token (str): GitHub 访问令牌
+        """
+        self.cache_path = cache_path or os.path.expanduser('~/.fgit.api.json')
+        self.ttl = ttl
+        self.timeout = timeout
+        self.token = token
+        self.cache = {}
+        if os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path, 'r', encoding='utf-8') as f:
+                    self.cache = json.load(f)
+            except (OSError, ValueError):
+                self.cache = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        根据 [github] 配置创建客户端，令牌也可以通过 GITHUB_TOKEN 环境变量提供
+
+        Args:
+            config (ConfigHandler): 配置处理器实例
+
+        Returns:
+            GitHubAPI: 客户端实例
+        """
+        github_config = config.get_github_config()
+        return cls(ttl=int(github_config.get('ttl', 3600)),
+                   timeout=float(github_config.get('timeout', 5)),
+                   token=github_config.get('token') or os.environ.get('GITHUB_TOKEN'))
+
+    @telemetry.phase('github_api')
+    def get_repo(self, repo_url):
+        """
+        获取仓库信息
+
+        Args:
+            repo_url (str): 仓库URL
+
+        Returns:
+            bool or None: True表示仓库存在，False表示仓库不存在，None表示获取信息失败
+        """
+        slug = repo_slug(repo_url)
+        logger.debug(Fore.CYAN + f"🔍 正在获取仓库: {slug}" + Style.RESET_ALL)
+        status = self._get_repo(slug)
+        if status is True:
+            info = self.cache[slug]['body']
+            logger.info(Fore.GREEN + f"✅ 获取到仓库信息: {info['full_name']}({info['id']})" + Style.RESET_ALL)
+        elif status is False:
+            logger.warning(Fore.RED + "❌ 获取仓库信息失败，该仓库可能不存在或未公开" + Style.RESET_ALL)
+        return status
+
+    @telemetry.phase('github_api')
+    def get_repos(self, repo_urls):
+        """
+        批量获取仓库是否存在
+
+        有令牌时通过一次 GraphQL 查询检查多个仓库，否则并发发起 REST 请求。
+
+        Args:
+            repo_urls (list): 仓库URL列表
+
+        Returns:
+            dict: 仓库URL到状态（True/False/None）的映射
+        """
+        slugs = {url: repo_slug(url) for url in repo_urls}
+        pending = sorted({slug for slug in slugs.values() if self._cached_status(slug) is None})
+        if pending and self.token:
+            for i in range(0, len(pending), GRAPHQL_BATCH):
+                self._query_graphql(pending[i:i + GRAPHQL_BATCH])
+        elif pending:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                list(executor.map(self._fetch, pending))
+        self._save()
+        return {url: self._status(slug) for url, slug in slugs.items()}
+
+    def _get_repo(self, slug):
+        """读取缓存或请求单个仓库，并写入缓存"""
+        if (status := self._cached_status(slug)) is not None:
+            logger.debug(f"使用缓存的仓库信息: {slug}")
+            return status
+        status = self._fetch(slug)
+        self._save()
+        return status
+
+    def _cached_status(self, slug):
+        """返回未过期缓存中的仓库状态，没有可用缓存时返回None"""
+        entry = self.cache.get(slug)
+        if not entry:
+            return None
+        ttl = self.ttl if entry['status'] == 200 else NEGATIVE_TTL
+        if time.time() - entry['time'] >= ttl:
+            return None
+        return self._status(slug)
+
+    def _status(self, slug):
+        """将缓存中的 HTTP 状态转换为 True/False/None"""
+        entry = self.cache.get(slug)
+        if not entry:
+            return None
+        return {200: True, 404: False}.get(entry['status'])
+
+    def _headers(self):
+        """构造请求头"""
+        headers = dict(HEADERS)
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        return headers
+
+    def _fetch(self, slug):
+        """
+        通过 REST API 请求仓库信息，已有 ETag 时发起条件请求
+
+        Returns:
+            bool or None: 仓库状态
+        """
+        return self._fetch_cached(slug, f"/repos/{slug}",
+                                  lambda result: {'full_name': result['full_name'], 'id': result['id']})
+
+    def _fetch_cached(self, key, path, extract):
+        """
+        请求 REST API 并以 key 写入缓存，已有 ETag 时发起条件请求
+
+        Args:
+            key (str): 缓存键
+            path (str): API 路径
+            extract (callable): 从响应中提取需要缓存的字段
+
+        Returns:
+            bool or None: True表示存在，False表示不存在，None表示请求失败且没有缓存
+        """
+        headers = self._headers()
+        entry = self.cache.get(key)
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+
+        try:
+            response = get_client().get(f"{API_URL}{path}", headers=headers, timeout=self.timeout, retry=False)
+            body = extract(response.json()) if response.status_code == 200 else None
+        except Exception as e:
+            logger.debug(Fore.RED + f"❌ 请求 GitHub API 失败: {e}" + Style.RESET_ALL)
+            # 请求失败时沿用过期缓存
+            return self._status(key)
+        if response.status_code == 200:
+            self.cache[key] = {
+                'status': 200,
+                'etag': response.headers.get('ETag'),
+                'body': body,
+                'time': time.time(),
+            }
+        elif response.status_code == 304 and entry:
+            entry['time'] = time.time()
+        elif response.status_code == 404:
+            self.cache[key] = {'status': 404, 'time': time.time()}
+        else:
+            logger.debug(Fore.RED + f"❌ 请求 GitHub API 失败: HTTP {response.status_code}" + Style.RESET_ALL)
+        return self._status(key)
+
+    def _get_cached(self, key, path, extract):
+        """读取缓存或请求 API，返回缓存的字段，不存在或失败时返回None"""
+        if self._cached_status(key) is None:
+            self._fetch_cached(key, path, extract)
+            self._save()
+        if self._status(key):
+            return self.cache[key]['body']
+        return None
+
+    @telemetry.phase('github_api')
+    def get_release(self, repo_url, tag=None):
+        """
+        获取 release 及其文件列表
+
+        Args:
+            repo_url (str): 仓库URL或 owner/repo
+            tag (str): 标签名，None 表示最新的 release
+
+        Returns:
+            dict or None: {'tag': 标签名, 'assets': [{'name', 'size', 'url', 'digest'}, ...]}，
+                获取失败时返回None
+        """
+        slug = repo_slug(repo_url)
+        path = f"/repos/{slug}/releases/tags/{quote(tag)}" if tag else f"/repos/{slug}/releases/latest"
+
+        def extract(result):
+            return {
+                'tag': result['tag_name'],
+                'assets': [{
+                    'name': asset['name'],
+                    'size': asset['size'],
+                    'url': asset['browser_download_url'],
+                    # 较新的 release 会提供 sha256:<hex> 形式的摘要
+                    'digest': (asset.get('digest') or '').partition('sha256:')[2] or None,
+                } for asset in result.get('assets', [])],
+            }
+
+        logger.debug(Fore.CYAN + f"🔍 正在获取 release: {slug} {tag or 'latest'}" + Style.RESET_ALL)
+        return self._get_cached(f"release:{slug}:{tag or ''}", path, extract)
+
+    @telemetry.phase('github_api')
+    def get_content(self, repo_url, file_path, ref=None):
+        """
+        获取仓库中文件的大小与 git 对象哈希
+
+        Args:
+            repo_url (str): 仓库URL或 owner/repo
+            file_path (str): 文件在仓库中的路径
+            ref (str): 分支、标签或提交
+
+        Returns:
+            dict or None: {'size': 大小, 'sha': blob 的 SHA-1}，获取失败时返回None
+        """
+        slug = repo_slug(repo_url)
+        path = f"/repos/{slug}/contents/{quote(file_path)}" + (f"?ref={quote(ref)}" if ref else '')
+
+        def extract(result):
+            if not isinstance(result, dict) or result.get('type') != 'file':
+                return None
+            return {'size': result['size'], 'sha': result['sha']}
+
+        return self._get_cached(f"content:{slug}:{ref or ''}:{file_path}", path, extract)
+
+    @telemetry.phase('github_api')
+    def get_compare(self, repo_url, base, head):
+        """
+        获取两个提交之间变更的文件
+
+        分支随时可能更新，每次都发起条件请求（未变化时 GitHub 返回 304，不计入请求额度），
+        同一分支只保留最近一次比较的缓存。
+
+        Args:
+            repo_url (str): 仓库URL或 owner/repo
+            base (str): 起始提交
+            head (str): 分支、标签或提交
+
+        Returns:
+            dict or None: {'status': ahead/identical/behind/diverged, 'head': head 的提交 SHA,
+                'date': 提交时间（ISO 8601）, 'truncated': 提交或文件列表是否不完整,
+                'files': [{'path', 'status', 'sha', 'previous'}, ...]}，获取失败时返回None
+        """
+        slug = repo_slug(repo_url)
+        key = f"compare:{slug}:{base}...{head}"
+
+        def extract(result):
+            commits = result.get('commits', [])
+            files = result.get('files', [])
+            return {
+                'status': result['status'],
+                'head': commits[-1]['sha'] if commits else base,
+                'date': commits[-1]['commit']['committer']['date'] if commits else None,
+                'truncated': result.get('total_commits', 0) > len(commits) or len(files) >= COMPARE_FILES_LIMIT,
+                'files': [{'path': f['filename'], 'status': f['status'], 'sha': f['sha'],
+                           'previous': f.get('previous_filename')} for f in files],
+            }
+
+        for stale in [k for k in self.cache if k.startswith(f"compare:{slug}:") and k.endswith(f"...{head}")
+                      and k != key]:
+            del self.cache[stale]
+        logger.debug(Fore.CYAN + f"🔍 正在比较: {slug} {base[:12]}...{head}" + Style.RESET_ALL)
+        self._fetch_cached(key, f"/repos/{slug}/compare/{base}...{quote(head)}", extract)
+        self._save()
+        if self._status(key):
+            return self.cache[key]['body']
+        return None
+
+    @telemetry.phase('github_api')
+    def get_modes(self, repo_url, commit, paths):
+        """
+        获取提交中若干文件的 git 文件模式
+
+        逐级读取文件所在的目录树，每个目录只请求一次；树对象按 SHA 不可变且每次提交都不同，不写入缓存。
+
+        Args:
+            repo_url (str): 仓库URL或 owner/repo
+            commit (str): 提交 SHA
+            paths (iterable): 文件路径
+
+        Returns:
+            dict or None: 文件路径到模式（100644、100755、120000 或 160000）的映射，获取失败时返回None
+        """
+        slug = repo_slug(repo_url)
+        trees = {}
+
+        def listing(directory):
+            if directory not in trees:
+                if directory:
+                    parent, _, name = directory.rpartition('/')
+                    entry = (listing(parent) or {}).get(name)
+                    sha = entry['sha'] if entry and entry['type'] == 'tree' else None
+                else:
+                    sha = commit
+                trees[directory] = self._get_tree(slug, sha) if sha else None
+            return trees[directory]
+
+        modes = {}
+        for path in paths:
+            directory, _, name = path.rpartition('/')
+            entry = (listing(directory) or {}).get(name)
+            if entry is None:
+                return None
+            modes[path] = entry['mode']
+        return modes
+
+    def _get_tree(self, slug, sha):
+        """读取一层目录树，返回名称到 {'mode', 'type', 'sha'} 的映射，失败时返回None"""
+        try:
+            response = get_client().get(f"{API_URL}/repos/{slug}/git/trees/{sha}", headers=self._headers(),
+                                        timeout=self.timeout, retry=False)
+            response.raise_for_status()
+            result = response.json()
+        except Exception as e:
+            logger.debug(Fore.RED + f"❌ 获取目录树失败: {slug} {sha[:12]}: {e}" + Style.RESET_ALL)
+            return None
+        if result.get('truncated'):
+            return None
+        return {entry['path']: {'mode': entry['mode'], 'type': entry['type'], 'sha': entry['sha']}
+                for entry in result.get('tree', [])}
+
+    def _query_graphql(self, slugs):
+        """通过一次 GraphQL 查询检查多个仓库，并写入缓存"""
+        fields = []
+        for i, slug in enumerate(slugs):
+            owner, name = slug.split('/', 1)
+            fields.append(f'r{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) '
+                          f'{{ nameWithOwner databaseId }}')
+        body = json.dumps({'query': 'query { ' + ' '.join(fields) + ' }'}).encode()
+        try:
+            response = get_client().post(f"{API_URL}/graphql", data=body, headers=self._headers(), timeout=self.timeout,
+                                         retry=False)
+            response.raise_for_status()
+            data = response.json().get('data') or {}
+        except Exception as e:
+            logger.debug(Fore.RED + f"❌ 批量获取仓库信息失败: {e}" + Style.RESET_ALL)
+            return
+        for i, slug in enumerate(slugs):
+            result = data.get(f'r{i}')
+            if result:
+                self.cache[slug] = {
+                    'status': 200,
+                    'body': {'full_name': result['nameWithOwner'], 'id': result['databaseId']},
+                    'time': time.time(),
+                }
+            elif f'r{i}' in data:
+                self.cache[slug] = {'status': 404, 'time': time.time()}
+
+    def _save(self):
+        """写入缓存文件"""
+        tmp_path = self.cache_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.cache, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.debug(f"无法写入仓库信息缓存: {e}")
+
+
+def repo_slug(repo_url):
+    """
+    从仓库URL中提取 owner/repo
+
+    Args:
+        repo_url (str): 仓库URL或 owner/repo
+
+    Returns:
+        str: owner/repo
+    """
+    clean_url = repo_url.split('.git')[0] if repo_url.endswith('.git') else repo_url
+    # 处理 URL 形式的仓库名
+    if '://' in clean_url and '/' in clean_url:
+        clean_url = clean_url.split('/')[-2] + '/' + clean_url.split('/')[-1]
+    return clean_url
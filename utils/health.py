@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import atexit
+import tempfile
+import threading
+from loguru import logger
+from utils import telemetry
+from utils.lock import FileLock
+
+# 指数加权平均的平滑系数
+EWMA_ALPHA = 0.3
+# 连续失败多少次后熔断，以及熔断时长（秒）
+FAILURE_THRESHOLD = 3
+COOLDOWN = 600
+# 两次写入记录文件的最短间隔（秒），其余记录在进程退出时写入
+SAVE_INTERVAL = 5
+
+# raw 文件镜像源与 git/压缩包镜像源同名，记录时加上前缀，避免小文件的速度与失败影响克隆与下载的排序和熔断
+RAW_PREFIX = 'raw:'
+
+# 有未写入记录的实例，进程退出时统一写入
+_stores = set()
+_stores_lock = threading.Lock()
+
+
+def raw_key(mirror):
+    """
+    raw 文件镜像源在健康记录中的名称
+
+    Args:
+        mirror (str): RAWCONTENT_MIRRORS 中的镜像源名称
+
+    Returns:
+        str: raw:<名称>
+    """
+    return RAW_PREFIX + mirror
+
+
+class HealthStore:
+    """
+    镜像源健康记录，根据真实操作的结果为镜像源评分
+
+    每次结果先记入内存并排队，写入时在文件锁内重新读取记录文件，再依次应用排队的结果，
+    多个进程同时记录同一个镜像源也不会丢失彼此的结果。
+    """
+
+    def __init__(self, path=None):
+        """
+        初始化健康记录
+
+        Args:
+            path (str): 记录文件路径，默认为 ~/.fgit.health.json
+        """
+        self.path = path or os.path.expanduser('~/.fgit.health.json')
+        self.lock = threading.RLock()
+        self.mirrors = self._load()
+        self.pending = []
+        self.saved = time.monotonic()
+
+    def _load(self):
+        """读取记录文件"""
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return {}
+
+    def record(self, mirror, success, size=0, seconds=0, error=None):
+        """
+        记录一次真实操作的结果
+
+        Args:
+            mirror (str): 镜像源名称
+            success (bool): 是否成功
+            size (int): 传输的字节数，未知时为0
+            seconds (float): 耗时（秒）
+            error (str): 失败原因分类
+        """
+        telemetry.attempt(mirror, success, size, seconds, error)
+        result = ('record', mirror, success, size, seconds, error, time.time())
+        with self.lock:
+            _apply(self.mirrors, result)
+            entry = self.mirrors[mirror]
+            if not success and entry['failures'] >= FAILURE_THRESHOLD:
+                logger.debug(f"⛔ 镜像源 {mirror} 连续失败 {entry['failures']} 次, 暂停使用 {COOLDOWN} 秒")
+            self.pending.append(result)
+            if time.monotonic() - self.saved >= SAVE_INTERVAL:
+                self.save()
+            else:
+                with _stores_lock:
+                    _stores.add(self)
+
+    def record_probe(self, mirror, throughput):
+        """
+        记录测速得到的吞吐量，仅在没有真实传输数据时作为速度参考，需调用 save 写入
+
+        Args:
+            mirror (str): 镜像源名称
+            throughput (float): 吞吐量（字节/秒）
+        """
+        result = ('probe', mirror, throughput)
+        with self.lock:
+            _apply(self.mirrors, result)
+            self.pending.append(result)
+
+    def is_open(self, mirror):
+        """
+        判断镜像源是否处于熔断状态
+
+        Args:
+            mirror (str): 镜像源名称
+
+        Returns:
+            bool: 熔断中返回True
+        """
+        return self.mirrors.get(mirror, {}).get('open_until', 0) > time.time()
+
+    def score(self, mirror):
+        """
+        计算镜像源评分：成功率 × 速度，越大越好
+
+        Args:
+            mirror (str): 镜像源名称
+
+        Returns:
+            float or None: 评分，没有速度数据时返回None
+        """
+        entry = self.mirrors.get(mirror)
+        if not entry or not entry.get('speed'):
+            return None
+        return entry['success'] * entry['speed']
+
+    def order(self, mirrors):
+        """
+        按健康评分对镜像源排序，并跳过熔断中的镜像源
+
+        没有评分的镜像源保持原有的相对位置排在有评分的之后；
+        所有镜像源都在熔断时返回原列表。
+
+        Args:
+            mirrors (list): 镜像源列表
+
+        Returns:
+            list: 排序后的镜像源列表
+        """
+        available = [m for m in mirrors if not self.is_open(m)]
+        if not available:
+            return list(mirrors)
+        skipped = [m for m in mirrors if m not in available]
+        if skipped:
+            logger.debug(f"⛔ 跳过熔断中的镜像源: {skipped}")
+        return sorted(available, key=lambda m: -(self.score(m) or 0))
+
+    def order_raw(self, mirrors):
+        """
+        按 raw 文件下载的健康记录对 RAWCONTENT_MIRRORS 中的镜像源排序
+
+        Args:
+            mirrors (list): 镜像源名称列表
+
+        Returns:
+            list: 排序后的镜像源名称列表
+        """
+        return [key[len(RAW_PREFIX):] for key in self.order([raw_key(m) for m in mirrors])]
+
+    def save(self):
+        """在文件锁内重新读取记录文件，应用本进程排队的结果后写入"""
+        with self.lock:
+            self.saved = time.monotonic()
+            if not self.pending:
+                return
+            tmp_path = None
+            try:
+                with FileLock(self.path + '.lock'):
+                    mirrors = self._load()
+                    for result in self.pending:
+                        _apply(mirrors, result)
+                    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or '.', suffix='.tmp')
+                    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                        json.dump(mirrors, f)
+                    os.replace(tmp_path, self.path)
+                    tmp_path = None
+            except OSError as e:
+                logger.warning(f"无法写入镜像源健康记录: {e}")
+                return
+            finally:
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self.mirrors = mirrors
+            self.pending.clear()
+
+
+def flush():
+    """写入所有实例尚未写入的记录，在进程退出时调用"""
+    with _stores_lock:
+        stores = list(_stores)
+        _stores.clear()
+    for store in stores:
+        store.save()
+
+
+atexit.register(flush)
+
+
+def _apply(mirrors, result):
+    """
+    将一次结果应用到记录中
+
+    Args:
+        mirrors (dict): 镜像源名称到记录的映射
+        result (tuple): ('record', 镜像源, 是否成功, 字节数, 耗时, 失败原因, 时间)
+            或 ('probe', 镜像源, 吞吐量)
+    """
+    entry = mirrors.setdefault(result[1], {'success': 1.0, 'speed': None, 'failures': 0})
+    if result[0] == 'probe':
+        if not entry.get('measured'):
+            entry['speed'] = result[2]
+        return
+    _, _, success, size, seconds, error, now = result
+    entry['success'] = _ewma(entry['success'], 1.0 if success else 0.0)
+    entry['updated'] = now
+    if success:
+        entry['failures'] = 0
+        entry.pop('open_until', None)
+        if size and seconds > 0:
+            entry['speed'] = _ewma(entry['speed'] if entry.get('measured') else None, size / seconds)
+            entry['measured'] = True
+    else:
+        entry['failures'] += 1
+        entry['error'] = error
+        if entry['failures'] >= FAILURE_THRESHOLD:
+            entry['open_until'] = now + COOLDOWN
+
+
+def _ewma(previous, value):
+    """计算指数加权平均，没有历史值时直接使用新值"""
+    if previous is None:
+        return value
+    return EWMA_ALPHA * value + (1 - EWMA_ALPHA) * previous
@@ -0,0 +1,108 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+_client = None
+
+
+class HTTPClient:
+    """共享的 HTTP 客户端，复用连接并统一超时、重试与代理设置"""
+
+    def __init__(self, connect_timeout=5, read_timeout=30, retries=2, backoff=0.5, pool_size=16, proxy=None):
+        """
+        初始化 HTTP 客户端
+
+        Args:
+            connect_timeout (float): 连接超时（秒）
+            read_timeout (float): 读取超时（秒）
+            retries (int): 连接失败或服务端 429/5xx 时的重试次数（仅 GET/HEAD）
+            backoff (float): 重试的指数退避系数（秒）
+            pool_size (int): 每个主机保持的连接数
+            proxy (str): 代理地址
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset({'GET', 'HEAD'}), raise_on_status=False)
+        self.session = self._create_session(retry, pool_size)
+        # 测速、竞速等探测请求需要快速失败，不做重试
+        self.probe_session = self._create_session(Retry(total=0, redirect=10, raise_on_status=False), pool_size)
+        self.set_proxy(proxy)
+
+    @staticmethod
+    def _create_session(retry, pool_size):
+        """创建挂载了连接池与重试策略的会话"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def set_proxy(self, proxy):
+        """
+        设置代理，None 表示使用环境变量中的代理设置
+
+        Args:
+            proxy (str): 代理地址
+        """
+        proxies = {'http': proxy, 'https': proxy} if proxy else {}
+        self.session.proxies = dict(proxies)
+        self.probe_session.proxies = dict(proxies)
+
+    def request(self, method, url, retry=True, **kwargs):
+        """
+        发送请求
+
+        Args:
+            method (str): 请求方法
+            url (str): 请求URL
+            retry (bool): 是否按配置重试，探测请求与 GitHub API 等需要严格超时、
+                遇到限流应立即回退的请求应设为False
+            **kwargs: 传给 requests 的其他参数，未指定 timeout 时使用默认超时
+
+        Returns:
+            requests.Response: 响应
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        session = self.session if retry else self.probe_session
+        return session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        """发送 GET 请求"""
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """发送 POST 请求"""
+        return self.request('POST', url, **kwargs)
+
+
+def get_client():
+    """
+    获取共享的 HTTP 客户端，未配置时使用默认参数创建
+
+    Returns:
+        HTTPClient: 客户端实例
+    """
+    global _client
+    if _client is None:
+        _client = HTTPClient()
+    return _client
+
+
+def configure(config):
+    """
+    根据 [http] 配置重新创建共享的 HTTP 客户端
+
+    Args:
+        config (ConfigHandler): 配置处理器实例
+
+    Returns:
+        HTTPClient: 客户端实例
+    """
+    global _client
+    http_config = config.get_http_config()
+    _client = HTTPClient(connect_timeout=float(http_config.get('connect_timeout', 5)),
+                         read_timeout=float(http_config.get('read_timeout', 30)),
+                         retries=int(http_config.get('retries', 2)),
+                         backoff=float(http_config.get('backoff', 0.5)),
+                         pool_size=int(http_config.get('pool_size', 16)))
+    return _client
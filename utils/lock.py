@@ -0,0 +1,71 @@
+import os
+import time
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+
+class FileLock:
+    """基于文件的进程间互斥锁，可用作上下文管理器"""
+
+    def __init__(self, path):
+        """
+        初始化文件锁
+
+        Args:
+            path (str): 锁文件路径
+        """
+        self.path = path
+        self.file = None
+
+    def acquire(self, blocking=True, timeout=None):
+        """
+        获取锁
+
+        Args:
+            blocking (bool): 是否等待锁释放
+            timeout (float): 最长等待时间（秒），None 表示一直等待
+
+        Returns:
+            bool: 是否成功获取锁
+        """
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.file = open(self.path, 'a+')
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                if os.name == 'nt':
+                    self.file.seek(0)
+                    msvcrt.locking(self.file.fileno(), msvcrt.LK_NBLCK, 1)
+                else:
+                    fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except OSError:
+                if not blocking or (deadline is not None and time.monotonic() >= deadline):
+                    self.file.close()
+                    self.file = None
+                    return False
+                time.sleep(0.05)
+
+    def release(self):
+        """释放锁"""
+        if self.file is None:
+            return
+        try:
+            if os.name == 'nt':
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
@@ -1,9 +1,34 @@
+import os
+import sys
+import ssl
+import time
+import queue
+import asyncio
+import threading
+import subprocess
 from loguru import logger
-from ping3 import ping
-from concurrent.futures import ThreadPoolExecutor
-from prettytable import PrettyTable
 from colorama import Fore, Style
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urljoin
+from utils.http import get_client
+from utils import telemetry
+
+# smart-HTTP 引用发现响应与 zip/tar.gz 压缩包的起始字节
+GIT_ADVERTISEMENT_PREFIX = b'001e# service=git-upload-pack'
+# 部分服务端（如 git http-backend）的协议 v2 响应不带 service 行
+GIT_V2_ADVERTISEMENT_PREFIX = b'000eversion 2\n'
+ZIP_PREFIX = b'PK'
+TAR_GZ_PREFIX = b'\x1f\x8b'
+
+# 镜像源测速使用的仓库、读取字节数与单个镜像源的测试时限（秒）
+PROBE_REPO = 'git/git'
+PROBE_BYTES = 64 * 1024
+PROBE_TIMEOUT = 5
+# 评分按下载该字节数的预计耗时计算
+SCORE_REFERENCE_BYTES = 1024 * 1024
+# 等待其他进程测速的最长时间（秒）
+REFRESH_WAIT = PROBE_TIMEOUT * 3
+# 后台刷新进程的参数：其他进程正在测速或缓存已被更新时直接退出
+BACKGROUND_FLAG = '--background'
 
 # 定义可用的镜像源
 MIRRORS = {
@@ -21,88 +46,261 @@ MIRRORS = {
     'gh-deno': 'https://gh-deno.mocn.top/https://github.com'
 }
 
+# 批量克隆时多个线程共用同一个配置处理器
+_capabilities_lock = threading.Lock()
+
 RAWCONTENT_MIRRORS = {
     'github': 'https://raw.githubusercontent.com',
     'ghproxy.net': 'https://ghproxy.net/https://raw.githubusercontent.com',
+    'ghfast': 'https://ghfast.top/https://raw.githubusercontent.com',
+    'kgithub': 'https://raw.kkgithub.com',
 }
 
 
-def test_latency(verbose=False):
+def test_latency(verbose=False, health=None):
     """
-    测试所有镜像源的延迟
-    
+    测试所有镜像源的连接耗时、首字节时间与吞吐量
+
     Args:
         verbose (bool): 是否显示详细信息
-        
+        health (HealthStore): 健康记录，提供时会写入测得的吞吐量
+
     Returns:
-        list: 按延迟排序的镜像源名称列表
+        list: 按综合评分排序的镜像源名称列表
     """
-    logger.info(Fore.CYAN + "🔎 测试镜像源延迟..." + Style.RESET_ALL)
+    from prettytable import PrettyTable
+
+    logger.info(Fore.CYAN + "🔎 测试镜像源速度..." + Style.RESET_ALL)
     table = PrettyTable()
-    table.field_names = ['Git 镜像源', 'Latency 延迟']
-    
-    results = {}
-    with ThreadPoolExecutor() as executor:
-        futures = {executor.submit(test_single, name, url): name for name, url in MIRRORS.items()}
-        for future in futures:
-            name, latency = future.result()
-            results[name] = latency
-            if latency is not None and latency != 0.0:
-                color = Fore.GREEN if latency < 200 else Fore.YELLOW if latency < 500 else Fore.RED
-                table.add_row([name, color + f"{latency:.1f}ms" + Style.RESET_ALL])
-            else:
-                table.add_row([name, Fore.RED + "超时" + Style.RESET_ALL])
-    
+    table.field_names = ['Git 镜像源', 'Connect 连接', 'TTFB 首字节', 'Throughput 吞吐', 'Score 评分']
+
+    results = dict(asyncio.run(probe_all()))
+    for name, result in results.items():
+        if result is not None:
+            score = result['score'] * 1000
+            color = Fore.GREEN if score < 500 else Fore.YELLOW if score < 1500 else Fore.RED
+            table.add_row([name, f"{result['connect'] * 1000:.1f}ms", f"{result['ttfb'] * 1000:.1f}ms",
+                           f"{result['throughput'] / 1024:.1f}KB/s", color + f"{score:.1f}" + Style.RESET_ALL])
+            if health is not None:
+                health.record_probe(name, result['throughput'])
+        else:
+            table.add_row([name, '-', '-', '-', Fore.RED + "失败" + Style.RESET_ALL])
+
     if verbose:
         print(table)
-    
-    # 按延迟排序，None值排在最后
-    sorted_mirrors = sorted(results.items(), key=lambda x: x[1] or float('inf'))
-    return [k for k, v in sorted_mirrors if v is not None]
+
+    # 按评分排序，失败的镜像源不参与
+    sorted_mirrors = sorted((item for item in results.items() if item[1] is not None), key=lambda x: x[1]['score'])
+    return [k for k, v in sorted_mirrors]
 
 
-def test_single(name, url):
+async def probe_all(repo=PROBE_REPO):
     """
-    测试单个镜像源的延迟
-    
+    并发测试所有镜像源
+
+    Args:
+        repo (str): 用于测试的仓库（owner/repo）
+
+    Returns:
+        list: [(镜像源名称, 测试结果字典或None), ...]
+    """
+    ssl_context = ssl.create_default_context()
+    return await asyncio.gather(*(probe_single(name, url, repo, ssl_context) for name, url in MIRRORS.items()))
+
+
+async def probe_single(name, url, repo=PROBE_REPO, ssl_context=None):
+    """
+    通过 smart-HTTP 引用发现请求测试单个镜像源
+
+    整个测试必须在 PROBE_TIMEOUT 内完成，超时视为失败。
+
     Args:
         name (str): 镜像源名称
         url (str): 镜像源URL
-        
+        repo (str): 用于测试的仓库（owner/repo）
+        ssl_context (ssl.SSLContext): 共用的 SSL 上下文
+
     Returns:
-        tuple: (镜像源名称, 延迟时间)
+        tuple: (镜像源名称, 测试结果字典)，失败时结果为None。
+            结果字典包含 connect、ttfb（秒）、throughput（字节/秒）与 score（越小越好）
     """
-    host = urlparse(url).netloc
+    target = f"{url}/{repo}.git/info/refs?service=git-upload-pack"
     try:
-        latency = ping(host, unit='ms', timeout=2)
-        return (name, latency)
-    except:
+        return (name, await asyncio.wait_for(_probe(target, ssl_context or ssl.create_default_context()),
+                                             PROBE_TIMEOUT))
+    except Exception:
         return (name, None)
 
 
-def select_mirror(config, verbose=False):
+async def _probe(target, ssl_context):
+    """
+    测量连接耗时、首字节时间，并读取最多 PROBE_BYTES 字节计算吞吐量
+
+    使用 HTTP/1.0 请求，避免分块编码，最多跟随 3 次重定向。
+
+    Args:
+        target (str): 请求URL
+        ssl_context (ssl.SSLContext): SSL 上下文
+
+    Returns:
+        dict or None: 测试结果字典，失败时返回None
+    """
+    for _ in range(4):
+        parsed = urlparse(target)
+        https = parsed.scheme == 'https'
+        start = time.monotonic()
+        reader, writer = await asyncio.open_connection(parsed.hostname, parsed.port or (443 if https else 80),
+                                                       ssl=ssl_context if https else None)
+        try:
+            connect_time = time.monotonic() - start
+            writer.write(f"GET {parsed.path}?{parsed.query} HTTP/1.0\r\nHost: {parsed.netloc}\r\n"
+                         f"User-Agent: git/2.0\r\nConnection: close\r\n\r\n".encode())
+            await writer.drain()
+            status_line = await reader.readline()
+            ttfb = time.monotonic() - start
+            headers = {}
+            while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                key, _, value = line.decode('latin-1').partition(':')
+                headers[key.strip().lower()] = value.strip()
+            status = int(status_line.split()[1])
+            if status in (301, 302, 303, 307, 308) and 'location' in headers:
+                target = urljoin(target, headers['location'])
+                continue
+            if status != 200:
+                return None
+
+            head = b''
+            received = 0
+            body_start = time.monotonic()
+            while received < PROBE_BYTES:
+                data = await reader.read(16384)
+                if not data:
+                    break
+                if len(head) < len(GIT_ADVERTISEMENT_PREFIX):
+                    head += data[:len(GIT_ADVERTISEMENT_PREFIX) - len(head)]
+                received += len(data)
+
+            # 排除返回错误页面的镜像源
+            if not head.startswith(GIT_ADVERTISEMENT_PREFIX):
+                return None
+
+            throughput = received / max(time.monotonic() - body_start, 1e-3)
+            return {
+                'connect': connect_time,
+                'ttfb': ttfb,
+                'throughput': throughput,
+                # 预计完成连接并下载 SCORE_REFERENCE_BYTES 所需的时间
+                'score': ttfb + SCORE_REFERENCE_BYTES / throughput,
+            }
+        finally:
+            writer.close()
+    return None
+
+
+@telemetry.phase('select_mirror')
+def select_mirror(config, verbose=False, health=None):
     """
     选择最佳镜像源
-    
+
+    缓存过期时直接返回旧的排序，并在后台进程中重新测速；
+    只有完全没有缓存时才会阻塞等待测速完成。
+    提供健康记录时，按真实操作的评分重新排序并跳过熔断中的镜像源。
+
     Args:
         config (ConfigHandler): 配置处理器实例
         verbose (bool): 是否显示详细信息
-        
+        health (HealthStore): 健康记录
+
     Returns:
         list: 镜像源列表
     """
     # 检查是否有缓存的镜像源列表
     if cached := config.get_mirrors():
-        logger.debug(Fore.CYAN + f"✔️ 已选择 {cached}(缓存) 作为 Git 镜像源" + Style.RESET_ALL)
-        return cached
-        
-    # 测试所有镜像源并保存结果
-    mirrors = test_latency(verbose)
-    config.save_mirrors(mirrors)
-    logger.debug(Fore.CYAN + f"✔️ 已选择 {mirrors} 作为 Git 镜像源" + Style.RESET_ALL)
+        mirrors = cached
+        source = '缓存'
+    elif stale := config.get_mirrors(allow_stale=True):
+        if not config.refresh_running():
+            spawn_refresh()
+        mirrors = stale
+        source = '过期缓存, 后台刷新中'
+    else:
+        # 测试所有镜像源并保存结果, 其他进程正在测速时等待其结果
+        mirrors = refresh_mirrors(config, verbose, health, force=False)
+        source = '测速'
+
+    if health is not None:
+        mirrors = health.order(mirrors)
+    logger.debug(Fore.CYAN + f"✔️ 已选择 {mirrors}({source}) 作为 Git 镜像源" + Style.RESET_ALL)
     return mirrors
 
 
+def refresh_mirrors(config, verbose=False, health=None, force=True, wait=True):
+    """
+    重新测试所有镜像源并保存结果
+
+    同一时间只有持有刷新者锁的进程测速；其他进程等待其完成后直接使用新的结果，
+    或在不等待时直接返回None。
+
+    Args:
+        config (ConfigHandler): 配置处理器实例
+        verbose (bool): 是否显示详细信息
+        health (HealthStore): 健康记录
+        force (bool): 缓存未过期时是否仍然测速，为False时直接使用其他进程刚保存的结果
+        wait (bool): 其他进程正在测速时是否等待
+
+    Returns:
+        list or None: 按评分排序的镜像源列表，全部失败时返回完整的镜像源列表；
+            不等待且其他进程正在测速时返回None
+    """
+    lock = config.refresh_lock()
+    leader = lock.acquire(blocking=False)
+    if not leader:
+        if not wait:
+            logger.debug("其他进程正在测速, 跳过")
+            return None
+        logger.info(Fore.CYAN + "⏳ 其他进程正在测速, 等待结果..." + Style.RESET_ALL)
+        # 等待超时后不再等待, 自行测速
+        leader = lock.acquire(timeout=REFRESH_WAIT)
+        config.load_config()
+        if mirrors := config.get_mirrors():
+            lock.release()
+            return mirrors
+    try:
+        if not force:
+            config.load_config()
+            if mirrors := config.get_mirrors():
+                return mirrors
+        mirrors = test_latency(verbose, health)
+        if health is not None:
+            health.save()
+        if not mirrors:
+            logger.warning(Fore.YELLOW + "🧐 所有镜像源测速失败, 将依次尝试全部镜像源" + Style.RESET_ALL)
+            return list(MIRRORS)
+        config.save_mirrors(mirrors)
+        return mirrors
+    finally:
+        if leader:
+            lock.release()
+
+
+def spawn_refresh():
+    """启动独立的后台进程执行 fgit refresh-mirrors --background，不等待其结束"""
+    if getattr(sys, 'frozen', False) or '__compiled__' in globals():
+        cmd = [sys.argv[0], 'refresh-mirrors', BACKGROUND_FLAG]
+    else:
+        cmd = [sys.executable, os.path.abspath(sys.argv[0]), 'refresh-mirrors', BACKGROUND_FLAG]
+    kwargs = {'stdin': subprocess.DEVNULL, 'stdout': subprocess.DEVNULL, 'stderr': subprocess.DEVNULL}
+    if os.name == 'nt':
+        kwargs['creationflags'] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs['start_new_session'] = True
+    try:
+        subprocess.Popen(cmd, **kwargs)
+        logger.debug(f"🔄 后台刷新镜像源: {' '.join(cmd)}")
+    except OSError as e:
+        logger.debug(f"无法启动后台刷新: {e}")
+
+
 def convert_url(url, mirror):
     """
     将URL转换为使用指定镜像源的URL
@@ -117,4 +315,210 @@ def convert_url(url, mirror):
     if mirror == 'github':
         return url
     base = MIRRORS[mirror]
-    return url.replace('https://github.com', base)
\ No newline at end of file
+    return url.replace('https://github.com', base)
+
+
+def convert_raw_url(path, mirror):
+    """
+    将 raw.githubusercontent.com 上的文件路径转换为使用指定镜像源的URL
+
+    Args:
+        path (str): owner/repo/ref/文件路径
+        mirror (str): RAWCONTENT_MIRRORS 中的镜像源名称
+
+    Returns:
+        str: 转换后的URL
+    """
+    return f"{RAWCONTENT_MIRRORS[mirror]}/{path}"
+
+
+@telemetry.phase('capabilities')
+def get_mirror_capabilities(config, mirror, repo_url):
+    """
+    获取镜像源支持的 upload-pack 能力，优先使用配置文件中的缓存
+
+    Args:
+        config (ConfigHandler): 配置处理器实例
+        mirror (str): 镜像源名称
+        repo_url (str): 用于探测的仓库URL
+
+    Returns:
+        set: 能力集合，如 {'v2', 'filter', 'shallow'}，探测失败时为空集合
+    """
+    with _capabilities_lock:
+        cached = config.get_capabilities(mirror)
+        if cached is not None:
+            return cached
+        caps = probe_capabilities(convert_url(repo_url, mirror) + '.git/info/refs?service=git-upload-pack')
+        if caps is None:
+            return set()
+        logger.debug(f"镜像源 {mirror} 支持: {sorted(caps)}")
+        config.save_capabilities(mirror, caps)
+        return caps
+
+
+def probe_capabilities(url, timeout=5):
+    """
+    以协议 v2 请求引用发现，解析服务端声明的能力
+
+    Args:
+        url (str): info/refs 请求URL
+        timeout (float): 请求超时时间（秒）
+
+    Returns:
+        set or None: 能力集合，请求失败时返回None
+    """
+    try:
+        with get_client().get(url, headers={'Git-Protocol': 'version=2'}, stream=True, timeout=timeout,
+                              retry=False) as response:
+            if response.status_code != 200:
+                return None
+            data = b''
+            for chunk in response.iter_content(chunk_size=4096):
+                data += chunk
+                if len(data) >= 8192:
+                    break
+    except Exception:
+        return None
+    if not data.startswith((GIT_ADVERTISEMENT_PREFIX, GIT_V2_ADVERTISEMENT_PREFIX)):
+        return None
+    return parse_capabilities(data)
+
+
+def parse_capabilities(data):
+    """
+    从 pkt-line 格式的引用发现响应中解析能力
+
+    协议 v2 中为 `version 2` 之后的 `key=value` 行，
+    协议 v0 中为第一条引用行 NUL 之后以空格分隔的列表。
+
+    Args:
+        data (bytes): 响应内容
+
+    Returns:
+        set: 能力集合
+    """
+    caps = set()
+    pos = 0
+    while pos + 4 <= len(data):
+        try:
+            length = int(data[pos:pos + 4], 16)
+        except ValueError:
+            break
+        if length < 4:
+            # flush-pkt / delim-pkt
+            pos += 4
+            continue
+        if pos + length > len(data):
+            break
+        line = data[pos + 4:pos + length].rstrip(b'\n').decode('utf-8', 'replace')
+        pos += length
+        if line.startswith('#'):
+            continue
+        if line == 'version 2':
+            caps.add('v2')
+        elif '\0' in line:
+            caps.update(line.split('\0', 1)[1].split())
+        elif 'v2' in caps:
+            key, _, value = line.partition('=')
+            caps.add(key)
+            caps.update(value.split())
+    return caps
+
+
+@telemetry.phase('race')
+def race_mirrors(mirror_list, build_url, count=3, probe_bytes=16384, min_speed=0, timeout=5, expect=None):
+    """
+    同时向排名靠前的多个镜像源发起请求，选出最先达到速度要求的镜像源
+
+    只读取响应的前 probe_bytes 字节，胜出者产生后其余请求立即停止。
+
+    Args:
+        mirror_list (list): 镜像源列表
+        build_url (callable): 根据镜像源名称生成请求URL的函数
+        count (int): 参与竞速的镜像源数量
+        probe_bytes (int): 每个镜像源读取的字节数
+        min_speed (float): 胜出所需的最低速度（字节/秒）
+        timeout (float): 竞速的最长时间（秒）
+        expect (bytes): 响应内容必须以此开头，用于排除返回错误页面的镜像源
+
+    Returns:
+        list: 调整顺序后的镜像源列表，胜出者在前，失败者在后
+    """
+    candidates = mirror_list[:count]
+    if len(candidates) < 2:
+        return mirror_list
+
+    logger.debug(f"🏁 镜像源竞速: {candidates}")
+    results = queue.Queue()
+    stop = threading.Event()
+    for mirror in candidates:
+        threading.Thread(target=race_single, daemon=True,
+                         args=(mirror, build_url(mirror), probe_bytes, timeout, expect, stop, results)).start()
+
+    winner = None
+    finished = {}
+    failed = []
+    deadline = time.monotonic() + timeout
+    for _ in candidates:
+        try:
+            mirror, speed = results.get(timeout=max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            break
+        if speed is None:
+            failed.append(mirror)
+        elif speed >= min_speed:
+            winner = mirror
+            break
+        else:
+            finished[mirror] = speed
+    stop.set()
+
+    if winner is None and finished:
+        winner = max(finished, key=finished.get)
+    if winner is None:
+        logger.debug("🏁 竞速无结果, 保持原顺序")
+        return [m for m in mirror_list if m not in failed] + failed
+
+    logger.info(Fore.GREEN + f"🏁 竞速胜出镜像源: {winner}" + Style.RESET_ALL)
+    return [winner] + [m for m in mirror_list if m != winner and m not in failed] + failed
+
+
+def race_single(mirror, url, probe_bytes, timeout, expect, stop, results):
+    """
+    竞速中的单个镜像源请求
+
+    Args:
+        mirror (str): 镜像源名称
+        url (str): 请求URL
+        probe_bytes (int): 读取的字节数
+        timeout (float): 请求超时时间（秒）
+        expect (bytes): 响应内容必须以此开头
+        stop (threading.Event): 竞速结束信号
+        results (queue.Queue): 结果队列，放入 (镜像源名称, 速度)，失败时速度为None
+    """
+    start = time.monotonic()
+    head = b''
+    received = 0
+    try:
+        with get_client().get(url, stream=True, timeout=timeout, retry=False) as response:
+            if response.status_code != 200:
+                results.put((mirror, None))
+                return
+            for data in response.iter_content(chunk_size=4096):
+                if stop.is_set():
+                    return
+                if len(head) < len(expect or b''):
+                    head += data[:len(expect) - len(head)]
+                received += len(data)
+                if received >= probe_bytes:
+                    break
+        if expect and not head.startswith(expect):
+            results.put((mirror, None))
+        elif received < probe_bytes:
+            # 响应已完整读取, 视为达到速度要求
+            results.put((mirror, float('inf')))
+        else:
+            results.put((mirror, received / max(time.monotonic() - start, 1e-6)))
+    except Exception:
+        results.put((mirror, None))
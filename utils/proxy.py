@@ -1,6 +1,6 @@
 import os
 from loguru import logger
-import requests
+from utils.http import get_client
 
 
 class ProxyHandler:
@@ -31,7 +31,7 @@ class ProxyHandler:
         env = os.environ.copy()
         if self.proxy_url:
             try:
-                requests.get(self.proxy_url, timeout=2)
+                get_client().get(self.proxy_url, timeout=2, retry=False)
             except Exception as e:
                 logger.exception(f'Error connecting to proxy server: {e}')
                 logger.error("无法连接到代理服务器, 代理模式将不可用")
@@ -40,6 +40,8 @@ class ProxyHandler:
             logger.debug(f"🌐 设置代理: {self.proxy_url}")
             env['HTTP_PROXY'] = self.proxy_url
             env['HTTPS_PROXY'] = self.proxy_url
+            # git 通过环境变量使用代理, fgit 自身的请求通过共享客户端使用代理
+            get_client().set_proxy(self.proxy_url)
         return env
 
     def restore_proxy_settings(self):
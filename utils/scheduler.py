@@ -0,0 +1,381 @@
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from loguru import logger
+from colorama import Fore, Style
+from utils.lock import FileLock
+
+# 租约的心跳间隔与过期时间（秒），进程异常退出后其租约在过期后自动释放
+HEARTBEAT = 1.0
+LEASE_TTL = 10.0
+# 等待连接名额时的轮询间隔（秒）
+POLL_INTERVAL = 0.2
+# 令牌桶容量对应的时长（秒），限制空闲后的突发流量
+BURST = 0.5
+# 后台刷新等待其他传输结束的最长时间（秒）
+IDLE_WAIT = 60
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+_settings = {'enabled': True, 'path': os.path.expanduser('~/.fgit/scheduler.json'), 'max_rate': 0,
+             'per_mirror': 8, 'background_weight': 0.2, 'priority': INTERACTIVE}
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+class Lease:
+    """一次传输占用的连接名额与带宽份额"""
+
+    def __init__(self, scheduler, host, priority):
+        """
+        初始化租约
+
+        Args:
+            scheduler (Scheduler): 所属调度器，None 表示不受调度
+            host (str): 镜像源主机
+            priority (str): interactive 或 background
+        """
+        self.scheduler = scheduler
+        self.id = uuid.uuid4().hex
+        self.host = host
+        self.priority = priority
+        self.connections = 1
+        self.rate = 0
+        self.lock = threading.Lock()
+        self.tokens = 0
+        self.updated = time.monotonic()
+
+    def entry(self, now, active):
+        """租约在共享状态文件中的记录"""
+        return {'pid': os.getpid(), 'host': self.host, 'priority': self.priority,
+                'connections': self.connections, 'active': active, 'heartbeat': now}
+
+    def expand(self, connections):
+        """
+        尝试将连接数扩大到 connections，不等待
+
+        Args:
+            connections (int): 希望使用的连接数
+
+        Returns:
+            int: 实际可用的连接数（至少为当前连接数）
+        """
+        if self.scheduler is None:
+            return connections
+        return self.scheduler.expand(self, connections)
+
+    def throttle(self, size):
+        """
+        令牌桶限速：消耗 size 字节的令牌，令牌不足时等待
+
+        Args:
+            size (int): 本次读取的字节数
+        """
+        with self.lock:
+            rate = self.rate
+            if not rate:
+                return
+            now = time.monotonic()
+            self.tokens = min(rate * BURST, self.tokens + (now - self.updated) * rate) - size
+            self.updated = now
+            delay = -self.tokens / rate
+        if delay > 0:
+            time.sleep(delay)
+
+    def release(self):
+        """释放租约"""
+        if self.scheduler is not None:
+            self.scheduler.release(self)
+
+
+class Scheduler:
+    """
+    同一主机上所有 fgit 进程共用的传输调度器
+
+    各进程的传输以租约的形式记录在共享状态文件中，通过文件锁读写：
+    每个镜像源主机同时使用的连接数不超过 per_mirror，等待名额时交互命令优先于后台刷新；
+    设置了总带宽上限时，按租约的连接数与优先级权重分配带宽，由各租约的令牌桶限速。
+    """
+
+    def __init__(self, path, max_rate=0, per_mirror=8, background_weight=0.2, priority=INTERACTIVE):
+        """
+        初始化调度器
+
+        Args:
+            path (str): 共享状态文件路径
+            max_rate (float): 本机所有传输的总带宽上限（字节/秒），0 表示不限速
+            per_mirror (int): 每个镜像源主机的最大连接数，0 表示不限制
+            background_weight (float): 后台传输相对于交互传输的带宽权重
+            priority (str): 本进程的优先级，interactive 或 background
+        """
+        self.path = path
+        self.max_rate = max_rate
+        self.per_mirror = per_mirror
+        self.background_weight = background_weight
+        self.priority = priority
+        self.lock = threading.Lock()
+        self.leases = {}
+        self.heartbeat = None
+
+    def _load(self):
+        """读取共享状态文件"""
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return {}
+
+    def _update(self, modify):
+        """
+        在文件锁内读取共享状态、清理过期租约、修改后写回
+
+        Args:
+            modify (callable): 接收 (租约字典, 当前时间)，直接修改租约字典
+
+        Returns:
+            modify 的返回值
+        """
+        with FileLock(self.path + '.lock'):
+            now = time.time()
+            leases = {key: value for key, value in self._load().items() if now - value['heartbeat'] < LEASE_TTL}
+            result = modify(leases, now)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(leases, f)
+            os.replace(tmp_path, self.path)
+        return result
+
+    def _weight(self, entry):
+        return entry['connections'] * (self.background_weight if entry['priority'] == BACKGROUND else 1)
+
+    def _assign_rates(self, leases):
+        """按权重将总带宽分配给本进程的租约"""
+        if not self.max_rate:
+            return
+        total = sum(self._weight(entry) for entry in leases.values() if entry['active'])
+        with self.lock:
+            for lease in self.leases.values():
+                if lease.id in leases and total:
+                    with lease.lock:
+                        lease.rate = self.max_rate * self._weight(leases[lease.id]) / total
+
+    def _used(self, leases, lease):
+        """同一主机上其他租约占用的连接数"""
+        return sum(entry['connections'] for key, entry in leases.items()
+                   if entry['host'] == lease.host and entry['active'] and key != lease.id)
+
+    def acquire(self, url):
+        """
+        获取一个连接名额，名额不足时等待
+
+        Args:
+            url (str): 请求的URL，按其主机计算连接数
+
+        Returns:
+            Lease: 租约
+        """
+        lease = Lease(self, urlsplit(url).netloc, self.priority)
+
+        def grant(leases, now):
+            if self.per_mirror and self._used(leases, lease) + 1 > self.per_mirror or \
+                    lease.priority == BACKGROUND and any(
+                        entry['host'] == lease.host and entry['priority'] == INTERACTIVE and not entry['active']
+                        for entry in leases.values()):
+                leases[lease.id] = lease.entry(now, False)
+                return False
+            leases[lease.id] = lease.entry(now, True)
+            with self.lock:
+                self.leases[lease.id] = lease
+            self._assign_rates(leases)
+            return True
+
+        waiting = False
+        try:
+            while not self._update(grant):
+                if not waiting:
+                    logger.info(Fore.CYAN + f"⏳ 等待 {lease.host} 的连接名额..." + Style.RESET_ALL)
+                    waiting = True
+                time.sleep(POLL_INTERVAL)
+        except BaseException:
+            self.release(lease)
+            raise
+        self._start_heartbeat()
+        return lease
+
+    def expand(self, lease, connections):
+        """
+        在名额允许的范围内扩大租约的连接数
+
+        Args:
+            lease (Lease): 租约
+            connections (int): 希望使用的连接数
+
+        Returns:
+            int: 实际可用的连接数
+        """
+        def grow(leases, now):
+            if self.per_mirror:
+                lease.connections = max(lease.connections,
+                                        min(connections, self.per_mirror - self._used(leases, lease)))
+            else:
+                lease.connections = connections
+            leases[lease.id] = lease.entry(now, True)
+            self._assign_rates(leases)
+            return lease.connections
+
+        granted = self._update(grow)
+        if granted < connections:
+            logger.debug(f"{lease.host} 的连接名额不足, 使用 {granted} 个连接")
+        return granted
+
+    def release(self, lease):
+        """释放租约"""
+        with self.lock:
+            self.leases.pop(lease.id, None)
+
+        def remove(leases, now):
+            leases.pop(lease.id, None)
+            self._assign_rates(leases)
+
+        try:
+            self._update(remove)
+        except OSError as e:
+            logger.debug(f"无法更新传输调度状态: {e}")
+
+    def busy(self):
+        """
+        本机是否有进行中的交互传输
+
+        Returns:
+            bool: 是否有交互传输
+        """
+        return self._update(lambda leases, now: any(entry['priority'] == INTERACTIVE for entry in leases.values()))
+
+    def _start_heartbeat(self):
+        """启动心跳线程，持有租约期间定期刷新心跳并重新分配带宽"""
+        with self.lock:
+            if self.heartbeat is not None and self.heartbeat.is_alive():
+                return
+            self.heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True)
+            self.heartbeat.start()
+
+    def _heartbeat_loop(self):
+        def refresh(leases, now):
+            with self.lock:
+                for lease in self.leases.values():
+                    leases[lease.id] = lease.entry(now, True)
+            self._assign_rates(leases)
+
+        while True:
+            time.sleep(HEARTBEAT)
+            with self.lock:
+                if not self.leases:
+                    self.heartbeat = None
+                    return
+            try:
+                self._update(refresh)
+            except OSError as e:
+                logger.debug(f"无法更新传输调度状态: {e}")
+
+
+def configure(config, background=False):
+    """
+    读取 [scheduler] 配置
+
+    Args:
+        config (ConfigHandler): 配置处理器实例
+        background (bool): 本进程是否为后台刷新
+    """
+    global _scheduler
+    scheduler_config = config.get_scheduler_config()
+    _settings['enabled'] = scheduler_config.get('enabled', 'true').lower() == 'true'
+    _settings['path'] = os.path.expanduser(scheduler_config.get('path', '~/.fgit/scheduler.json'))
+    _settings['max_rate'] = float(scheduler_config.get('max_rate', 0)) * 1024
+    _settings['per_mirror'] = int(scheduler_config.get('per_mirror', 8))
+    _settings['background_weight'] = float(scheduler_config.get('background_weight', 0.2))
+    _settings['priority'] = BACKGROUND if background else INTERACTIVE
+    with _scheduler_lock:
+        _scheduler = None
+
+
+def get_scheduler():
+    """
+    获取进程内共享的调度器
+
+    Returns:
+        Scheduler or None: 未启用时返回None
+    """
+    global _scheduler
+    if not _settings['enabled']:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler(_settings['path'], _settings['max_rate'], _settings['per_mirror'],
+                                   _settings['background_weight'], _settings['priority'])
+        return _scheduler
+
+
+def acquire(url):
+    """
+    获取传输的租约，未启用调度时返回不受限制的租约
+
+    Args:
+        url (str): 请求的URL
+
+    Returns:
+        Lease: 租约，使用完毕后需调用 release()
+    """
+    scheduler = get_scheduler()
+    if scheduler is None:
+        return Lease(None, urlsplit(url).netloc, _settings['priority'])
+    try:
+        return scheduler.acquire(url)
+    except OSError as e:
+        logger.debug(f"无法读取传输调度状态, 不做调度: {e}")
+        return Lease(None, urlsplit(url).netloc, _settings['priority'])
+
+
+@contextmanager
+def transfer(url):
+    """
+    在传输期间持有租约，用于无法限速的 git 传输
+
+    Args:
+        url (str): 请求的URL
+    """
+    lease = acquire(url)
+    try:
+        yield lease
+    finally:
+        lease.release()
+
+
+def wait_idle(timeout=IDLE_WAIT):
+    """
+    等待本机的交互传输结束，供后台刷新让位
+
+    Args:
+        timeout (float): 最长等待时间（秒）
+
+    Returns:
+        bool: 是否已没有交互传输
+    """
+    scheduler = get_scheduler()
+    if scheduler is None:
+        return True
+    deadline = time.monotonic() + timeout
+    try:
+        while scheduler.busy():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(HEARTBEAT)
+    except OSError as e:
+        logger.debug(f"无法读取传输调度状态: {e}")
+    return True
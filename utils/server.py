@@ -0,0 +1,543 @@
+import os
+import re
+import gzip
+import time
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from loguru import logger
+from colorama import Fore, Style
+from utils.config import ConfigHandler
+from utils.health import HealthStore
+from utils.affinity import get_index
+from utils.cache import get_dir_size
+from utils.http import get_client
+from utils import scheduler
+from utils.mirrors import select_mirror, refresh_mirrors, convert_url, GIT_ADVERTISEMENT_PREFIX, GIT_V2_ADVERTISEMENT_PREFIX, ZIP_PREFIX, TAR_GZ_PREFIX
+
+# 转发给客户端的数据块大小
+RELAY_CHUNK = 64 * 1024
+
+REPO_PATTERN = r'/(?P<owner>[^/]+)/(?P<repo>[^/]+?)(?:\.git)?'
+INFO_REFS_RE = re.compile(REPO_PATTERN + r'/info/refs$')
+UPLOAD_PACK_RE = re.compile(REPO_PATTERN + r'/git-upload-pack$')
+ARCHIVE_RE = re.compile(REPO_PATTERN + r'/archive/(?P<ref>.+)\.(?P<format>zip|tar\.gz)$')
+
+
+class MirrorProxy:
+    """smart-HTTP 缓存代理的共享状态：镜像源排序、健康记录与磁盘缓存"""
+
+    def __init__(self, config, root, max_size, refresh_interval=3600, verbose=False):
+        """
+        初始化代理状态
+
+        Args:
+            config (ConfigHandler): 配置处理器实例
+            root (str): 缓存目录
+            max_size (int): 缓存总大小上限（字节）
+            refresh_interval (float): 重新测速的间隔（秒）
+            verbose (bool): 是否显示详细信息
+        """
+        self.root = root
+        self.max_size = max_size
+        self.refresh_interval = refresh_interval
+        self.verbose = verbose
+        self.health = HealthStore()
+        self.mirrors = select_mirror(config, verbose, self.health)
+        # 每个仓库最近一次成功返回引用的镜像源, 后续请求优先使用以保证引用一致
+        self.affinity = {}
+        self.lock = threading.Lock()
+        self.size = get_dir_size(root)
+
+    @classmethod
+    def from_config(cls, config, verbose=False):
+        """
+        根据 [serve] 配置创建代理状态
+
+        Args:
+            config (ConfigHandler): 配置处理器实例
+            verbose (bool): 是否显示详细信息
+
+        Returns:
+            MirrorProxy: 代理状态
+        """
+        serve_config = config.get_serve_config()
+        return cls(config, os.path.expanduser(serve_config.get('dir', '~/.fgit/serve')),
+                   int(serve_config.get('max_size', 10240)) * 1024 * 1024,
+                   float(serve_config.get('refresh_interval', 3600)), verbose)
+
+    def ordered(self, slug):
+        """
+        获取仓库应尝试的镜像源顺序
+
+        Args:
+            slug (str): owner/repo
+
+        Returns:
+            list: 镜像源列表
+        """
+        with self.lock:
+            mirrors = get_index().order(slug, self.health.order(self.mirrors))
+            preferred = self.affinity.get(slug)
+        if preferred in mirrors:
+            mirrors.remove(preferred)
+            mirrors.insert(0, preferred)
+        return mirrors
+
+    def remember(self, slug, mirror):
+        """记录仓库最近使用的镜像源"""
+        with self.lock:
+            self.affinity[slug] = mirror
+        get_index().record(slug, mirror, True)
+
+    def refresh_loop(self):
+        """定期重新测速并更新内存中的镜像源排序"""
+        while True:
+            time.sleep(self.refresh_interval)
+            # 定期测速与后台刷新一样让位于本机正在进行的传输
+            scheduler.wait_idle()
+            try:
+                mirrors = refresh_mirrors(ConfigHandler(), self.verbose, self.health)
+            except Exception as e:
+                logger.debug(f"重新测速失败: {e}")
+                continue
+            with self.lock:
+                self.mirrors = mirrors
+            logger.info(Fore.CYAN + f"🔄 镜像源排序已更新: {mirrors}" + Style.RESET_ALL)
+
+    def cache_path(self, *parts):
+        """
+        获取缓存文件路径
+
+        Args:
+            *parts (str): 相对缓存目录的路径片段
+
+        Returns:
+            str: 缓存文件路径
+        """
+        return os.path.join(self.root, *parts)
+
+    def lookup(self, path):
+        """
+        检查缓存文件是否存在，命中时更新其使用时间
+
+        Args:
+            path (str): 缓存文件路径
+
+        Returns:
+            bool: 是否命中
+        """
+        try:
+            os.utime(path)
+            return True
+        except OSError:
+            return False
+
+    def store(self, path, data):
+        """
+        原子地写入一个缓存文件
+
+        Args:
+            path (str): 缓存文件路径
+            data (bytes): 文件内容
+        """
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.debug(f"无法写入缓存 {path}: {e}")
+            return
+        self.stored(len(data))
+
+    def stored(self, size):
+        """
+        记录新写入的缓存大小，超出上限时按最近使用时间淘汰
+
+        Args:
+            size (int): 新写入的字节数
+        """
+        with self.lock:
+            self.size += size
+            if self.size <= self.max_size:
+                return
+            entries = []
+            for dirpath, _, files in os.walk(self.root):
+                for name in files:
+                    path = os.path.join(dirpath, name)
+                    if name.endswith('.tmp'):
+                        continue
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, path, stat.st_size))
+            self.size = sum(size for _, _, size in entries)
+            for _, path, size in sorted(entries):
+                if self.size <= self.max_size:
+                    break
+                logger.debug(f"🧹 淘汰缓存: {path}")
+                try:
+                    os.remove(path)
+                    self.size -= size
+                except OSError:
+                    pass
+
+
+class ProxyRequestHandler(BaseHTTPRequestHandler):
+    """将 smart-HTTP 拉取与压缩包下载转发到镜像源的请求处理器"""
+
+    server_version = 'fgit-serve'
+
+    @property
+    def proxy(self):
+        return self.server.proxy
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        match = INFO_REFS_RE.match(path) or ARCHIVE_RE.match(path)
+        if match and _slug(match) is None:
+            self.send_error(400, 'Invalid repository path')
+            return
+        if match := INFO_REFS_RE.match(path):
+            service = parse_qs(urlsplit(self.path).query).get('service', [None])[0]
+            if service != 'git-upload-pack':
+                # 推送不经过镜像源, 应通过 pushInsteadOf 直接推送到 GitHub
+                self.send_error(403, 'fgit serve only supports fetching')
+                return
+            self.handle_info_refs(_slug(match))
+        elif match := ARCHIVE_RE.match(path):
+            self.handle_archive(_slug(match), match['ref'], match['format'])
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        if (match := UPLOAD_PACK_RE.match(path)) and _slug(match) is None:
+            self.send_error(400, 'Invalid repository path')
+        elif match:
+            self.handle_upload_pack(_slug(match))
+        else:
+            self.send_error(403, 'fgit serve only supports fetching')
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def handle_info_refs(self, slug):
+        """
+        转发引用发现请求
+
+        总是先请求镜像源以保证引用最新，成功的响应同时写入缓存，所有镜像源都失败时才使用缓存（离线可用）。
+        """
+        headers = {'Accept-Encoding': 'identity'}
+        if protocol := self.headers.get('Git-Protocol'):
+            headers['Git-Protocol'] = protocol
+        cache_path = self.proxy.cache_path('refs', *slug.split('/'),
+                                           hashlib.sha256((protocol or '').encode()).hexdigest())
+        for mirror in self.proxy.ordered(slug):
+            url = convert_url(f'https://github.com/{slug}.git', mirror) + '/info/refs?service=git-upload-pack'
+            try:
+                response = get_client().get(url, headers=headers, retry=False)
+                body = response.content
+            except Exception as e:
+                logger.debug(f"镜像源 {mirror} 请求失败: {e}")
+                self.proxy.health.record(mirror, False, error=type(e).__name__)
+                continue
+            if response.status_code != 200 or \
+                    not body.startswith((GIT_ADVERTISEMENT_PREFIX, GIT_V2_ADVERTISEMENT_PREFIX)):
+                self.proxy.health.record(mirror, False, error=f'http-{response.status_code}')
+                continue
+            self.proxy.health.record(mirror, True)
+            self.proxy.remember(slug, mirror)
+            self.proxy.store(cache_path, body)
+            logger.info(Fore.GREEN + f"🔗 {slug} 引用发现 ← {mirror}" + Style.RESET_ALL)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-git-upload-pack-advertisement')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_fallback(slug, cache_path, 'application/x-git-upload-pack-advertisement')
+
+    def handle_upload_pack(self, slug):
+        """
+        转发 upload-pack 请求
+
+        包含 done 的最终请求会返回包数据，其内容完全由请求中的 want/have 决定，
+        因此以请求内容为键缓存响应并优先使用缓存；ls-refs 与协商中的请求总是先转发，
+        响应同样按请求内容缓存，只在所有镜像源都失败时使用。
+        """
+        body = self.read_body()
+        headers = {'Content-Type': 'application/x-git-upload-pack-request', 'Accept-Encoding': 'identity'}
+        for name in ('Git-Protocol', 'Content-Encoding'):
+            if value := self.headers.get(name):
+                headers[name] = value
+
+        key = hashlib.sha256(f"{slug}\0{headers.get('Git-Protocol', '')}\0".encode() + body).hexdigest()
+        cache_path = self.proxy.cache_path('packs', key[:2], key)
+        if _is_final_request(body, headers.get('Content-Encoding')) and self.proxy.lookup(cache_path):
+            logger.info(Fore.GREEN + f"📦 {slug} 命中包缓存" + Style.RESET_ALL)
+            self.send_file(cache_path, 'application/x-git-upload-pack-result')
+            return
+
+        for mirror in self.proxy.ordered(slug):
+            url = convert_url(f'https://github.com/{slug}.git', mirror) + '/git-upload-pack'
+            try:
+                response = get_client().post(url, data=body, headers=headers, stream=True, retry=False)
+            except Exception as e:
+                logger.debug(f"镜像源 {mirror} 请求失败: {e}")
+                self.proxy.health.record(mirror, False, error=type(e).__name__)
+                continue
+            if (response.status_code != 200 or
+                    response.headers.get('Content-Type') != 'application/x-git-upload-pack-result'):
+                response.close()
+                self.proxy.health.record(mirror, False, error=f'http-{response.status_code}')
+                continue
+            logger.info(Fore.GREEN + f"📦 {slug} 拉取 ← {mirror}" + Style.RESET_ALL)
+            self.relay(response, mirror, 'application/x-git-upload-pack-result', cache_path)
+            return
+        self.send_fallback(slug, cache_path, 'application/x-git-upload-pack-result')
+
+    def send_fallback(self, slug, cache_path, content_type):
+        """所有镜像源都失败时发送缓存的响应，没有缓存时返回 502"""
+        if self.proxy.lookup(cache_path):
+            logger.warning(Fore.YELLOW + f"🔌 {slug}: 所有镜像源都不可用, 使用缓存的响应" + Style.RESET_ALL)
+            self.send_file(cache_path, content_type)
+            return
+        self.send_error(502, 'All mirrors failed')
+
+    def handle_archive(self, slug, ref, archive_format):
+        """
+        转发压缩包下载，按引用解析出的提交缓存
+
+        Args:
+            slug (str): owner/repo
+            ref (str): 分支、标签、完整引用名或提交
+            archive_format (str): zip 或 tar.gz
+        """
+        content_type = 'application/zip' if archive_format == 'zip' else 'application/x-gzip'
+        cache_path = None
+        if commit := self.resolve_ref(slug, ref):
+            cache_path = self.proxy.cache_path('archives', *slug.split('/'), f'{commit}.{archive_format}')
+            if self.proxy.lookup(cache_path):
+                logger.info(Fore.GREEN + f"📦 {slug} {ref} 命中压缩包缓存 ({commit[:12]})" + Style.RESET_ALL)
+                self.send_file(cache_path, content_type)
+                return
+
+        expect = ZIP_PREFIX if archive_format == 'zip' else TAR_GZ_PREFIX
+        for mirror in self.proxy.ordered(slug):
+            url = convert_url(f'https://github.com/{slug}/archive/{ref}.{archive_format}', mirror)
+            try:
+                response = get_client().get(url, headers={'Accept-Encoding': 'identity'}, stream=True, retry=False)
+                first = next(response.raw.stream(RELAY_CHUNK, decode_content=False), b'') \
+                    if response.status_code == 200 else b''
+            except Exception as e:
+                logger.debug(f"镜像源 {mirror} 请求失败: {e}")
+                self.proxy.health.record(mirror, False, error=type(e).__name__)
+                continue
+            if not first.startswith(expect):
+                response.close()
+                self.proxy.health.record(mirror, False, error=f'http-{response.status_code}')
+                continue
+            logger.info(Fore.GREEN + f"📦 {slug} {ref}.{archive_format} ← {mirror}" + Style.RESET_ALL)
+            self.relay(response, mirror, content_type, cache_path, first)
+            return
+        self.send_error(502, 'All mirrors failed')
+
+    def resolve_ref(self, slug, ref):
+        """
+        通过引用发现将分支或标签解析为提交
+
+        Args:
+            slug (str): owner/repo
+            ref (str): 分支、标签、完整引用名或提交
+
+        Returns:
+            str or None: 提交SHA，无法解析时返回None
+        """
+        if re.fullmatch(r'[0-9a-f]{40}', ref):
+            return ref
+        candidates = [ref, f'refs/heads/{ref}', f'refs/tags/{ref}']
+        for mirror in self.proxy.ordered(slug):
+            url = convert_url(f'https://github.com/{slug}.git', mirror) + '/info/refs?service=git-upload-pack'
+            try:
+                response = get_client().get(url, retry=False)
+            except Exception:
+                continue
+            if response.status_code != 200 or not response.content.startswith(GIT_ADVERTISEMENT_PREFIX):
+                continue
+            refs = parse_advertisement(response.content)
+            for name in candidates:
+                # 附注标签使用其指向的提交
+                if commit := refs.get(name + '^{}') or refs.get(name):
+                    return commit
+            return None
+        return None
+
+    def read_body(self):
+        """读取请求体，支持分块传输编码"""
+        if self.headers.get('Transfer-Encoding', '').lower() != 'chunked':
+            return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = b''
+        while True:
+            size = int(self.rfile.readline().split(b';')[0], 16)
+            if size == 0:
+                while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                    pass
+                return body
+            body += self.rfile.read(size)
+            self.rfile.readline()
+
+    def send_file(self, path, content_type):
+        """将缓存文件作为响应发送"""
+        with open(path, 'rb') as f:
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+            self.end_headers()
+            while data := f.read(RELAY_CHUNK):
+                self.wfile.write(data)
+
+    def relay(self, response, mirror, content_type, cache_path=None, first=b''):
+        """
+        将上游响应转发给客户端，同时写入缓存，完整读取后才会生效
+
+        Args:
+            response (requests.Response): 上游响应
+            mirror (str): 镜像源名称
+            content_type (str): 响应类型
+            cache_path (str): 缓存文件路径，None 表示不缓存
+            first (bytes): 已从响应中读取的数据
+        """
+        tmp_path = f'{cache_path}.{threading.get_ident()}.tmp' if cache_path else None
+        if tmp_path:
+            os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
+        out = open(tmp_path, 'wb') if tmp_path else None
+        size = 0
+        start = time.monotonic()
+        complete = False
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Cache-Control', 'no-cache')
+        if length := response.headers.get('Content-Length'):
+            self.send_header('Content-Length', length)
+        self.end_headers()
+        try:
+            with response:
+                chunks = response.raw.stream(RELAY_CHUNK, decode_content=False)
+                for data in _prepend(first, chunks):
+                    self.wfile.write(data)
+                    if out:
+                        out.write(data)
+                    size += len(data)
+            complete = True
+        except Exception as e:
+            logger.warning(Fore.YELLOW + f"🧐 转发中断 ({mirror}): {e}" + Style.RESET_ALL)
+        finally:
+            if out:
+                out.close()
+                if complete:
+                    os.replace(tmp_path, cache_path)
+                    self.proxy.stored(size)
+                else:
+                    os.remove(tmp_path)
+        self.proxy.health.record(mirror, complete, size, time.monotonic() - start, error='relay')
+
+
+def _prepend(first, chunks):
+    """在数据块迭代器前加上已读取的数据"""
+    if first:
+        yield first
+    yield from chunks
+
+
+def _slug(match):
+    """
+    从路由匹配结果中获取 owner/repo
+
+    Returns:
+        str or None: owner/repo，包含 . 或 .. 路径片段（会指向缓存目录之外）时返回None
+    """
+    if match['owner'] in ('.', '..') or match['repo'] in ('.', '..'):
+        return None
+    return f"{match['owner']}/{match['repo']}"
+
+
+def _is_final_request(body, content_encoding=None):
+    """
+    判断 upload-pack 请求是否为返回包数据的最终请求
+
+    Args:
+        body (bytes): 请求体
+        content_encoding (str): 请求体编码
+
+    Returns:
+        bool: 协议 v0 或 v2 fetch 命令中包含 done 时返回True
+    """
+    try:
+        data = gzip.decompress(body) if content_encoding == 'gzip' else body
+    except (OSError, EOFError):
+        return False
+    if b'command=' in data and b'command=fetch' not in data:
+        return False
+    return b'0009done\n' in data
+
+
+def parse_advertisement(data):
+    """
+    解析协议 v0 引用发现响应中的引用
+
+    Args:
+        data (bytes): info/refs 响应
+
+    Returns:
+        dict: 引用名到提交SHA的映射
+    """
+    refs = {}
+    pos = 0
+    while pos + 4 <= len(data):
+        try:
+            length = int(data[pos:pos + 4], 16)
+        except ValueError:
+            break
+        if length < 4:
+            pos += 4
+            continue
+        line = data[pos + 4:pos + length].rstrip(b'\n').split(b'\0')[0].decode('utf-8', 'replace')
+        pos += length
+        sha, _, name = line.partition(' ')
+        if re.fullmatch(r'[0-9a-f]{40}', sha):
+            refs[name] = sha
+    return refs
+
+
+def serve(config, listen=None, verbose=False):
+    """
+    启动本地 smart-HTTP 缓存代理，直到被中断
+
+    Args:
+        config (ConfigHandler): 配置处理器实例
+        listen (str): 监听地址，格式为 [host:]port，默认读取 [serve] 配置
+        verbose (bool): 是否显示详细信息
+    """
+    listen = listen or config.get_serve_config().get('listen', '127.0.0.1:7080')
+    host, _, port = listen.rpartition(':')
+    proxy = MirrorProxy.from_config(config, verbose)
+    server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), ProxyRequestHandler)
+    server.daemon_threads = True
+    server.proxy = proxy
+    threading.Thread(target=proxy.refresh_loop, daemon=True).start()
+
+    address = f"http://{host or '127.0.0.1'}:{port}/"
+    logger.info(Fore.GREEN + f"🚀 fgit serve 已启动: {address}" + Style.RESET_ALL)
+    logger.info(Fore.CYAN + f"📖 git config --global url.\"{address}\".insteadOf https://github.com/" + Style.RESET_ALL)
+    logger.info(Fore.CYAN + "📖 git config --global url.\"https://github.com/\".pushInsteadOf https://github.com/"
+                + Style.RESET_ALL)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
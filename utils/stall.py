@@ -0,0 +1,237 @@
+import os
+import re
+import sys
+import time
+import threading
+import subprocess
+from collections import deque
+from loguru import logger
+
+# git --progress 输出的进度行，如 "Receiving objects:  45% (450/1000), 1.20 MiB | 300.00 KiB/s"
+PROGRESS_RE = re.compile(r'^(?:remote: )?(?P<phase>[A-Za-z][A-Za-z ]*?):\s+\d+% \(\d+/\d+\)'
+                         r'(?:,\s*(?P<amount>[\d.]+) (?P<unit>bytes|KiB|MiB|GiB))?')
+# 没有百分比的进度行，如 "remote: Enumerating objects: 5, done." 与 "remote: Total 3 (delta 0), reused 0"
+COUNT_RE = re.compile(r'^(?:remote: )?(?:[A-Za-z][A-Za-z ]*?: \d+(?:, done)?\.?\s*$|Total \d+ \(delta \d+\))')
+LINE_END_RE = re.compile(rb'\r\n?|\n')
+UNITS = {'bytes': 1, 'KiB': 1024, 'MiB': 1024 ** 2, 'GiB': 1024 ** 3}
+# 通过网络传输对象的阶段，小规模 fetch 时 git 使用 unpack-objects 边接收边解包
+TRANSFER_PHASES = {'Receiving objects', 'Unpacking objects', 'Writing objects'}
+QUIET_FILTERED = {'clone', 'fetch'}
+
+_settings = {}
+
+
+class StallPolicy:
+    """传输停滞判定：在时间窗口内的平均速度低于下限时视为停滞"""
+
+    def __init__(self, min_speed=10 * 1024, window=30, grace=15):
+        """
+        初始化停滞判定
+
+        Args:
+            min_speed (float): 最低平均速度（字节/秒）
+            window (float): 计算平均速度的时间窗口（秒）
+            grace (float): 开始传输前允许没有任何输出的额外时间（秒），用于建立连接与服务端打包
+        """
+        self.min_speed = min_speed
+        self.window = window
+        self.grace = grace
+
+    def check(self, monitor, now=None, prompt=False):
+        """
+        判断传输是否停滞
+
+        Args:
+            monitor (TransferMonitor): 传输进度
+            now (float): 当前时间，默认为 time.monotonic()
+            prompt (bool): git 是否可能在终端上等待输入（凭据、主机密钥确认），
+                此时在出现第一个进度行之前不判定停滞
+
+        Returns:
+            str or None: 停滞原因，未停滞时返回None
+        """
+        now = now or time.monotonic()
+        with monitor.lock:
+            if monitor.state == 'waiting' and not prompt:
+                if now - monitor.last_output >= self.grace + self.window:
+                    return f"{now - monitor.last_output:.0f}s 内没有任何进度"
+            elif monitor.state == 'transfer' and now - monitor.transfer_start >= self.window:
+                # 窗口起点之前的最后一个采样
+                base = next((s for s in reversed(monitor.samples) if s[0] <= now - self.window), monitor.samples[0])
+                speed = (monitor.samples[-1][1] - base[1]) / max(now - base[0], 1e-3)
+                if speed < self.min_speed:
+                    return f"{speed / 1024:.1f}KB/s 低于 {self.min_speed / 1024:.1f}KB/s"
+        return None
+
+
+class TransferMonitor:
+    """根据 git --progress 输出跟踪传输阶段与已传输的字节数"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = 'waiting'
+        self.phase = None
+        self.last_output = time.monotonic()
+        self.transfer_start = None
+        self.samples = deque(maxlen=600)
+
+    def feed(self, line):
+        """
+        处理一行输出
+
+        Args:
+            line (str): 去掉行尾的输出行
+
+        Returns:
+            bool: 是否为进度行
+        """
+        now = time.monotonic()
+        match = PROGRESS_RE.match(line)
+        with self.lock:
+            self.last_output = now
+            if not match:
+                return bool(COUNT_RE.match(line))
+            phase = match['phase']
+            if phase in TRANSFER_PHASES:
+                amount = float(match['amount']) * UNITS[match['unit']] if match['amount'] else 0
+                # 新的传输阶段（如 clone 之后单独拉取标签）重新计算
+                if self.state != 'transfer' or phase != self.phase or (self.samples and amount < self.samples[-1][1]):
+                    self.state = 'transfer'
+                    self.transfer_start = now
+                    self.samples.clear()
+                self.samples.append((now, amount))
+            elif self.state == 'transfer' and not line.startswith('remote: '):
+                # 传输结束后的解析增量、检出文件等本地阶段不做判定
+                self.state = 'local'
+            self.phase = phase
+            return True
+
+
+def configure(config):
+    """
+    读取 [stall] 配置
+
+    Args:
+        config (ConfigHandler): 配置处理器实例
+    """
+    _settings.clear()
+    _settings.update(config.get_stall_config())
+
+
+def policy(command):
+    """
+    获取命令的停滞判定，<命令>.<选项> 形式的配置项优先于通用配置项
+
+    Args:
+        command (str): git 命令，如 clone、fetch
+
+    Returns:
+        StallPolicy or None: 未启用时返回None
+    """
+    def get(key, default):
+        return _settings.get(f'{command}.{key}', _settings.get(key, default))
+
+    if str(get('enabled', 'true')).lower() != 'true':
+        return None
+    return StallPolicy(min_speed=float(get('min_speed', 10)) * 1024, window=float(get('window', 30)),
+                       grace=float(get('grace', 15)))
+
+
+def run(cmd, command, stall_policy=None, env=None, cwd=None, capture=False):
+    """
+    执行 git 命令并监控传输进度，停滞时终止
+
+    在子命令后添加 --progress 以获得进度输出；进度行只在终端上显示，其余输出照常显示或捕获，
+    clone/fetch 指定了 -q 时只显示错误与警告。git 可能在终端上提示输入时，只在开始传输后判定停滞。
+
+    Args:
+        cmd (list): git 命令
+        command (str): cmd 中的 git 子命令，--progress 添加在其后（submodule 时添加在 update 之后）
+        stall_policy (StallPolicy): 停滞判定，None 表示不监控
+        env (dict): 环境变量
+        cwd (str): 工作目录
+        capture (bool): 是否捕获输出（并发执行时避免输出交错）
+
+    Returns:
+        subprocess.CompletedProcess: 执行结果，stderr 为捕获的非进度输出；
+            stalled 属性为停滞原因，未停滞时为None
+    """
+    index = cmd.index(command) + 1
+    if command == 'submodule':
+        # git submodule update --progress
+        index += 1
+    # clone/fetch 的 -q 会同时关闭进度输出, 改为由这里过滤; 这两个命令的标准输出本来就为空
+    quiet = command in QUIET_FILTERED and any(arg in ('-q', '--quiet') for arg in cmd[index:])
+    if quiet:
+        cmd = cmd[:index] + [arg for arg in cmd[index:] if arg not in ('-q', '--quiet')]
+    cmd = cmd[:index] + ['--progress'] + cmd[index:]
+    proc = subprocess.Popen(cmd, env=env, cwd=cwd, stdout=subprocess.DEVNULL if capture else None,
+                            stderr=subprocess.PIPE)
+    monitor = TransferMonitor()
+    output = []
+    echo = 'none' if quiet else 'all' if not capture and sys.stderr.isatty() else 'messages'
+    reader = threading.Thread(target=_read, args=(proc.stderr, monitor, output, capture, echo), daemon=True)
+    reader.start()
+    # 标准输入是终端时 git 可能在等待用户输入凭据或确认主机密钥, 没有进度不代表停滞
+    prompt = sys.stdin is not None and sys.stdin.isatty() and \
+        (os.environ if env is None else env).get('GIT_TERMINAL_PROMPT') != '0'
+
+    reason = None
+    while True:
+        try:
+            proc.wait(timeout=1)
+            break
+        except subprocess.TimeoutExpired:
+            if stall_policy is not None and (reason := stall_policy.check(monitor, prompt=prompt)):
+                logger.debug(f"传输停滞, 终止 git: {reason}")
+                _terminate(proc)
+                break
+    reader.join()
+    result = subprocess.CompletedProcess(cmd, proc.returncode, None, ''.join(output) if capture else None)
+    result.stalled = reason
+    return result
+
+
+def _read(stream, monitor, output, capture, echo):
+    """逐行读取 git 的错误输出，进度行以 \\r 结尾"""
+    buffer = b''
+    after_cr = False
+    while data := stream.read1(65536):
+        if after_cr and data.startswith(b'\n'):
+            # \r\n 被拆在两段数据中
+            data = data[1:]
+        buffer += data
+        while match := LINE_END_RE.search(buffer):
+            _emit(buffer[:match.end()].decode('utf-8', errors='replace'), monitor, output, capture, echo)
+            buffer = buffer[match.end():]
+        after_cr = not buffer and data.endswith(b'\r')
+    if buffer:
+        _emit(buffer.decode('utf-8', errors='replace'), monitor, output, capture, echo)
+    stream.close()
+
+
+def _emit(text, monitor, output, capture, echo):
+    """
+    处理一行输出
+
+    echo 为 all 时显示所有输出，messages 时不显示进度行，none 时只显示错误与警告（对应 clone/fetch 的 -q）
+    """
+    is_progress = monitor.feed(text.rstrip('\r\n'))
+    if echo == 'messages' and is_progress or \
+            echo == 'none' and not text.startswith(('fatal:', 'error:', 'warning:')):
+        return
+    if capture:
+        output.append(text)
+    else:
+        sys.stderr.write(text)
+        sys.stderr.flush()
+
+
+def _terminate(proc):
+    """终止 git 进程，git 会在收到信号时清理未完成的临时文件"""
+    proc.terminate()
+    try:
+        proc.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
@@ -0,0 +1,368 @@
+import os
+import json
+import math
+import time
+import threading
+from contextlib import contextmanager
+from loguru import logger
+from utils.lock import FileLock
+
+# 各线程当前的操作记录，未设置时使用进程的顶层操作
+_local = threading.local()
+_root = None
+_settings = {'enabled': True, 'path': os.path.expanduser('~/.fgit/telemetry.jsonl'),
+             'max_size': 5 * 1024 * 1024, 'backups': 3, 'prometheus': None}
+# Prometheus 导出中分位数按每个阶段/镜像源最近的若干个值计算
+RECENT_VALUES = 200
+
+
+class Operation:
+    """一次 fgit 操作的计时记录：各阶段耗时与每次镜像源尝试的结果"""
+
+    def __init__(self, command, **fields):
+        """
+        初始化操作记录
+
+        Args:
+            command (str): 命令名称
+            **fields: 附加字段，如 repo
+        """
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
+        self.data = {'time': time.time(), 'command': command, **fields, 'phases': {}, 'attempts': []}
+
+    def add_phase(self, name, seconds):
+        """累加阶段耗时"""
+        with self.lock:
+            self.data['phases'][name] = self.data['phases'].get(name, 0) + seconds
+
+    def add_attempt(self, mirror, success, size=0, seconds=0, error=None):
+        """记录一次镜像源尝试"""
+        with self.lock:
+            self.data['attempts'].append({'mirror': mirror, 'success': success, 'bytes': size,
+                                          'seconds': round(seconds, 4), 'error': None if success else error})
+
+    def set(self, **fields):
+        """设置附加字段，如 exit_code"""
+        with self.lock:
+            self.data.update(fields)
+
+    def finish(self):
+        """
+        汇总操作结果
+
+        Returns:
+            dict: 完整的记录
+        """
+        with self.lock:
+            data = self.data
+            attempts = data['attempts']
+            served = [a for a in attempts if a['success']]
+            data['duration'] = round(time.monotonic() - self.start, 4)
+            data['phases'] = {name: round(seconds, 4) for name, seconds in data['phases'].items()}
+            data['mirror'] = served[-1]['mirror'] if served else None
+            data['bytes'] = sum(a['bytes'] for a in served)
+            seconds = sum(a['seconds'] for a in served)
+            data['throughput'] = round(data['bytes'] / seconds, 1) if data['bytes'] and seconds else None
+            data['retries'] = len(attempts) - len(served)
+            if 'exit_code' not in data and attempts:
+                data['exit_code'] = 0 if attempts[-1]['success'] else 1
+            return data
+
+
+def configure(config):
+    """
+    读取 [telemetry] 配置
+
+    Args:
+        config (ConfigHandler): 配置处理器实例
+    """
+    telemetry_config = config.get_telemetry_config()
+    _settings['enabled'] = telemetry_config.get('enabled', 'true').lower() == 'true'
+    _settings['path'] = os.path.expanduser(telemetry_config.get('path', '~/.fgit/telemetry.jsonl'))
+    _settings['max_size'] = int(float(telemetry_config.get('max_size', 5)) * 1024 * 1024)
+    _settings['backups'] = int(telemetry_config.get('backups', 3))
+    _settings['prometheus'] = os.path.expanduser(telemetry_config['prometheus']) \
+        if telemetry_config.get('prometheus') else None
+
+
+def current():
+    """
+    获取当前线程的操作记录
+
+    Returns:
+        Operation or None: 没有进行中的操作时返回None
+    """
+    return getattr(_local, 'operation', None) or _root
+
+
+@contextmanager
+def operation(command, **fields):
+    """
+    记录一次操作，结束时写入记录文件
+
+    进程中的第一个操作作为顶层操作，其他线程中的阶段与尝试都会记入其中；
+    在工作线程中开始的操作（如批量处理中的单个仓库）只记录本线程的数据。
+
+    Args:
+        command (str): 命令名称
+        **fields: 附加字段
+
+    Yields:
+        Operation: 操作记录
+    """
+    global _root
+    op = Operation(command, **fields)
+    is_root = _root is None
+    if is_root:
+        _root = op
+    else:
+        previous, _local.operation = getattr(_local, 'operation', None), op
+    try:
+        yield op
+    finally:
+        if is_root:
+            _root = None
+        else:
+            _local.operation = previous
+        if _settings['enabled']:
+            save(op.finish())
+
+
+@contextmanager
+def phase(name):
+    """
+    统计一个阶段的耗时，没有进行中的操作时不做记录
+
+    Args:
+        name (str): 阶段名称
+    """
+    op = current()
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        if op is not None:
+            op.add_phase(name, time.monotonic() - start)
+
+
+def attempt(mirror, success, size=0, seconds=0, error=None):
+    """
+    记录一次镜像源尝试，没有进行中的操作时不做记录
+
+    Args:
+        mirror (str): 镜像源名称
+        success (bool): 是否成功
+        size (int): 传输的字节数
+        seconds (float): 耗时（秒）
+        error (str): 失败原因分类
+    """
+    if (op := current()) is not None:
+        op.add_attempt(mirror, success, size, seconds, error)
+
+
+def save(record):
+    """
+    追加一条记录，文件超过大小上限时轮转
+
+    Args:
+        record (dict): 操作记录
+    """
+    path = _settings['path']
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with FileLock(path + '.lock'):
+            if os.path.exists(path) and os.path.getsize(path) >= _settings['max_size']:
+                for i in range(_settings['backups'] - 1, 0, -1):
+                    if os.path.exists(f'{path}.{i}'):
+                        os.replace(f'{path}.{i}', f'{path}.{i + 1}')
+                if _settings['backups'] > 0:
+                    os.replace(path, f'{path}.1')
+                else:
+                    os.remove(path)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            if _settings['prometheus']:
+                export_prometheus(_settings['prometheus'], _update_aggregates(path + '.prom.json', record))
+    except OSError as e:
+        logger.debug(f"无法写入性能记录: {e}")
+
+
+def load(since=None):
+    """
+    读取所有保留的记录
+
+    Args:
+        since (float): 只返回该时间戳之后的记录
+
+    Returns:
+        list: 记录列表，按时间排序
+    """
+    path = _settings['path']
+    records = []
+    for file_path in [f'{path}.{i}' for i in range(_settings['backups'], 0, -1)] + [path]:
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if since is None or record.get('time', 0) >= since:
+                    records.append(record)
+    return records
+
+
+def percentile(values, p):
+    """
+    计算百分位数（最近秩法）
+
+    Args:
+        values (list): 数值列表
+        p (float): 百分位，0-100
+
+    Returns:
+        float or None: 百分位数，列表为空时返回None
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(1, min(len(values), math.ceil(len(values) * p / 100))) - 1]
+
+
+def summarize(records):
+    """
+    按阶段、镜像源与命令汇总记录
+
+    Args:
+        records (list): 记录列表
+
+    Returns:
+        dict: {'phases': {阶段: [耗时, ...]},
+               'mirrors': {镜像源: {'success': 成功次数, 'failure': 失败次数, 'bytes': 字节数,
+                                    'seconds': [耗时, ...], 'throughput': [吞吐量, ...]}},
+               'commands': {(命令, 结果): 次数}}
+    """
+    phases = {}
+    mirrors = {}
+    commands = {}
+    for record in records:
+        for name, seconds in record.get('phases', {}).items():
+            phases.setdefault(name, []).append(seconds)
+        phases.setdefault('total', []).append(record.get('duration', 0))
+        for item in record.get('attempts', []):
+            entry = mirrors.setdefault(item['mirror'], {'success': 0, 'failure': 0, 'bytes': 0,
+                                                        'seconds': [], 'throughput': []})
+            entry['seconds'].append(item['seconds'])
+            if item['success']:
+                entry['success'] += 1
+                entry['bytes'] += item['bytes']
+                if item['bytes'] and item['seconds']:
+                    entry['throughput'].append(item['bytes'] / item['seconds'])
+            else:
+                entry['failure'] += 1
+        code = record.get('exit_code')
+        result = 'unknown' if code is None else 'success' if code == 0 else 'failure'
+        commands[(record['command'], result)] = commands.get((record['command'], result), 0) + 1
+    return {'phases': phases, 'mirrors': mirrors, 'commands': commands}
+
+
+def _update_aggregates(state_path, record):
+    """
+    将一条记录累加到导出用的汇总状态文件中，避免每次导出都重新读取全部记录
+
+    状态文件不存在或损坏时，从保留的记录（已包含本条记录）重新生成。调用方需持有记录文件的锁。
+
+    Args:
+        state_path (str): 状态文件路径
+        record (dict): 新的操作记录
+
+    Returns:
+        dict: {'commands': {命令: {结果: 次数}},
+               'phases': {阶段: {'sum': 总耗时, 'count': 次数, 'recent': [最近的耗时, ...]}},
+               'mirrors': {镜像源: {'success': 成功次数, 'failure': 失败次数, 'bytes': 字节数,
+                                    'throughput': [最近的吞吐量, ...]}}}
+    """
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        records = [record]
+    except (OSError, ValueError):
+        state = {'commands': {}, 'phases': {}, 'mirrors': {}}
+        records = load()
+
+    for item in records:
+        code = item.get('exit_code')
+        result = 'unknown' if code is None else 'success' if code == 0 else 'failure'
+        results = state['commands'].setdefault(item['command'], {})
+        results[result] = results.get(result, 0) + 1
+        for name, seconds in [*item.get('phases', {}).items(), ('total', item.get('duration', 0))]:
+            entry = state['phases'].setdefault(name, {'sum': 0, 'count': 0, 'recent': []})
+            entry['sum'] += seconds
+            entry['count'] += 1
+            entry['recent'] = (entry['recent'] + [seconds])[-RECENT_VALUES:]
+        for attempt_item in item.get('attempts', []):
+            entry = state['mirrors'].setdefault(attempt_item['mirror'], {'success': 0, 'failure': 0, 'bytes': 0,
+                                                                         'throughput': []})
+            if attempt_item['success']:
+                entry['success'] += 1
+                entry['bytes'] += attempt_item['bytes']
+                if attempt_item['bytes'] and attempt_item['seconds']:
+                    throughput = attempt_item['bytes'] / attempt_item['seconds']
+                    entry['throughput'] = (entry['throughput'] + [throughput])[-RECENT_VALUES:]
+            else:
+                entry['failure'] += 1
+
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, state_path)
+    return state
+
+
+def export_prometheus(path, state):
+    """
+    将汇总状态写入 Prometheus textfile，供 node exporter 读取
+
+    计数与耗时总和从开始记录起累计，分位数与吞吐量中位数按最近的 RECENT_VALUES 个值计算。
+
+    Args:
+        path (str): 输出文件路径，通常以 .prom 结尾
+        state (dict): _update_aggregates 返回的汇总状态
+    """
+    lines = ['# HELP fgit_operations Operations recorded by fgit.', '# TYPE fgit_operations counter']
+    for command, results in sorted(state['commands'].items()):
+        for result, count in sorted(results.items()):
+            lines.append(f'fgit_operations{{command="{command}",result="{result}"}} {count}')
+
+    lines += ['# HELP fgit_phase_duration_seconds Phase durations of fgit operations.',
+              '# TYPE fgit_phase_duration_seconds summary']
+    for name, entry in sorted(state['phases'].items()):
+        for quantile in (0.5, 0.95):
+            lines.append(f'fgit_phase_duration_seconds{{phase="{name}",quantile="{quantile}"}} '
+                         f'{percentile(entry["recent"], quantile * 100)}')
+        lines.append(f'fgit_phase_duration_seconds_sum{{phase="{name}"}} {round(entry["sum"], 4)}')
+        lines.append(f'fgit_phase_duration_seconds_count{{phase="{name}"}} {entry["count"]}')
+
+    lines += ['# HELP fgit_mirror_attempts Mirror attempts recorded by fgit.',
+              '# TYPE fgit_mirror_attempts counter']
+    for mirror, entry in sorted(state['mirrors'].items()):
+        lines.append(f'fgit_mirror_attempts{{mirror="{mirror}",result="success"}} {entry["success"]}')
+        lines.append(f'fgit_mirror_attempts{{mirror="{mirror}",result="failure"}} {entry["failure"]}')
+    lines += ['# HELP fgit_mirror_bytes Bytes served by each mirror.',
+              '# TYPE fgit_mirror_bytes counter']
+    for mirror, entry in sorted(state['mirrors'].items()):
+        lines.append(f'fgit_mirror_bytes{{mirror="{mirror}"}} {entry["bytes"]}')
+    lines += ['# HELP fgit_mirror_throughput_bytes_per_second Median throughput of each mirror.',
+              '# TYPE fgit_mirror_throughput_bytes_per_second gauge']
+    for mirror, entry in sorted(state['mirrors'].items()):
+        if entry['throughput']:
+            lines.append(f'fgit_mirror_throughput_bytes_per_second{{mirror="{mirror}"}} '
+                         f'{percentile(entry["throughput"], 50):.1f}')
+
+    # node exporter 可能随时读取, 先写临时文件再替换
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp_path, path)